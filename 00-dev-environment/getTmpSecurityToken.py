@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 
 import sys 
-import boto3
 from utils.pyColors import MinStyle
+from utils.awsClientPool import clientPool
 
 st_profile='st_jh_labs'
 mfa_token=sys.argv[1]
@@ -10,8 +10,7 @@ mfa_arn='arn:aws:iam::324320755747:mfa/john.hunter.labs'
 
 print(f'\nMFA Token: {mfa_token}\n')
 
-session = boto3.Session(profile_name=(st_profile))
-st_profile_sts_client = session.client('sts')
+st_profile_sts_client = clientPool.getClient('sts', st_profile)
 caller_identity_response = st_profile_sts_client.get_caller_identity()
 
 user_id=caller_identity_response.get("UserId")
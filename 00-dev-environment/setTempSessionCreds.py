@@ -6,6 +6,18 @@
 # Description:
 #     This takes an input MFA token and gets a temporary session token that is used to create
 #     temporary credentials for programatically accessing AWS for a limited duration
+#     The expiration of the temporary credentials is stored in the profile with them. While they are
+#     still valid for longer than --refresh_threshold_minutes, no new session token is requested
+#
+#     With --credential_process the cached credentials are printed in the credential_process format,
+#     so an aws config profile can use them without running this script again:
+#         [profile st_mfa_cached]
+#         credential_process = /path/to/setTempSessionCreds.py --credential_process
+#
+#     With --manifest, every profile listed in a yaml manifest is refreshed in one run. One session token
+#     is requested per MFA device and profile duration, each with its own MFA code, all the codes are asked
+#     for up front. Roles are assumed with them concurrently, and all the profiles are written in a single
+#     credentials file update. See tmp-creds-manifest.yaml for the format
 #
 # Usage and Arguments:
 #  - Running the script with no arguments will display the usage and arguments information
@@ -18,23 +30,30 @@
 #  - Refactor more of the code to be functions
 
 
-import argparse, boto3, botocore.exceptions, configparser, os, sys
+import argparse, configparser, json, os, sys
 
 # appending the path so that packages can be imported from a parent level
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from utils.pyColors import MinStyle  # isort:skip
+from utils.credentialCache import EXPIRATION_KEY, areFresh, credentialProcessOutput, getCachedCredentials, remainingSeconds  # isort:skip
+from utils.credentialsFile import updateProfile, updateProfiles  # isort:skip
+
+# the shortest session token sts gives, enough to assume the roles of a device with no other profiles
+MIN_SESSION_SECONDS = 900
 
 
 # create the commandline parser
 my_parser = argparse.ArgumentParser(prog='setTempSessionCreds',
-                                    usage='%(prog)s [-h] mfa_token',
+                                    usage='%(prog)s [-h] [mfa_token]',
                                     description='Use your MFA Token to create temporary credentials using a session token')
 
 # adding cli arguments
 my_parser.add_argument('mfa_token',
                        metavar='mfa_token',
                        type=str,
-                       help='The MFA token used to obtain the temporary session token')
+                       nargs='?',
+                       default=None,
+                       help='The MFA token used to obtain the temporary session token. Only needed when the cached temporary credentials are missing or about to expire')
 
 my_parser.add_argument('--base_profile',
                        type=str,
@@ -66,6 +85,46 @@ my_parser.add_argument('--duration_seconds',
                        help='The duration, in seconds, that the temporary credentials should remain valid. Min=900 seconds (15 minutes), Max=129600 seconds (36 hours)'
 )
 
+my_parser.add_argument('--refresh_threshold_minutes',
+                       type=int,
+                       default=60,
+                       help='Cached temporary credentials valid for longer than this many minutes are used as they are, without requesting a new session token'
+)
+
+my_parser.add_argument('--force',
+                       help='Always request a new session token, even if the cached temporary credentials are still valid',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--credential_process',
+                       help='Print the cached temporary credentials as credential_process json, for use in an aws config profile',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--manifest',
+                       type=argparse.FileType('r'),
+                       default=None,
+                       help='A yaml manifest of profiles (base_profile, tmp_profile, mfa_arn, duration and optionally role_arn) to refresh together'
+)
+
+my_parser.add_argument('--engine',
+                       type=str,
+                       default='threads',
+                       choices=['threads', 'async'],
+                       help='How the aws calls of a single profile refresh are made. async makes them from one asyncio event loop (with aiobotocore when it is installed), so the --verbose caller identity check runs while the session token is requested. Options are one of [ threads, async ]'
+                       )
+
+my_parser.add_argument('--metrics',
+                       help='Print the number, latency, retries and throttles of the aws api calls made when the script ends',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--metrics_file',
+                       type=str,
+                       default=None,
+                       help='Write the aws api call metrics to this file when the script ends, as json for a .json file otherwise in the OpenMetrics text format'
+                       )
+
 my_parser.add_argument('-v', '--verbose',
                        help='Increases output verbosity',
                        action='store_true'
@@ -88,44 +147,252 @@ def errMessage(errMessage, attemptedAction):
     sys.exit(f'\n{MinStyle.LIGHTRED}Exiting script{MinStyle.RESET}\n')
     print()
 
+def printCallerIdentity(caller_identity_response):
+    if args.verbose:
+        print(f'{MinStyle.PINK}STS Caller Identity values{MinStyle.RESET}')
+        print(f'{MinStyle.LIGHTGREY}{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
+        print(f'{MinStyle.LIGHTCYAN}UserId: {MinStyle.WHITE}{caller_identity_response.get("UserId")}{MinStyle.RESET}')
+        print(f'{MinStyle.LIGHTCYAN}Account: {MinStyle.WHITE}{caller_identity_response.get("Account")}{MinStyle.RESET}')
+        print(f'{MinStyle.LIGHTCYAN}Arn: {MinStyle.WHITE}{caller_identity_response.get("Arn")}{MinStyle.RESET}')
+        print()
+
+def printUser(get_user_response):
+    print()
+    print(f'{MinStyle.PINK}IAM get-user Response using tmp session credentials{MinStyle.RESET}')
+    print(f'{MinStyle.LIGHTGREY}{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
+    print(f'{MinStyle.LIGHTCYAN}UserName: {MinStyle.WHITE}{get_user_response.get("User").get("UserName")}{MinStyle.RESET}')
+    print(f'{MinStyle.LIGHTCYAN}UserId: {MinStyle.WHITE}{get_user_response.get("User").get("UserId")}{MinStyle.RESET}')
+    print(f'{MinStyle.LIGHTCYAN}Arn: {MinStyle.WHITE}{get_user_response.get("User").get("Arn")}{MinStyle.RESET}')
+    print()
+
+def getUserErrorMessage(err, attemptedAction):
+    # the iam client's modeled exceptions are ClientErrors with these codes
+    err_code = err.response['Error']['Code']
+    if err_code == 'NoSuchEntity':
+        print(f'No Such Entity Exception:\n{err}')
+    elif err_code == 'ServiceFailure':
+        print(f'Service Failure Exception:\n{err}')
+    else:
+        errMessage(err, attemptedAction)
+
 def getCallerIdentity(awsProfile):
     action='AWS STS - GetCallerIdentity'
-    st_session = boto3.Session(profile_name=(awsProfile))
-    st_profile_sts_client = st_session.client('sts')
+    st_profile_sts_client = clientPool.getClient('sts', awsProfile)
     try:
-        caller_identity_response = st_profile_sts_client.get_caller_identity()
-        if args.verbose:
-            print(f'{MinStyle.PINK}STS Caller Identity values{MinStyle.RESET}')
-            print(f'{MinStyle.LIGHTGREY}{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
-            print(f'{MinStyle.LIGHTCYAN}UserId: {MinStyle.WHITE}{caller_identity_response.get("UserId")}{MinStyle.RESET}')
-            print(f'{MinStyle.LIGHTCYAN}Account: {MinStyle.WHITE}{caller_identity_response.get("Account")}{MinStyle.RESET}')
-            print(f'{MinStyle.LIGHTCYAN}Arn: {MinStyle.WHITE}{caller_identity_response.get("Arn")}{MinStyle.RESET}')
-            print()
+        printCallerIdentity(st_profile_sts_client.get_caller_identity())
     except botocore.exceptions.ClientError as err:
         errMessage(err, action)
     return
 
 def getUser(awsProfile):
     action='AWS IAM - GetUser'
-    iam_session = boto3.Session(profile_name=(awsProfile))
-    iam_client = iam_session.client('iam')
+    iam_client = clientPool.getClient('iam', awsProfile)
     try:
-        get_user_response = iam_client.get_user()
-        print()
-        print(f'{MinStyle.PINK}IAM get-user Response using tmp session credentials{MinStyle.RESET}')
-        print(f'{MinStyle.LIGHTGREY}{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
-        print(f'{MinStyle.LIGHTCYAN}UserName: {MinStyle.WHITE}{get_user_response.get("User").get("UserName")}{MinStyle.RESET}')
-        print(f'{MinStyle.LIGHTCYAN}UserId: {MinStyle.WHITE}{get_user_response.get("User").get("UserId")}{MinStyle.RESET}')
-        print(f'{MinStyle.LIGHTCYAN}Arn: {MinStyle.WHITE}{get_user_response.get("User").get("Arn")}{MinStyle.RESET}')
-        print()
-    except iam_client.exceptions.NoSuchEntityException as err:
-        print(f'No Such Entity Exception:\n{err}')
-    except iam_client.exceptions.ServiceFailureException as err:
-        print(f'Service Failure Exception:\n{err}')
+        printUser(iam_client.get_user())
+    except botocore.exceptions.ClientError as err:
+        getUserErrorMessage(err, action)
+    return
+
+async def getCallerIdentityAsync(awsEngine, awsProfile):
+    action='AWS STS - GetCallerIdentity'
+    try:
+        printCallerIdentity(await awsEngine.call('sts', awsProfile, None, 'get_caller_identity'))
     except botocore.exceptions.ClientError as err:
         errMessage(err, action)
     return
 
+async def getUserAsync(awsEngine, awsProfile):
+    action='AWS IAM - GetUser'
+    try:
+        printUser(await awsEngine.call('iam', awsProfile, None, 'get_user'))
+    except botocore.exceptions.ClientError as err:
+        getUserErrorMessage(err, action)
+    return
+
+async def getSessionTokenAsync(awsEngine, baseProfile, mfaArn, mfaToken, durationSeconds):
+    # the caller identity is only displayed, so it is checked while the session token is requested
+    identity_checks = [getCallerIdentityAsync(awsEngine, baseProfile)] if args.verbose else []
+    session_token_response, *_ = await asyncio.gather(
+        awsEngine.call('sts', baseProfile, None, 'get_session_token', DurationSeconds=durationSeconds, SerialNumber=mfaArn, TokenCode=mfaToken),
+        *identity_checks
+    )
+    return session_token_response
+
+def loadManifest(manifestFile) -> list:
+    '''
+    loadManifest reads and validates the profile entries of a batch manifest
+
+    Args:
+        manifestFile (IO[str]): The open yaml manifest
+
+    Returns:
+        list: The profile entries, with the defaults filled in
+    '''
+    import yaml
+    manifest = yaml.safe_load(manifestFile) or {}
+    entries = []
+    for entry in manifest.get('profiles', []):
+        missing_keys = [key for key in ('base_profile', 'tmp_profile', 'mfa_arn') if not entry.get(key)]
+        if missing_keys:
+            my_parser.error(f'manifest entry {entry} is missing {", ".join(missing_keys)}')
+        entry.setdefault('duration', 3600 if entry.get('role_arn') else 43200)
+        entries.append(entry)
+    if not entries:
+        my_parser.error('the manifest does not list any profiles')
+    return entries
+
+
+def getSessionToken(baseProfile: str, mfaArn: str, mfaToken: str, durationSeconds: int) -> dict:
+    sts_client = clientPool.getClient('sts', baseProfile)
+    return sts_client.get_session_token(
+        DurationSeconds=(durationSeconds),
+        SerialNumber=(mfaArn),
+        TokenCode=(mfaToken)
+    )['Credentials']
+
+
+def assumeRole(baseProfile: str, sessionCredentials: dict, roleArn: str, roleSessionName: str, durationSeconds: int) -> dict:
+    # the mfa session credentials are used to assume the role, so the role's mfa conditions are met
+    sts_client = clientPool.getClientWithCredentials('sts', sessionCredentials, baseProfile)
+    return sts_client.assume_role(
+        RoleArn=(roleArn),
+        RoleSessionName=(roleSessionName),
+        DurationSeconds=(durationSeconds)
+    )['Credentials']
+
+
+def manifestSessions(entries: list) -> dict:
+    '''
+    manifestSessions works out the session tokens a batch refresh needs. A profile without a role_arn is
+    given the session credentials themselves, so each MFA device gets a session token per distinct
+    duration of those profiles. A role is assumed for its own duration, with the longest session token of
+    its device (or a minimum length one when the device has no other profiles)
+
+    Args:
+        entries (list): The profile entries to refresh
+
+    Returns:
+        dict: The entries of each session token, as {(mfa_arn, duration): [entries]}, ordered by device
+    '''
+    sessions = {}
+    for entry in entries:
+        if not entry.get('role_arn'):
+            sessions.setdefault((entry['mfa_arn'], entry['duration']), []).append(entry)
+    for entry in entries:
+        if entry.get('role_arn'):
+            device_sessions = [session_key for session_key in sessions if session_key[0] == entry['mfa_arn']]
+            session_key = max(device_sessions, key=lambda session_key: session_key[1]) if device_sessions else (entry['mfa_arn'], MIN_SESSION_SECONDS)
+            sessions.setdefault(session_key, []).append(entry)
+    devices = list(dict.fromkeys(mfa_arn for mfa_arn, _ in sessions))
+    return dict(sorted(sessions.items(), key=lambda session: (devices.index(session[0][0]), session[0][1])))
+
+
+def collectMfaTokens(sessionKeys: list, mfaToken: str) -> dict:
+    '''
+    collectMfaTokens asks for the MFA code of every session token before any of them is requested, so the
+    requests are not held up by a prompt. A code can only be used once, so a device that needs several
+    session tokens needs a new code for each, the next one its app shows
+
+    Args:
+        sessionKeys (list): The (mfa_arn, duration) of each session token, ordered by device
+        mfaToken (str): The MFA code for the first session token, the others are prompted for
+
+    Returns:
+        dict: The MFA code of each session token
+    '''
+    session_tokens = {}
+    for mfa_arn, duration in sessionKeys:
+        device_count = sum(1 for device_arn, _ in sessionKeys if device_arn == mfa_arn)
+        used_codes = [code for (device_arn, _), code in session_tokens.items() if device_arn == mfa_arn]
+        if device_count > 1 and not used_codes:
+            print(f'{MinStyle.YELLOW}{mfa_arn} needs {device_count} MFA codes, one for each session duration. Wait for a new code before entering each one{MinStyle.RESET}')
+        if mfaToken and not session_tokens:
+            session_tokens[(mfa_arn, duration)] = mfaToken
+            continue
+        code = input(f'MFA token for {mfa_arn} ({duration}s session): ').strip()
+        while code in used_codes:
+            code = input(f'That code was already used, wait for the next MFA token for {mfa_arn}: ').strip()
+        session_tokens[(mfa_arn, duration)] = code
+    return session_tokens
+
+
+def refreshManifestProfiles(entries: list, mfaToken: str) -> None:
+    '''
+    refreshManifestProfiles refreshes every profile in a batch manifest. Profiles whose cached credentials
+    are still fresh are skipped. Every MFA code is asked for first, then one session token is requested per
+    MFA device and duration (see manifestSessions) and all role assumptions run concurrently. All the new
+    credentials are written in one credentials file update
+
+    Args:
+        entries (list): The profile entries from loadManifest
+        mfaToken (str): The MFA token for the first session token, others are prompted for
+    '''
+    threshold_seconds = args.refresh_threshold_minutes * 60
+    results = {}
+    stale_entries = []
+    for entry in entries:
+        cached = getCachedCredentials(aws_profile_to_mod, entry['tmp_profile'])
+        if not args.force and areFresh(cached, threshold_seconds):
+            results[entry['tmp_profile']] = ('cached', cached['Expiration'])
+        else:
+            stale_entries.append(entry)
+
+    sessions = manifestSessions(stale_entries)
+    session_tokens = collectMfaTokens(list(sessions), mfaToken)
+
+    new_profiles = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(stale_entries), 1)) as executor:
+        session_futures = {}
+        for session_key, session_entries in sessions.items():
+            mfa_arn, duration = session_key
+            session_futures[executor.submit(getSessionToken, session_entries[0]['base_profile'], mfa_arn, session_tokens[session_key], duration)] = session_key
+        credential_futures = {}
+        for future in concurrent.futures.as_completed(session_futures):
+            session_key = session_futures[future]
+            try:
+                session_credentials = future.result()
+            except botocore.exceptions.ClientError as err:
+                for entry in sessions[session_key]:
+                    results[entry['tmp_profile']] = ('failed', err.response['Error']['Message'])
+                continue
+            for entry in sessions[session_key]:
+                if entry.get('role_arn'):
+                    role_future = executor.submit(assumeRole, entry['base_profile'], session_credentials, entry['role_arn'],
+                                                  entry.get('role_session_name', entry['tmp_profile']), entry['duration'])
+                    credential_futures[role_future] = entry
+                else:
+                    role_future = concurrent.futures.Future()
+                    role_future.set_result(session_credentials)
+                    credential_futures[role_future] = entry
+        for future in concurrent.futures.as_completed(credential_futures):
+            entry = credential_futures[future]
+            try:
+                credentials = future.result()
+            except botocore.exceptions.ClientError as err:
+                results[entry['tmp_profile']] = ('failed', err.response['Error']['Message'])
+                continue
+            new_profiles[entry['tmp_profile']] = {
+                'aws_access_key_id': credentials['AccessKeyId'],
+                'aws_secret_access_key': credentials['SecretAccessKey'],
+                'aws_session_token': credentials['SessionToken'],
+                EXPIRATION_KEY: credentials['Expiration'].isoformat()
+            }
+            results[entry['tmp_profile']] = ('refreshed', credentials['Expiration'])
+
+    if new_profiles:
+        updateProfiles(aws_profile_to_mod, new_profiles)
+
+    print(f'\n{MinStyle.PINK}Temporary Session Credentials{MinStyle.RESET}')
+    print(f'{MinStyle.LIGHTGREY}{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
+    status_colors = {'cached': MinStyle.LIGHTGREY, 'refreshed': MinStyle.GREEN, 'failed': MinStyle.LIGHTRED}
+    for entry in entries:
+        status, detail = results[entry['tmp_profile']]
+        print(f'{MinStyle.LIGHTCYAN}{entry["tmp_profile"]:<24}{status_colors[status]}{status:<10}{MinStyle.WHITE}{detail}{MinStyle.RESET}')
+    print()
+    if any(status == 'failed' for status, _ in results.values()):
+        sys.exit(f'\n{MinStyle.LIGHTRED}Some profiles could not be refreshed. Exiting script{MinStyle.RESET}\n')
+
+
 # setting initial variables and assigning input args
 mfa_token = args.mfa_token
 st_profile = args.base_profile
@@ -134,32 +401,73 @@ aws_profile_to_mod = args.aws_credentials_file
 mfa_arn = args.mfa_arn
 dur_seconds = args.duration_seconds
 
+# credential_process output must only be the json document, no MFA prompt is possible here
+cached_credentials = getCachedCredentials(aws_profile_to_mod, mfa_tmp_creds_profile)
+if args.credential_process:
+    if not areFresh(cached_credentials, 0):
+        sys.exit(f'The temporary credentials in profile {mfa_tmp_creds_profile} are missing or expired. Run setTempSessionCreds.py with an MFA token to refresh them')
+    print(json.dumps(credentialProcessOutput(cached_credentials)))
+    sys.exit(0)
+
+# the aws sdk is slow to import, it is only imported once it is known that aws has to be called
+if args.manifest or args.force or not areFresh(cached_credentials, args.refresh_threshold_minutes * 60):
+    import botocore.exceptions, concurrent.futures
+    from utils.awsClientPool import clientPool
+    if args.engine == 'async':
+        import asyncio
+        from utils.asyncAws import AsyncAwsEngine
+    if args.metrics or args.metrics_file:
+        from utils.awsMetrics import enableCallMetrics
+        enableCallMetrics(clientPool, printSummary=args.metrics, metricsFile=args.metrics_file)
+
+# batch mode refreshes all the profiles of the manifest and ends the script
+if args.manifest:
+    refreshManifestProfiles(loadManifest(args.manifest), mfa_token)
+    sys.exit(0)
+
+# the cached credentials are reused while they are valid for longer than the refresh threshold
+if not args.force and areFresh(cached_credentials, args.refresh_threshold_minutes * 60):
+    remaining_minutes = int(remainingSeconds(cached_credentials) // 60)
+    print(f'\n{MinStyle.GREEN}Cached! {MinStyle.WHITE}The temporary credentials in the {MinStyle.LIGHTCYAN}{mfa_tmp_creds_profile}{MinStyle.WHITE} profile are valid for another {MinStyle.YELLOW}{remaining_minutes // 60}h {remaining_minutes % 60}m{MinStyle.WHITE} (until {cached_credentials["Expiration"]}). Use --force to refresh them anyway{MinStyle.RESET}\n')
+    sys.exit(0)
+
+if mfa_token is None:
+    my_parser.error(f'mfa_token is required, the temporary credentials in profile {mfa_tmp_creds_profile} are missing or expire within {args.refresh_threshold_minutes} minutes')
+
 # display the input mfa_token
 print(f'\n{MinStyle.PINK}Attempting to obtain temporary Session Credentials using{MinStyle.RESET}')
 print(f'{MinStyle.WHITE}{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
 print(f'{MinStyle.LIGHTCYAN}AWS Profile: {MinStyle.WHITE}{st_profile}{MinStyle.RESET}')
 print(f'{MinStyle.LIGHTCYAN}MFA Token:   {MinStyle.WHITE}{mfa_token}{MinStyle.RESET}\n')
 
-# get and display the caller identity to validate that the default profile is the correct one
-getCallerIdentity(st_profile)
+# get and display the caller identity to validate that the default profile is the correct one. It is only
+# displayed in verbose mode, so the extra round-trip is skipped otherwise
+if args.verbose and args.engine == 'threads':
+    getCallerIdentity(st_profile)
 
 
 # get and display the temporary credentials obtained using the mfa token
-st_session = boto3.Session(profile_name=(st_profile))
-st_profile_sts_client = st_session.client('sts')
-session_token_response = st_profile_sts_client.get_session_token(
-    DurationSeconds=(dur_seconds),
-    SerialNumber=(mfa_arn),
-    TokenCode=(mfa_token)
-)
+if args.engine == 'async':
+    # one event loop and engine serve every aws call of the refresh
+    event_loop = asyncio.new_event_loop()
+    aws_engine = AsyncAwsEngine(clientPool)
+    session_token_response = event_loop.run_until_complete(getSessionTokenAsync(aws_engine, st_profile, mfa_arn, mfa_token, dur_seconds))
+else:
+    st_profile_sts_client = clientPool.getClient('sts', st_profile)
+    session_token_response = st_profile_sts_client.get_session_token(
+        DurationSeconds=(dur_seconds),
+        SerialNumber=(mfa_arn),
+        TokenCode=(mfa_token)
+    )
 access_key_id = session_token_response.get("Credentials").get("AccessKeyId")
 secret_access_key = session_token_response.get(
     "Credentials").get("SecretAccessKey")
 session_token = session_token_response.get("Credentials").get("SessionToken")
+expiration = session_token_response.get("Credentials").get("Expiration")
 
 # get and display the profile that is about to be modified
-config.read(f'{aws_profile_to_mod}')
 if args.verbose:
+    config.read(f'{aws_profile_to_mod}')
     print(f'{MinStyle.PINK}Temporary Profile Credentials Original Values')
     print(f'{MinStyle.LIGHTGREY}{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
     print(f'{MinStyle.LIGHTCYAN}Profile: {MinStyle.YELLOW}{mfa_tmp_creds_profile}{MinStyle.RESET}')
@@ -167,12 +475,13 @@ if args.verbose:
     print(f'{MinStyle.LIGHTCYAN}SecretAccessKey: {MinStyle.YELLOW}{config.get(f"{mfa_tmp_creds_profile}", "aws_secret_access_key")}{MinStyle.RESET}')
     print(f'{MinStyle.LIGHTCYAN}SessionToken: {MinStyle.YELLOW}{config.get(f"{mfa_tmp_creds_profile}", "aws_session_token")}{MinStyle.RESET}')
 
-# set the new values of the to be modified profile and then write them out
-config.set(f'{mfa_tmp_creds_profile}', 'aws_access_key_id', f'{access_key_id}')
-config.set(f'{mfa_tmp_creds_profile}', 'aws_secret_access_key', f'{secret_access_key}')
-config.set(f'{mfa_tmp_creds_profile}', 'aws_session_token', f'{session_token}')
-with open((aws_profile_to_mod), 'w') as configfile:
-    config.write(configfile)
+# set the new values of the to be modified profile, only its section of the credentials file is rewritten
+updateProfile(aws_profile_to_mod, mfa_tmp_creds_profile, {
+    'aws_access_key_id': access_key_id,
+    'aws_secret_access_key': secret_access_key,
+    'aws_session_token': session_token,
+    EXPIRATION_KEY: expiration.isoformat()
+})
 
 # display the new values of the now modified profile
 if args.verbose:
@@ -183,10 +492,16 @@ if args.verbose:
     print(f'{MinStyle.LIGHTCYAN}AccessKeyId: {MinStyle.YELLOW}{access_key_id}{MinStyle.RESET}')
     print(f'{MinStyle.LIGHTCYAN}SecretAccessKey: {MinStyle.YELLOW}{secret_access_key}{MinStyle.RESET}')
     print(f'{MinStyle.LIGHTCYAN}SessionToken: {MinStyle.YELLOW}{session_token}{MinStyle.RESET}')
+    print(f'{MinStyle.LIGHTCYAN}Expiration: {MinStyle.YELLOW}{expiration}{MinStyle.RESET}')
     print()
 
 # get and display the users identity using the new profile to validate that the temp credentials work
-getUser(mfa_tmp_creds_profile)
+if args.engine == 'async':
+    event_loop.run_until_complete(getUserAsync(aws_engine, mfa_tmp_creds_profile))
+    event_loop.run_until_complete(aws_engine.close())
+    event_loop.close()
+else:
+    getUser(mfa_tmp_creds_profile)
 
 # Display success message
 print(f'{MinStyle.GREEN}Success! {MinStyle.WHITE}Temporary Session Credentials obtained and stored in the {MinStyle.LIGHTCYAN}st_mfa_creds{MinStyle.WHITE} profile{MinStyle.RESET}\n')
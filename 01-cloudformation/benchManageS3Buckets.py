@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# ===========================================================================================================
+# Description:
+#     Benchmarks manageS3Buckets.py offline. The script's create and delete flows are run against an
+#     in-memory CloudFormation stand-in (utils/fakeAws.py) with a simulated stack latency, for a number
+#     of fake regions, one region at a time, with all regions in parallel and as a single stack set.
+#     The stand-in's clients emit the botocore events, so the rate limiter and the call metrics run as
+#     they would against aws. Wall time, api call count, api errors and peak memory are reported for each run
+#
+# Usage and Arguments:
+#  - Running the script with -h will display the usage and arguments information
+#
+# ===========================================================================================================
+
+import argparse, contextlib, io, glob, json, os, runpy, sys, tempfile, time, tracemalloc
+
+# appending the path so that packages can be imported from a parent level
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from utils.pyColors import MinStyle as clr  # isort:skip
+from utils.awsClientPool import clientPool  # isort:skip
+from utils.awsMetrics import AwsCallMetrics  # isort:skip
+from utils.fakeAws import FakeAwsAccount  # isort:skip
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+MANAGE_S3_BUCKETS = os.path.join(SCRIPT_DIR, 'manageS3Buckets.py')
+
+# create the commandline parser
+my_parser = argparse.ArgumentParser(prog='benchManageS3Buckets',
+                                    description='Benchmark the manageS3Buckets create and delete flows against a local CloudFormation stand-in')
+
+# adding cli arguments
+my_parser.add_argument('--sizes',
+                       type=str,
+                       default='4,50,500',
+                       help='Comma separated numbers of regions (stacks) to benchmark')
+
+my_parser.add_argument('--modes',
+                       type=str,
+                       default='serial,concurrent,async,stackset',
+                       help='Comma separated run modes to benchmark. Options are [ serial, concurrent, async, stackset ]')
+
+my_parser.add_argument('--max_parallel',
+                       type=int,
+                       default=0,
+                       help='The max_parallel used for concurrent and async runs, and max_concurrent_count for stackset runs, 0 runs every region at the same time')
+
+my_parser.add_argument('--stack_latency',
+                       type=float,
+                       default=0.05,
+                       help='The simulated time, in seconds, a stack takes to create or delete')
+
+my_parser.add_argument('--api_latency',
+                       type=float,
+                       default=0.0,
+                       help='The simulated round trip time, in seconds, of every api call')
+
+my_parser.add_argument('--api_rate',
+                       type=float,
+                       default=5.0,
+                       help='The --api_rate manageS3Buckets.py is run with, the maximum api calls per second in each region. 0 turns the limit off')
+
+my_parser.add_argument('--stack_template',
+                       type=str,
+                       default=os.path.join(SCRIPT_DIR, 'lab111-s3-minimal.yaml'),
+                       help='The stack template to create')
+
+my_parser.add_argument('--json_file',
+                       type=str,
+                       default=None,
+                       help='Also write the results to this json file')
+
+
+def runManageS3Buckets(scriptArgs: list, callMetrics: AwsCallMetrics) -> None:
+    # the script reads sys.argv, prints its progress and exits on failure; only its side effects are kept.
+    # Every run adds its client hooks to the shared pool again, so they are cleared once it is done
+    sys.argv = [MANAGE_S3_BUCKETS] + scriptArgs
+    clientPool.addClientHook(callMetrics.instrument)
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            runpy.run_path(MANAGE_S3_BUCKETS, run_name='__main__')
+        except SystemExit as err:
+            if err.code not in (None, 0):
+                raise RuntimeError(f'manageS3Buckets.py failed: {err.code}')
+        finally:
+            clientPool.clearClientHooks()
+
+
+def benchRun(regionCount: int, mode: str, args: argparse.Namespace) -> list:
+    '''
+    benchRun creates and then deletes a stack in regionCount fake regions
+
+    Args:
+        regionCount (int): The number of regions (and stacks)
+        mode (str): serial, concurrent, async or stackset
+        args (argparse.Namespace): The benchmark arguments
+
+    Returns:
+        list: The result of the create and the delete run
+    '''
+    account = FakeAwsAccount(stackLatency=args.stack_latency, apiLatency=args.api_latency)
+    clientPool.setClientFactory(account.client)
+    max_parallel = 1 if mode == 'serial' else (args.max_parallel or regionCount)
+    common_args = ['--skip_region_validation',
+                   '--api_rate', f'{args.api_rate}',
+                   '--poll_min_delay', f'{args.stack_latency / 4}',
+                   '--poll_max_delay', f'{args.stack_latency}']
+    if mode == 'stackset':
+        common_args += ['--mode', 'stackset', '--max_concurrent_count', f'{max_parallel}']
+    elif mode == 'async':
+        common_args += ['--engine', 'async', '--max_parallel', f'{max_parallel}']
+    else:
+        common_args += ['--max_parallel', f'{max_parallel}']
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            regions_file = os.path.join(work_dir, 'regions-config.yaml')
+            with open(regions_file, 'w') as regionsFile:
+                regionsFile.write('usa:\n' + ''.join(f'  - bench-{index:04d}\n' for index in range(regionCount)))
+            for action in ('create', 'delete'):
+                if action == 'create':
+                    action_args = [action, 'usa', 'benchstack', regions_file, args.stack_template]
+                else:
+                    action_args = [action, 'usa', 'benchstack', regions_file, sorted(glob.glob('s3-buckets-*.json'))[-1]]
+                calls_before = account.totalApiCalls()
+                call_metrics = AwsCallMetrics()
+                tracemalloc.start()
+                started = time.perf_counter()
+                runManageS3Buckets(action_args + common_args, call_metrics)
+                wall_time = time.perf_counter() - started
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results.append({
+                    'regions': regionCount,
+                    'mode': mode,
+                    'action': action,
+                    'wall_s': round(wall_time, 3),
+                    'api_calls': account.totalApiCalls() - calls_before,
+                    'api_errors': sum(row['errors'] for row in call_metrics.summaryRows()),
+                    'peak_mb': round(peak_memory / 1024 / 1024, 2),
+                })
+        finally:
+            os.chdir(cwd)
+            clientPool.setClientFactory(None)
+    return results
+
+
+def main(argv: list = None) -> None:
+    args = my_parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+
+    results = []
+    print(f'\n{clr.WHITE}manageS3Buckets benchmark{clr.RESET} (stack latency {args.stack_latency}s, api latency {args.api_latency}s)')
+    print(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    print(f'{clr.PINK}{"regions":>8} {"mode":<11} {"action":<7} {"wall s":>9} {"api calls":>10} {"errors":>7} {"peak MB":>8}{clr.RESET}')
+    for size in sizes:
+        for mode in modes:
+            for result in benchRun(size, mode, args):
+                results.append(result)
+                print(f'{result["regions"]:>8} {result["mode"]:<11} {result["action"]:<7} {clr.LIGHTCYAN}{result["wall_s"]:>9.3f}{clr.RESET} {result["api_calls"]:>10} {result["api_errors"]:>7} {result["peak_mb"]:>8.2f}')
+    print()
+
+    if args.json_file:
+        with open(args.json_file, 'w') as jsonFile:
+            json.dump(results, jsonFile, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,33 @@
 #!/usr/bin/env python3
 
+# annotations are not evaluated, so the aws types in them do not have to be imported up front
+from __future__ import annotations
+
 import argparse
-import boto3, botocore.exceptions
 import datetime
-import cfnyaml, json, yaml
+import hashlib, io, json, re, time
 import os, pathlib, sys
 from typing import NoReturn, Union, Any
 
 # appending the path so that packages can be imported from a parent level
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from utils.pyColors import MinStyle as clr
+from utils.regionsConfig import cachedRegionsIndex, countryRegions, loadRegionsIndex
+
+DEFAULT_REGIONS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'regions-config.yaml')
+
+
+def defaultCountryChoices() -> list:
+    # the countries are listed in --help from the default regions config's index, only when it is already
+    # cached: compiling it would import yaml and botocore on every run. The country is checked against the
+    # regions_file actually given once the arguments are parsed
+    try:
+        cached_index = cachedRegionsIndex(DEFAULT_REGIONS_FILE)
+    except (OSError, ValueError, ImportError):
+        return []
+    return cached_index['choices'] if cached_index else []
+
+default_country_choices = defaultCountryChoices()
 
 # create the commandline parser
 my_parser = argparse.ArgumentParser(prog='manageS3Buckets',
@@ -20,15 +38,15 @@ my_parser = argparse.ArgumentParser(prog='manageS3Buckets',
 my_parser.add_argument('stack_action',
                        metavar='stack_action',
                        type=str,
-                       choices=['create', 'update', 'delete'],
-                       help='Indicates what action is to be taken. Options are one of [ create, update, delete ]')
+                       choices=['create', 'update', 'delete', 'status'],
+                       help='Indicates what action is to be taken. status reports the deployed stacks and buckets of every region. Options are one of [ create, update, delete, status ]')
 
 my_parser.add_argument('country',
                        metavar='country',
                        type=str,
                        default='usa',
-                       choices=['usa', 'eu'],
-                       help='Indicates which country\'s regions the s3 buckets will be created in. Options are one of [ create, update, delete ]')
+                       help='Indicates which country\'s (or group\'s) regions the s3 buckets will be created in, as listed in the regions_file.'
+                            + (f' Options in {os.path.basename(DEFAULT_REGIONS_FILE)} are one of [ {", ".join(default_country_choices)} ]' if default_country_choices else ''))
 
 my_parser.add_argument('stack_name',
                        metavar='stack_name',
@@ -44,7 +62,9 @@ my_parser.add_argument('regions_file',
 my_parser.add_argument('stack_template',
                        metavar='stack_template',
                        type=argparse.FileType('r'),
-                       help='A yaml config file containing stack templet to create')
+                       nargs='?',
+                       default=None,
+                       help='A yaml config file containing stack templet to create, or for delete the stack output file. Not used by status')
 
 my_parser.add_argument('--user_aws_profile',
                        metavar='user_aws_profile',
@@ -52,6 +72,154 @@ my_parser.add_argument('--user_aws_profile',
                        default='st_mfa_creds',
                        help='The users aws credentials profile to use for programmatic access')
 
+my_parser.add_argument('--mode',
+                       type=str,
+                       default='stacks',
+                       choices=['stacks', 'stackset'],
+                       help='How the regions are deployed. stacks manages one <stack_name>-<region> stack per region from this script, stackset deploys a single CloudFormation StackSet with an instance in each region. Options are one of [ stacks, stackset ]'
+                       )
+
+my_parser.add_argument('--max_concurrent_count',
+                       type=int,
+                       default=10,
+                       help='For --mode stackset, the maximum number of regions CloudFormation deploys at the same time'
+                       )
+
+my_parser.add_argument('--failure_tolerance_count',
+                       type=int,
+                       default=0,
+                       help='For --mode stackset, the number of regions that can fail before CloudFormation stops the operation in the remaining regions'
+                       )
+
+my_parser.add_argument('--engine',
+                       type=str,
+                       default='threads',
+                       choices=['threads', 'async'],
+                       help='How the regions of a --mode stacks create, update or delete are run. threads uses a worker thread per region being worked on, async runs every region as a coroutine on one event loop (with aiobotocore when it is installed, otherwise the calls are made on a small thread pool) so hundreds of regions can be in flight. Use --max_parallel to set how many. Options are one of [ threads, async ]'
+                       )
+
+my_parser.add_argument('--max_parallel',
+                       metavar='max_parallel',
+                       type=int,
+                       default=1,
+                       help='The maximum number of regions to create, update or delete stacks in at the same time. Default is 1 (one region at a time)')
+
+my_parser.add_argument('--max_pool_connections',
+                       metavar='max_pool_connections',
+                       type=int,
+                       default=None,
+                       help='The size of the connection pool kept by each regional aws client. Defaults to the larger of 10 and max_parallel')
+
+my_parser.add_argument('--max_attempts',
+                       type=int,
+                       default=10,
+                       help='The number of attempts made at each aws api call before a throttling or transient error is given up on, retried with adaptive backoff'
+                       )
+
+my_parser.add_argument('--api_rate',
+                       type=float,
+                       default=5.0,
+                       help='The maximum CloudFormation api calls per second in each region, slowed down further while aws throttles. 0 turns the limit off'
+                       )
+
+my_parser.add_argument('--poll_min_delay',
+                       metavar='poll_min_delay',
+                       type=float,
+                       default=2.0,
+                       help='The shortest delay, in seconds, between stack status polls. The delay backs off while a stack has no new events')
+
+my_parser.add_argument('--poll_max_delay',
+                       metavar='poll_max_delay',
+                       type=float,
+                       default=30.0,
+                       help='The longest delay, in seconds, between stack status polls')
+
+my_parser.add_argument('--template_bucket',
+                       metavar='template_bucket',
+                       type=str,
+                       default=None,
+                       help='An S3 bucket to upload templates too large to send inline (over 51,200 bytes) to. The template is uploaded once and used by every region')
+
+my_parser.add_argument('--parameters_file',
+                       metavar='parameters_file',
+                       type=argparse.FileType('r'),
+                       default=None,
+                       help='A json file of stack parameters, as a list of ParameterKey/ParameterValue pairs (i.e. params.json)')
+
+my_parser.add_argument('--manifest',
+                       metavar='manifest',
+                       type=argparse.FileType('r'),
+                       default=None,
+                       help='A yaml deployment manifest listing several stacks, each with its template and parameters file, to create, update or delete together in place of stack_template. '
+                            'The order is worked out from the templates\' Export/ImportValue and ssm parameters (and each stack\'s depends_on), a stack starts as soon as the stacks it needs are done and deletes run in reverse. '
+                            'The stacks are named <stack_name>-<manifest stack>-<region>. See lab122-124-manifest.yaml')
+
+my_parser.add_argument('--diff',
+                       help='For update, compare the local template and parameters with what is deployed in each region, plan the changes with change sets and only update the regions that differ',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--plan_only',
+                       help='Print the --diff plan for each region without executing any changes, the change sets it plans with are deleted afterwards',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--resume',
+                       help='Continue the last run of the same action, stack name and country from its checkpoint file. Done regions are skipped and stacks that were still in progress are waited on instead of being started again',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--checkpoint_file',
+                       type=str,
+                       default=None,
+                       help='The checkpoint file the state of each region is recorded in. Defaults to s3-buckets-<stack_name>-<country>-<stack_action>.checkpoint.jsonl'
+                       )
+
+my_parser.add_argument('--purge_buckets',
+                       help='For delete, empty the buckets of each stack (every object version and delete marker) before deleting the stack, so it does not fail with DELETE_FAILED',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--purge_workers',
+                       type=int,
+                       default=8,
+                       help='For --purge_buckets, the number of DeleteObjects calls, of up to 1000 keys each, made at the same time for each bucket'
+                       )
+
+my_parser.add_argument('--skip_region_validation',
+                       help='Do not check that the regions in the regions_file exist in the aws endpoint data, i.e. for regions newer than the installed botocore',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--skip_preflight',
+                       help='For create and update, do not validate the template and parameters locally before deploying. The pre-flight resolves the template for every region and checks every !Ref, !GetAtt and condition, the parameters and the bucket names',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--output',
+                       type=str,
+                       default='table',
+                       choices=['table', 'json'],
+                       help='For status, how the result is printed. Options are one of [ table, json ]'
+                       )
+
+my_parser.add_argument('--status_cache_ttl',
+                       type=float,
+                       default=30.0,
+                       help='For status, the number of seconds the status of a region is cached for. 0 always queries aws'
+                       )
+
+my_parser.add_argument('--metrics',
+                       help='Print the number, latency, retries and throttles of the aws api calls made, by region and operation, when the script ends',
+                       action='store_true'
+                       )
+
+my_parser.add_argument('--metrics_file',
+                       type=str,
+                       default=None,
+                       help='Write the aws api call metrics to this file when the script ends, as json for a .json file otherwise in the OpenMetrics text format'
+                       )
+
 my_parser.add_argument('--verbose',
                        help='Increases output verbosity',
                        action='store_true'
@@ -63,92 +231,120 @@ def errMessage(err: botocore.exceptions.ClientError, attemptedAction: str) -> Un
     err_code=err.response['Error']['Code']
     err_http_status_code=err.response['ResponseMetadata']['HTTPStatusCode']
     if err_msg == 'No updates are to be performed.':
-        print("No changes made")
+        log.info("No changes made", extra={'continuesLine': True})
         return None
     else:
-        print(f'\n{clr.LIGHTRED}Encountered Unexpected error:{clr.RESET}')
-        print(f'{clr.LIGHTCYAN}Attempted Action:{clr.RESET} {attemptedAction}')
-        print(f'{clr.LIGHTCYAN}HTTP Code:{clr.RESET}     {err_http_status_code}')
-        print(f'{clr.LIGHTCYAN}Error Code:{clr.RESET}    {err_code}')
-        print(f'{clr.LIGHTCYAN}Error Message:{clr.RESET} {err_msg}')
-        print()
+        # one record for the whole block, so the lines of concurrent regions do not interleave
+        err_lines = [f'\n{clr.LIGHTRED}Encountered Unexpected error:{clr.RESET}',
+                     f'{clr.LIGHTCYAN}Attempted Action:{clr.RESET} {attemptedAction}',
+                     f'{clr.LIGHTCYAN}HTTP Code:{clr.RESET}     {err_http_status_code}',
+                     f'{clr.LIGHTCYAN}Error Code:{clr.RESET}    {err_code}',
+                     f'{clr.LIGHTCYAN}Error Message:{clr.RESET} {err_msg}\n']
         if args.verbose:
-            print(f'Entire Error:')
-            print(f'{clr.DIV_SINGLE_LONG}{clr.RESET}')
-            print(f'{err}')
+            err_lines += [f'Entire Error:', f'{clr.DIV_SINGLE_LONG}{clr.RESET}', f'{err}']
+        log.error('\n'.join(err_lines), extra={'continuesLine': True, 'fields': {'action': attemptedAction, 'http_status': err_http_status_code, 'error_code': err_code}})
         sys.exit(f'\n{clr.LIGHTRED}Exiting script{clr.RESET}\n')
 
 
-def updateStackOutputFile(stackOutputFile: str, stackObject: object) -> None:
-    try:
-        opFile=open(stackOutputFile, "a+")
-        if os.stat(stackOutputFile).st_size == 0:
-            json.dump(stackObject, opFile)
-        else:
-            opFile.seek(0)
-            prev_stack_dict=json.load(opFile)
-            prev_stack_dict.update(stackObject)
-            opFile.truncate(0)
-            json.dump(prev_stack_dict, opFile)
-        opFile.close()
-    except Exception as err:
-        print(f'{err}')
-        sys.exit(f'\n{clr.LIGHTRED}Exiting script{clr.RESET}\n')
-    return None
+def stackStatusMessage(stackDescription: dict, attemptedAction: str) -> NoReturn:
+    log.error('\n'.join([f'\n{clr.LIGHTRED}Stack did not complete successfully:{clr.RESET}',
+                          f'{clr.LIGHTCYAN}Attempted Action:{clr.RESET} {attemptedAction}',
+                          f'{clr.LIGHTCYAN}Stack Id:{clr.RESET}      {stackDescription.get("StackId")}',
+                          f'{clr.LIGHTCYAN}Stack Status:{clr.RESET}  {stackDescription.get("StackStatus")}',
+                          f'{clr.LIGHTCYAN}Reason:{clr.RESET}        {stackDescription.get("StackStatusReason", "")}\n']),
+              extra={'continuesLine': True, 'fields': {'action': attemptedAction, 'StackId': stackDescription.get('StackId'), 'StackStatus': stackDescription.get('StackStatus')}})
+    sys.exit(f'\n{clr.LIGHTRED}Exiting script{clr.RESET}\n')
 
 
-def upsertStack(stack_action: str, userAwsProfile: str, region: str, fullStackName: str, stackTemplate: object, stackOutputFile: str):
+def preflightFailed(preflightProblems: list) -> NoReturn:
+    log.error('\n'.join([f'\n{clr.LIGHTRED}Template pre-flight failed:{clr.RESET}'] + [f'  {problem}' for problem in preflightProblems]) + '\n',
+              extra={'fields': {'action': 'preflight', 'problems': preflightProblems}})
+    sys.exit(f'\n{clr.LIGHTRED}Fix the template or parameters, or use --skip_preflight. Exiting script{clr.RESET}\n')
+
+
+def printStackEvent(region: str, stackEvent: dict) -> None:
+    status = stackEvent['ResourceStatus']
+    if status.endswith('_FAILED'):
+        status_clr = clr.LIGHTRED
+    elif status.endswith('_COMPLETE'):
+        status_clr = clr.LIGHTGREEN
+    else:
+        status_clr = clr.YELLOW
+    reason = f' {clr.LIGHTGREY}{stackEvent["ResourceStatusReason"]}{clr.RESET}' if stackEvent.get('ResourceStatusReason') else ''
+    # a serial run shows one region at a time as "Attempting to ... ...  Success!!", its stack events only go
+    # to the log file unless --verbose is used
+    log.info(f'  {clr.LIGHTBLUE}{region}{clr.RESET} {stackEvent["LogicalResourceId"]} ({stackEvent["ResourceType"]}) {status_clr}{status}{clr.RESET}{reason}',
+             extra={'region': region, 'console': not serial_run or args.verbose,
+                    'fields': {'resource': stackEvent['LogicalResourceId'], 'resource_type': stackEvent['ResourceType'], 'status': status}})
+
+
+def upsertStack(stack_action: str, userAwsProfile: str, region: str, fullStackName: str, stackTemplate: dict, stackOutputJournal: StackOutputJournal,
+                stackParameters: Union[list,None] = None, checkpointKey: Union[str,None] = None):
     action=f'AWS CLOUDFORMATION - {stack_action}Stack'
-    cf_session = boto3.Session(profile_name=(userAwsProfile))
-    cf_client = cf_session.client('cloudformation', region_name=(region))
-    create_waiter = cf_client.get_waiter('stack_create_complete')
-    update_waiter = cf_client.get_waiter('stack_update_complete')
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile, region)
+    # a --manifest stack has its own parameters and is checkpointed as <manifest stack>/<region>
+    stackParameters = stack_parameters if stackParameters is None else stackParameters
 
     # for debugging, verbose output
     if args.verbose:
-        print(f'\n{clr.WHITE}Stack creation parameters{clr.RESET}')
-        print(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
-        print(f'{clr.PINK}Stack Action ...= {clr.LIGHTCYAN}{action}{clr.RESET}')
-        print(f'{clr.PINK}Stack Name .....= {clr.LIGHTCYAN}{fullStackName}{clr.RESET}')
-        print(f'{clr.PINK}Stack Template .= {clr.LIGHTCYAN}{stackTemplate}{clr.RESET}')
-        print(f'{clr.PINK}Region .........= {clr.LIGHTCYAN}{region}{clr.RESET}')
-        print()
-
-    print(f'Attempting to {stack_action} S3 bucket in region: {region} ...', end='')
+        log.debug(f'\n{clr.WHITE}Stack creation parameters{clr.RESET}')
+        log.debug(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+        log.debug(f'{clr.PINK}Stack Action ...= {clr.LIGHTCYAN}{action}{clr.RESET}')
+        log.debug(f'{clr.PINK}Stack Name .....= {clr.LIGHTCYAN}{fullStackName}{clr.RESET}')
+        log.debug(f'{clr.PINK}Stack Template .= {clr.LIGHTCYAN}{stackTemplate}{clr.RESET}')
+        log.debug(f'{clr.PINK}Region .........= {clr.LIGHTCYAN}{region}{clr.RESET}')
+        log.debug('')
+
+    # a serial run prints the result on the same line, see printStackEvent
+    log.info(f'Attempting to {stack_action} S3 bucket in region: {region} ...', extra={'region': region, 'end': '' if serial_run else '\n'})
     try:
+        started_at = datetime.datetime.now(datetime.timezone.utc)
         if stack_action == 'create':
-            stack_id = cf_client.create_stack(
+            stack_id = callWithThrottleRetry(
+                cf_client.create_stack,
                 StackName=fullStackName,
-                TemplateBody=stackTemplate,
+                **stackTemplate,
+                Parameters=stackParameters,
                 DisableRollback=True,
                 TimeoutInMinutes=3,
                 Capabilities=['CAPABILITY_NAMED_IAM']
             )
-            create_waiter.wait(
-                StackName=f'{stack_id["StackId"]}'
-            )
         else:
-            stack_id = cf_client.update_stack(
+            stack_id = callWithThrottleRetry(
+                cf_client.update_stack,
                 StackName=fullStackName,
-                TemplateBody=stackTemplate,
+                **stackTemplate,
+                Parameters=stackParameters,
                 DisableRollback=True,
                 TimeoutInMinutes=3,
                 Capabilities=['CAPABILITY_NAMED_IAM']
             )
-            update_waiter.wait(
-                StackName=f'{stack_id["StackId"]}'
-            )
+        run_checkpoint.record(checkpointKey or region, 'in-progress', stack_id['StackId'], started_at)
+        stack_description = stack_watcher.waitForStack(cf_client, stack_id['StackId'], region, since=started_at)
+        if stack_description['StackStatus'] != f'{stack_action.upper()}_COMPLETE':
+            stackStatusMessage(stack_description, action)
         # print success message
-        print(f'  {clr.LIGHTGREEN}Success!!\n{clr.RESET}{stack_action}d Stack Id: {clr.LIGHTGREY}{stack_id["StackId"]}{clr.RESET}\n')
-        # add stack Id to stack output file
-        stack_dict={f'{region}': f'{stack_id["StackId"]}'}
-        updateStackOutputFile(stackOutputFile, stack_dict)
+        if serial_run:
+            log.info(f'  {clr.LIGHTGREEN}Success!!\n{clr.RESET}{stack_action}d Stack Id: {clr.LIGHTGREY}{stack_id["StackId"]}{clr.RESET}\n', extra={'continuesLine': True})
+        # add stack Id to stack output journal
+        stackOutputJournal.append(region, stack_id['StackId'])
         return stack_id
     except botocore.exceptions.ClientError as err:
         return errMessage(err, action)
+    except TimeoutError as err:
+        stackStatusMessage({'StackStatus': 'WAIT_TIMED_OUT', 'StackStatusReason': f'{err}'}, action)
+
 
+def purgeStackBuckets(cf_client, userAwsProfile: str, region: str, stackId: str) -> None:
+    s3_client = clientPool.getClient('s3', userAwsProfile, region)
+    for resource in cf_client.describe_stack_resources(StackName=stackId)['StackResources']:
+        if resource['ResourceType'] != 'AWS::S3::Bucket' or not resource.get('PhysicalResourceId'):
+            continue
+        deleted = purgeBucket(s3_client, resource['PhysicalResourceId'], args.purge_workers)
+        log.info(f'  Emptied bucket {clr.LIGHTGREY}{resource["PhysicalResourceId"]}{clr.RESET} in region: {clr.LIGHTBLUE}{region}{clr.RESET}, {deleted} object versions deleted')
 
-def deleteStack(userAwsProfile: str, region: str, stackId: str) -> Union[bool,None]:
+
+def deleteStack(userAwsProfile: str, region: str, stackId: str, checkpointKey: Union[str,None] = None) -> Union[bool,None]:
     '''
     deleteStack deletes a specified stack in a given region
 
@@ -156,101 +352,1045 @@ def deleteStack(userAwsProfile: str, region: str, stackId: str) -> Union[bool,No
         userAwsProfile (str): The users aws credentials profile for aws programmatic access
         region (str): AWS region that the stack is in
         stackId (str): The AWS unique stack ID (the arn id)
+        checkpointKey (str): The key the stack is checkpointed under, the region unless given
 
     Returns:
         Union[bool,None]: Returns true if successful or none if an error was encountered
     '''
     action='AWS CLOUDFORMATION - DeleteStack'
-    cf_client = boto3.Session(profile_name=(userAwsProfile), region_name=(region))
-    cf_client = cf_client.client('cloudformation')
-    waiter = cf_client.get_waiter('stack_delete_complete')
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile, region)
 
     # for debugging, verbose output
     if args.verbose:
-        print(f'\n{clr.WHITE}Stack deletion parameters{clr.RESET}')
-        print(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
-        print(f'{clr.PINK}Stack Id ..= {clr.LIGHTCYAN}{stackId}{clr.RESET}')
-        print(f'{clr.PINK}Region ....= {clr.LIGHTCYAN}{region}{clr.RESET}')
-        print()
+        log.debug(f'\n{clr.WHITE}Stack deletion parameters{clr.RESET}')
+        log.debug(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+        log.debug(f'{clr.PINK}Stack Id ..= {clr.LIGHTCYAN}{stackId}{clr.RESET}')
+        log.debug(f'{clr.PINK}Region ....= {clr.LIGHTCYAN}{region}{clr.RESET}')
+        log.debug('')
 
-    print(f'Attempting to delete S3 bucket in region: {clr.LIGHTBLUE}{region}{clr.RESET} ...', end='')
+    log.info(f'Attempting to delete S3 bucket in region: {clr.LIGHTBLUE}{region}{clr.RESET} ...', extra={'region': region, 'end': '' if serial_run else '\n'})
     try:
-        cf_client.delete_stack(
+        if args.purge_buckets:
+            purgeStackBuckets(cf_client, userAwsProfile, region, stackId)
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        callWithThrottleRetry(
+            cf_client.delete_stack,
             StackName=stackId
         )
-        waiter.wait(
-            StackName=stackId
+        run_checkpoint.record(checkpointKey or region, 'in-progress', stackId, started_at)
+        stack_description = stack_watcher.waitForStack(cf_client, stackId, region, since=started_at)
+        if stack_description['StackStatus'] != 'DELETE_COMPLETE':
+            stackStatusMessage(stack_description, action)
+        if serial_run:
+            log.info(f'  {clr.LIGHTGREEN}Success!!\n{clr.RESET}Deleted Stack Id: {clr.LIGHTGREY}{stackId}{clr.RESET}\n', extra={'continuesLine': True})
+        return True
+    except botocore.exceptions.ClientError as err:
+        return errMessage(err, action)
+    except RuntimeError as err:
+        # a bucket could not be emptied, deleting the stack would only fail
+        sys.exit(f'\n{clr.LIGHTRED}{err}. Exiting script{clr.RESET}\n')
+    except TimeoutError as err:
+        stackStatusMessage({'StackStatus': 'WAIT_TIMED_OUT', 'StackStatusReason': f'{err}'}, action)
+
+
+def templateDigest(templateBody: Union[str,dict]) -> str:
+    # get_template returns json templates already parsed
+    if not isinstance(templateBody, str):
+        templateBody = json.dumps(templateBody, sort_keys=True)
+    return hashlib.sha256(templateBody.encode('utf-8')).hexdigest()
+
+
+def waitForChangeSet(cf_client, changeSetId: str, maxDelay: float = 10.0) -> dict:
+    delay = 1.0
+    while True:
+        change_set = cf_client.describe_change_set(ChangeSetName=changeSetId)
+        if change_set['Status'] in ('CREATE_COMPLETE', 'FAILED', 'DELETE_COMPLETE', 'DELETE_FAILED'):
+            return change_set
+        time.sleep(delay)
+        delay = min(delay * 1.5, maxDelay)
+
+
+def planRegionStack(userAwsProfile: str, region: str, fullStackName: str, stackTemplate: dict, templateBody: str, stackParameters: list) -> dict:
+    '''
+    planRegionStack works out what an update would change in a region. The deployed template and
+    parameters are compared with the local ones first, and a change set is only created when they differ
+
+    Args:
+        userAwsProfile (str): The users aws credentials profile for aws programmatic access
+        region (str): AWS region that the stack is in
+        fullStackName (str): The name of the stack in the region
+        stackTemplate (dict): The create_stack/update_stack template arguments
+        templateBody (str): The local template body
+        stackParameters (list): The local stack parameters
+
+    Returns:
+        dict: The region's plan. Its action is one of [ no-op, update, missing ]
+    '''
+    action='AWS CLOUDFORMATION - CreateChangeSet'
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile, region)
+    plan = {'region': region, 'action': 'no-op', 'changes': []}
+    try:
+        try:
+            deployed_stack = cf_client.describe_stacks(StackName=fullStackName)['Stacks'][0]
+        except botocore.exceptions.ClientError as err:
+            if 'does not exist' in err.response['Error']['Message']:
+                plan['action'] = 'missing'
+                return plan
+            raise
+        plan['StackId'] = deployed_stack['StackId']
+        deployed_parameters = {param['ParameterKey']: param.get('ParameterValue') for param in deployed_stack.get('Parameters', [])}
+        local_parameters = {param['ParameterKey']: param.get('ParameterValue') for param in stackParameters}
+        deployed_template = cf_client.get_template(StackName=deployed_stack['StackId'], TemplateStage='Original')['TemplateBody']
+        if templateDigest(deployed_template) == templateDigest(templateBody) and deployed_parameters == local_parameters:
+            return plan
+        change_set = cf_client.create_change_set(
+            StackName=deployed_stack['StackId'],
+            # change set names only allow letters, numbers and hyphens, fmtDateTime has underscores
+            ChangeSetName=re.sub('[^-a-zA-Z0-9]', '-', f'{stack_name}-diff-{fmtDateTime}'),
+            ChangeSetType='UPDATE',
+            Parameters=stackParameters,
+            Capabilities=['CAPABILITY_NAMED_IAM'],
+            **stackTemplate
         )
-        print(f'  {clr.LIGHTGREEN}Success!!\n{clr.RESET}Deleted Stack Id: {clr.LIGHTGREY}{region_stack_id}{clr.RESET}\n')
+        change_set = waitForChangeSet(cf_client, change_set['Id'])
+        if change_set['Status'] != 'CREATE_COMPLETE':
+            # a template that only looks different (formatting, comments) gives a change set without changes
+            cf_client.delete_change_set(ChangeSetName=change_set['ChangeSetId'])
+            if "didn't contain changes" in change_set.get('StatusReason', '') or 'No updates are to be performed' in change_set.get('StatusReason', ''):
+                return plan
+            plan['action'] = 'failed'
+            plan['reason'] = change_set.get('StatusReason', '')
+            return plan
+        plan['action'] = 'update'
+        plan['ChangeSetId'] = change_set['ChangeSetId']
+        plan['changes'] = [change['ResourceChange'] for change in change_set.get('Changes', []) if 'ResourceChange' in change]
+        return plan
+    except botocore.exceptions.ClientError as err:
+        errMessage(err, action)
+
+
+def planRegionStacks(regions: list) -> dict:
+    '''
+    planRegionStacks plans the update of every region in parallel and prints the plan
+
+    Args:
+        regions (list): AWS regions to plan the update for
+
+    Returns:
+        dict: The plan of each region
+    '''
+    plans = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(max_parallel, min(len(regions), 16))) as executor:
+        future_regions = {executor.submit(planRegionStack, user_aws_profile, region, f'{stack_name}-{region}', stack_template, stack_template_body, stack_parameters): region for region in regions}
+        for future in concurrent.futures.as_completed(future_regions):
+            region = future_regions[future]
+            try:
+                plans[region] = future.result()
+            except SystemExit:
+                plans[region] = {'region': region, 'action': 'failed', 'changes': []}
+
+    log.info(f'\n{clr.WHITE}Update Plan{clr.RESET}')
+    log.info(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    plan_clrs = {'no-op': clr.LIGHTGREY, 'update': clr.YELLOW, 'missing': clr.LIGHTRED, 'failed': clr.LIGHTRED}
+    for region in regions:
+        plan = plans[region]
+        log.info(f'{clr.LIGHTBLUE}{region:<16}{clr.RESET} {plan_clrs[plan["action"]]}{plan["action"]}{clr.RESET} {plan.get("reason", "")}')
+        for change in plan['changes']:
+            log.info(f'    {change.get("Action")} {change.get("LogicalResourceId")} ({change.get("ResourceType")}) replacement: {change.get("Replacement", "n/a")}')
+    log.info('')
+    return plans
+
+
+def deletePlannedChangeSets(userAwsProfile: str, regionPlans: dict) -> None:
+    '''
+    deletePlannedChangeSets deletes the change sets of a --plan_only run, so no run leaves them behind
+
+    Args:
+        userAwsProfile (str): The users aws credentials profile for aws programmatic access
+        regionPlans (dict): The plan of each region, from planRegionStacks
+    '''
+    for region, plan in regionPlans.items():
+        if not plan.get('ChangeSetId'):
+            continue
+        cf_client = clientPool.getClient('cloudformation', userAwsProfile, region)
+        try:
+            callWithThrottleRetry(cf_client.delete_change_set, ChangeSetName=plan['ChangeSetId'])
+        except botocore.exceptions.ClientError as err:
+            log.warning(f'Could not delete change set {plan["ChangeSetId"]} in region: {region}, {err.response["Error"]["Message"]}', extra={'region': region})
+
+
+def executeChangeSet(userAwsProfile: str, region: str, regionPlan: dict, stackOutputJournal: StackOutputJournal) -> Union[dict,None]:
+    '''
+    executeChangeSet executes the change set planned for a region and waits for the update to finish
+
+    Args:
+        userAwsProfile (str): The users aws credentials profile for aws programmatic access
+        region (str): AWS region that the stack is in
+        regionPlan (dict): The region's plan from planRegionStack
+        stackOutputJournal (StackOutputJournal): The journal the updated stack id is recorded in
+
+    Returns:
+        Union[dict,None]: The updated stack id or none if an error was encountered
+    '''
+    action='AWS CLOUDFORMATION - ExecuteChangeSet'
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile, region)
+    log.info(f'Attempting to update S3 bucket in region: {region} ...', extra={'region': region, 'end': '' if serial_run else '\n'})
+    try:
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        callWithThrottleRetry(cf_client.execute_change_set, ChangeSetName=regionPlan['ChangeSetId'])
+        run_checkpoint.record(region, 'in-progress', regionPlan['StackId'], started_at)
+        stack_description = stack_watcher.waitForStack(cf_client, regionPlan['StackId'], region, since=started_at)
+        if stack_description['StackStatus'] != 'UPDATE_COMPLETE':
+            stackStatusMessage(stack_description, action)
+        if serial_run:
+            log.info(f'  {clr.LIGHTGREEN}Success!!\n{clr.RESET}updated Stack Id: {clr.LIGHTGREY}{regionPlan["StackId"]}{clr.RESET}\n', extra={'continuesLine': True})
+        stackOutputJournal.append(region, regionPlan['StackId'])
+        return {'StackId': regionPlan['StackId']}
+    except botocore.exceptions.ClientError as err:
+        return errMessage(err, action)
+    except TimeoutError as err:
+        stackStatusMessage({'StackStatus': 'WAIT_TIMED_OUT', 'StackStatusReason': f'{err}'}, action)
+
+
+def stackSetOperationPreferences() -> dict:
+    return {
+        'RegionConcurrencyType': 'PARALLEL',
+        'MaxConcurrentCount': max(args.max_concurrent_count, 1),
+        'FailureToleranceCount': max(args.failure_tolerance_count, 0),
+    }
+
+
+def waitForStackSetOperation(cf_client, stackSetName: str, operationId: str) -> dict:
+    delay = args.poll_min_delay
+    while True:
+        operation = cf_client.describe_stack_set_operation(StackSetName=stackSetName, OperationId=operationId)['StackSetOperation']
+        if operation['Status'] not in ('QUEUED', 'RUNNING', 'STOPPING'):
+            status_clr = clr.LIGHTGREEN if operation['Status'] == 'SUCCEEDED' else clr.LIGHTRED
+            log.info(f'  StackSet operation {clr.LIGHTGREY}{operationId}{clr.RESET} ({operation["Action"]}) {status_clr}{operation["Status"]}{clr.RESET} {operation.get("StatusReason", "")}')
+            return operation
+        time.sleep(delay)
+        delay = min(delay * 1.5, args.poll_max_delay)
+
+
+def listStackInstances(cf_client, stackSetName: str) -> list:
+    instances = []
+    request = {'StackSetName': stackSetName}
+    while True:
+        response = cf_client.list_stack_instances(**request)
+        instances += response.get('Summaries', [])
+        if 'NextToken' not in response:
+            return instances
+        request['NextToken'] = response['NextToken']
+
+
+def reportStackInstances(cf_client, stackSetName: str, regions: list, expectedStatus: str, stackOutputJournal: Union[StackOutputJournal,None] = None) -> list:
+    '''
+    reportStackInstances prints the status of the stack set's instance in each region, with one
+    ListStackInstances call per page of instances rather than a call per region
+
+    Args:
+        cf_client (botocore.client.BaseClient): The cloudformation client of the stack set's region
+        stackSetName (str): The name of the stack set
+        regions (list): AWS regions that were deployed to
+        expectedStatus (str): The instance detailed status of a successful region, or DELETED when the
+                              instance should be gone
+        stackOutputJournal (StackOutputJournal): If given, the stack id of each successful region is recorded in it
+
+    Returns:
+        list: The regions that did not reach the expected status
+    '''
+    instances = {instance['Region']: instance for instance in listStackInstances(cf_client, stackSetName)}
+    failed_regions = []
+    log.info(f'\n{clr.WHITE}StackSet {stackSetName} instances{clr.RESET}')
+    log.info(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    for region in regions:
+        instance = instances.get(region)
+        status = instance['StackInstanceStatus']['DetailedStatus'] if instance else 'DELETED'
+        if status != expectedStatus:
+            failed_regions.append(region)
+            status_clr = clr.LIGHTRED
+        else:
+            status_clr = clr.LIGHTGREEN
+            if stackOutputJournal is not None:
+                stackOutputJournal.append(region, instance['StackId'])
+        reason = f' {clr.LIGHTGREY}{instance["StatusReason"]}{clr.RESET}' if instance and instance.get('StatusReason') else ''
+        log.info(f'{clr.LIGHTBLUE}{region:<16}{clr.RESET} {status_clr}{status}{clr.RESET}{reason}')
+    log.info('')
+    return failed_regions
+
+
+def upsertStackSet(stack_action: str, userAwsProfile: str, regions: list, stackTemplate: dict, stackOutputJournal: StackOutputJournal) -> list:
+    '''
+    upsertStackSet creates or updates the stack set named stack_name and makes sure it has an instance in
+    every region. CloudFormation rolls the instances out itself, following the operation preferences
+
+    Args:
+        stack_action (str): create or update
+        userAwsProfile (str): The users aws credentials profile for aws programmatic access
+        regions (list): AWS regions the stack set should have an instance in
+        stackTemplate (dict): The template arguments, TemplateBody or TemplateURL
+        stackOutputJournal (StackOutputJournal): The journal the stack id of each instance is recorded in
+
+    Returns:
+        list: The regions whose instance did not deploy successfully
+    '''
+    action=f'AWS CLOUDFORMATION - {stack_action}StackSet'
+    # the stack set lives in the profile's own region, it deploys the instances to the other regions
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile)
+    log.info(f'Attempting to {stack_action} S3 bucket stack set {stack_name} in regions: {", ".join(regions)} ...')
+    try:
+        account_id = clientPool.getClient('sts', userAwsProfile).get_caller_identity()['Account']
+        missing_regions = regions
+        if stack_action == 'create':
+            callWithThrottleRetry(cf_client.create_stack_set, StackSetName=stack_name, **stackTemplate, Parameters=stack_parameters, Capabilities=['CAPABILITY_NAMED_IAM'])
+        else:
+            existing_regions = {instance['Region'] for instance in listStackInstances(cf_client, stack_name)}
+            missing_regions = [region for region in regions if region not in existing_regions]
+            if existing_regions:
+                operation = callWithThrottleRetry(cf_client.update_stack_set, StackSetName=stack_name, **stackTemplate, Parameters=stack_parameters,
+                                                  Capabilities=['CAPABILITY_NAMED_IAM'], OperationPreferences=stackSetOperationPreferences())
+                waitForStackSetOperation(cf_client, stack_name, operation['OperationId'])
+        if missing_regions:
+            operation = callWithThrottleRetry(cf_client.create_stack_instances, StackSetName=stack_name, Accounts=[account_id], Regions=missing_regions,
+                                              OperationPreferences=stackSetOperationPreferences())
+            waitForStackSetOperation(cf_client, stack_name, operation['OperationId'])
+        return reportStackInstances(cf_client, stack_name, regions, 'SUCCEEDED', stackOutputJournal)
+    except botocore.exceptions.ClientError as err:
+        errMessage(err, action)
+
+
+def deleteStackSet(userAwsProfile: str, regions: list) -> list:
+    '''
+    deleteStackSet deletes the stack set's instances in the given regions, and the stack set itself once
+    it has no instances left
+
+    Args:
+        userAwsProfile (str): The users aws credentials profile for aws programmatic access
+        regions (list): AWS regions to delete the stack set's instance in
+
+    Returns:
+        list: The regions whose instance could not be deleted
+    '''
+    action='AWS CLOUDFORMATION - DeleteStackSet'
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile)
+    log.info(f'Attempting to delete S3 bucket stack set {stack_name} in regions: {", ".join(regions)} ...')
+    try:
+        account_id = clientPool.getClient('sts', userAwsProfile).get_caller_identity()['Account']
+        if regions:
+            operation = callWithThrottleRetry(cf_client.delete_stack_instances, StackSetName=stack_name, Accounts=[account_id], Regions=regions,
+                                              RetainStacks=False, OperationPreferences=stackSetOperationPreferences())
+            waitForStackSetOperation(cf_client, stack_name, operation['OperationId'])
+        failed_regions = reportStackInstances(cf_client, stack_name, regions, 'DELETED')
+        if not listStackInstances(cf_client, stack_name):
+            callWithThrottleRetry(cf_client.delete_stack_set, StackSetName=stack_name)
+            log.info(f'  {clr.LIGHTGREEN}Success!!{clr.RESET} Deleted stack set: {clr.LIGHTGREY}{stack_name}{clr.RESET}\n')
+        return failed_regions
+    except botocore.exceptions.ClientError as err:
+        errMessage(err, action)
+
+
+def bucketStatus(s3Client, bucketName: str) -> str:
+    try:
+        s3Client.head_bucket(Bucket=bucketName)
+        return 'ok'
+    except botocore.exceptions.ClientError as err:
+        err_code = err.response['Error']['Code']
+        return {'404': 'missing', 'NoSuchBucket': 'missing', '403': 'forbidden'}.get(err_code, err_code)
+
+
+def describeRegionStacks(userAwsProfile: str, region: str) -> dict:
+    '''
+    describeRegionStacks lists the stacks of a region whose name starts with the stack name, with a
+    paginated DescribeStacks, and finds their buckets. Recent results are read from the status cache
+
+    Args:
+        userAwsProfile (str): The users aws credentials profile for aws programmatic access
+        region (str): AWS region to describe the stacks of
+
+    Returns:
+        dict: The region's stacks, each with its buckets. Their status is filled in by stackStatuses
+    '''
+    cached_status = readStatusCache(args.status_cache_ttl, userAwsProfile, region, stack_name)
+    if cached_status is not None:
+        cached_status['cached'] = True
+        return cached_status
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile, region)
+    region_status = {'region': region, 'stacks': [], 'cached': False}
+    # the per region stacks are named <stack_name>-<region>, stack set instances StackSet-<stack_name>-<id>
+    name_prefixes = (f'{stack_name}-', f'StackSet-{stack_name}-')
+    try:
+        request = {}
+        while True:
+            response = cf_client.describe_stacks(**request)
+            for stack in response.get('Stacks', []):
+                if not stack['StackName'].startswith(name_prefixes):
+                    continue
+                resources = cf_client.describe_stack_resources(StackName=stack['StackId'])['StackResources']
+                region_status['stacks'].append({
+                    'StackName': stack['StackName'],
+                    'StackId': stack['StackId'],
+                    'StackStatus': stack['StackStatus'],
+                    'LastUpdated': (stack.get('LastUpdatedTime') or stack['CreationTime']).isoformat(),
+                    'Buckets': [{'BucketName': resource['PhysicalResourceId'], 'Status': None}
+                                for resource in resources if resource['ResourceType'] == 'AWS::S3::Bucket' and resource.get('PhysicalResourceId')],
+                })
+            if 'NextToken' not in response:
+                break
+            request['NextToken'] = response['NextToken']
+    except botocore.exceptions.ClientError as err:
+        region_status['error'] = f'{err.response["Error"]["Code"]}: {err.response["Error"]["Message"]}'
+    return region_status
+
+
+def stackStatuses(userAwsProfile: str, regions: list) -> list:
+    '''
+    stackStatuses describes the stacks of every region concurrently, and checks each of their buckets with
+    HeadBucket as soon as its region has been described
+
+    Args:
+        userAwsProfile (str): The users aws credentials profile for aws programmatic access
+        regions (list): AWS regions to get the status of
+
+    Returns:
+        list: The status of each region, in the order of regions
+    '''
+    region_statuses = {}
+    max_workers = max(max_parallel, min(len(regions), 16), 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as region_executor, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as bucket_executor:
+        future_regions = [region_executor.submit(describeRegionStacks, userAwsProfile, region) for region in regions]
+        future_buckets = {}
+        for future in concurrent.futures.as_completed(future_regions):
+            region_status = future.result()
+            region_statuses[region_status['region']] = region_status
+            if region_status['cached']:
+                continue
+            s3_client = clientPool.getClient('s3', userAwsProfile, region_status['region'])
+            for stack in region_status['stacks']:
+                for bucket in stack['Buckets']:
+                    future_buckets[bucket_executor.submit(bucketStatus, s3_client, bucket['BucketName'])] = bucket
+        for future in concurrent.futures.as_completed(future_buckets):
+            future_buckets[future]['Status'] = future.result()
+    for region_status in region_statuses.values():
+        if not region_status['cached'] and 'error' not in region_status:
+            writeStatusCache(region_status, userAwsProfile, region_status['region'], stack_name)
+    return [region_statuses[region] for region in regions]
+
+
+def printStackStatuses(regionStatuses: list) -> None:
+    if args.output == 'json':
+        print(json.dumps(regionStatuses, indent=4))
+        return
+    log.info(f'\n{clr.WHITE}Stack status of {stack_name} in {country}{clr.RESET}')
+    log.info(f'{clr.DIV_SINGLE_LONG}{clr.RESET}')
+    log.info(f'{clr.PINK}{"region":<16}{"stack":<36}{"stack status":<24}{"bucket":<52}{"bucket":<10}{"last updated"}{clr.RESET}')
+    for region_status in regionStatuses:
+        cached = f' {clr.LIGHTGREY}(cached){clr.RESET}' if region_status['cached'] else ''
+        if 'error' in region_status:
+            log.info(f'{clr.LIGHTBLUE}{region_status["region"]:<16}{clr.RESET}{clr.LIGHTRED}{region_status["error"]}{clr.RESET}')
+            continue
+        if not region_status['stacks']:
+            log.info(f'{clr.LIGHTBLUE}{region_status["region"]:<16}{clr.RESET}{clr.LIGHTGREY}{"none":<36}{clr.RESET}{cached}')
+        for stack in region_status['stacks']:
+            stack_clr = clr.LIGHTGREEN if stack['StackStatus'].endswith('_COMPLETE') and 'ROLLBACK' not in stack['StackStatus'] else clr.LIGHTRED
+            if stack['StackStatus'].endswith('_IN_PROGRESS'):
+                stack_clr = clr.YELLOW
+            for bucket in stack['Buckets'] or [{'BucketName': '', 'Status': ''}]:
+                bucket_clr = clr.LIGHTGREEN if bucket['Status'] == 'ok' else clr.LIGHTRED
+                log.info(f'{clr.LIGHTBLUE}{region_status["region"]:<16}{clr.RESET}{stack["StackName"]:<36}{stack_clr}{stack["StackStatus"]:<24}{clr.RESET}'
+                      f'{bucket["BucketName"]:<52}{bucket_clr}{bucket["Status"] or "":<10}{clr.RESET}{stack["LastUpdated"][:19]}{cached}')
+    log.info('')
+
+
+def renderTemplate(templateText: str) -> str:
+    return cfnyaml.dump(cfnyaml.load(io.StringIO(templateText)))
+
+
+def reattachRegionStack(region: str, regionCheckpoint: dict, stackOutputJournal: Union[StackOutputJournal,None] = None) -> Union[dict,bool]:
+    '''
+    reattachRegionStack waits for a stack that a previous run started, but did not see finish, instead of
+    starting the stack action again
+
+    Args:
+        region (str): AWS region that the stack is in
+        regionCheckpoint (dict): The region's checkpointed state, with its StackId and started time
+        stackOutputJournal (StackOutputJournal): The journal the stack id is recorded in, the run's journal unless given
+
+    Returns:
+        Union[dict,bool]: The stack id for create and update, True for delete
+    '''
+    action=f'AWS CLOUDFORMATION - {s3_stack_action}Stack'
+    stack_id = regionCheckpoint['StackId']
+    cf_client = clientPool.getClient('cloudformation', user_aws_profile, region)
+    log.info(f'Re-attaching to the {s3_stack_action} of S3 bucket in region: {clr.LIGHTBLUE}{region}{clr.RESET} ...', extra={'region': region, 'end': '' if serial_run else '\n'})
+    try:
+        stack_description = stack_watcher.waitForStack(cf_client, stack_id, region, since=regionCheckpoint.get('started'))
+        if stack_description['StackStatus'] != f'{s3_stack_action.upper()}_COMPLETE':
+            stackStatusMessage(stack_description, action)
+        if serial_run:
+            log.info(f'  {clr.LIGHTGREEN}Success!!\n{clr.RESET}{s3_stack_action}d Stack Id: {clr.LIGHTGREY}{stack_id}{clr.RESET}\n', extra={'continuesLine': True})
+        if s3_stack_action == 'delete':
+            return True
+        (stackOutputJournal or stack_output_journal).append(region, stack_id)
+        return {'StackId': stack_id}
+    except botocore.exceptions.ClientError as err:
+        return errMessage(err, action)
+    except TimeoutError as err:
+        stackStatusMessage({'StackStatus': 'WAIT_TIMED_OUT', 'StackStatusReason': f'{err}'}, action)
+
+
+def manageRegionStack(region: str) -> Any:
+    '''
+    manageRegionStack runs the requested stack action (create, update or delete) for a single region,
+    recording the region's progress in the run checkpoint
+
+    Args:
+        region (str): AWS region to run the stack action in
+
+    Returns:
+        Any: The response of upsertStack or deleteStack for the region
+    '''
+    full_stack_name=f'{stack_name}-{region}'
+    region_checkpoint = run_checkpoint.state(region)
+    if region_checkpoint['state'] == 'done':
+        # finished by an earlier run, its stack id is carried over to this run's output file
+        log.info(f'Skipping region: {clr.LIGHTBLUE}{region}{clr.RESET}, already {s3_stack_action}d by the resumed run')
+        if s3_stack_action == 'delete':
+            return True
+        if region_checkpoint.get('StackId'):
+            stack_output_journal.append(region, region_checkpoint['StackId'])
+            return {'StackId': region_checkpoint['StackId']}
+        return None
+    try:
+        if region_checkpoint['state'] == 'in-progress' and region_checkpoint.get('StackId'):
+            response = reattachRegionStack(region, region_checkpoint)
+        elif s3_stack_action == 'delete':
+            region_stack_id = stack_ids[(region)]
+            response = deleteStack(user_aws_profile, region, region_stack_id)
+        elif diff_mode:
+            response = executeChangeSet(user_aws_profile, region, region_plans[region], stack_output_journal)
+        else:
+            response = upsertStack(s3_stack_action, user_aws_profile, region, full_stack_name, stack_template, stack_output_journal)
+    except SystemExit:
+        run_checkpoint.record(region, 'failed')
+        raise
+    run_checkpoint.record(region, 'done', response.get('StackId') if isinstance(response, dict) else None)
+    return response
+
+
+def reportRegionResult(region: str, response: Any, failed: bool = False) -> None:
+    if failed:
+        # errMessage has already reported the error, only this region is marked as failed
+        log.warning(f'{clr.LIGHTRED}Failed!!{clr.RESET} {s3_stack_action} in region: {clr.LIGHTBLUE}{region}{clr.RESET}\n', extra={'region': region, 'fields': {'result': 'failed'}})
+    elif isinstance(response, dict) and 'StackId' in response:
+        log.info(f'{clr.LIGHTGREEN}Success!!{clr.RESET} {s3_stack_action}d Stack Id: {clr.LIGHTGREY}{response["StackId"]}{clr.RESET}\n',
+                 extra={'region': region, 'fields': {'result': 'success', 'StackId': response['StackId']}})
+    elif s3_stack_action == 'delete':
+        log.info(f'{clr.LIGHTGREEN}Success!!{clr.RESET} Deleted Stack Id: {clr.LIGHTGREY}{stack_ids[(region)]}{clr.RESET}\n',
+                 extra={'region': region, 'fields': {'result': 'success', 'StackId': stack_ids[(region)]}})
+    else:
+        log.info(f'{clr.LIGHTGREEN}Done{clr.RESET} no changes made in region: {clr.LIGHTBLUE}{region}{clr.RESET}\n', extra={'region': region, 'fields': {'result': 'no-op'}})
+
+
+def manageRegionStacksInParallel(regions: list, maxParallel: int) -> dict:
+    '''
+    manageRegionStacksInParallel starts the stack action in all regions together, using up to maxParallel
+    worker threads, and reports the result of each region as soon as it finishes
+
+    Args:
+        regions (list): AWS regions to run the stack action in
+        maxParallel (int): The maximum number of regions being worked on at the same time
+
+    Returns:
+        dict: The outcome for each region, True if the stack action succeeded and False otherwise
+    '''
+    results={}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=maxParallel) as executor:
+        future_regions={executor.submit(manageRegionStack, region): region for region in regions}
+        for future in concurrent.futures.as_completed(future_regions):
+            region=future_regions[future]
+            try:
+                response=future.result()
+            except SystemExit:
+                results[region]=False
+                reportRegionResult(region, None, failed=True)
+                continue
+            results[region]=True
+            reportRegionResult(region, response)
+    return results
+
+
+def manifestStackName(entryName: str, region: str) -> str:
+    return f'{stack_name}-{entryName}-{region}'
+
+
+def findStackId(userAwsProfile: str, region: str, fullStackName: str) -> Union[str,None]:
+    # a --manifest delete looks its stacks up by name, there is no stack output file for it to read
+    cf_client = clientPool.getClient('cloudformation', userAwsProfile, region)
+    try:
+        return callWithThrottleRetry(cf_client.describe_stacks, StackName=fullStackName)['Stacks'][0]['StackId']
+    except botocore.exceptions.ClientError as err:
+        if 'does not exist' in err.response['Error']['Message']:
+            return None
+        errMessage(err, 'AWS CLOUDFORMATION - DescribeStacks')
+
+
+def printDeploymentPlan(deploymentGraph: dict) -> None:
+    # the stacks of each wave only need stacks of earlier waves, the regions run through the waves independently
+    waves = deploymentWaves(reverseGraph(deploymentGraph) if s3_stack_action == 'delete' else deploymentGraph)
+    log.info(f'{clr.WHITE}Deployment plan for {len(manifest_entries)} stacks in {len(country_regions)} regions{clr.RESET}')
+    log.info(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    for number, wave in enumerate(waves, start=1):
+        entry_names = sorted({splitGraphNode(node)[0] for node in wave})
+        log.info(f'{clr.PINK}wave {number}:{clr.RESET} {", ".join(entry_names)}', extra={'fields': {'wave': number, 'stacks': entry_names}})
+    log.info('')
+
+
+def manageGraphStack(node: str) -> bool:
+    '''
+    manageGraphStack runs the stack action for one stack of the --manifest in one region, once the stacks
+    it depends on are done. Its progress is checkpointed under the node, <manifest stack>/<region>
+
+    Args:
+        node (str): The deployment graph node to run
+
+    Returns:
+        bool: True if the stack action succeeded and False otherwise
+    '''
+    entry_name, region = splitGraphNode(node)
+    full_stack_name = manifestStackName(entry_name, region)
+    journal = manifest_journals[entry_name]
+    node_checkpoint = run_checkpoint.state(node)
+    if node_checkpoint['state'] == 'done':
+        log.info(f'Skipping {full_stack_name} in region: {clr.LIGHTBLUE}{region}{clr.RESET}, already {s3_stack_action}d by the resumed run')
+        if s3_stack_action != 'delete' and node_checkpoint.get('StackId'):
+            journal.append(region, node_checkpoint['StackId'])
+        return True
+    log.info(f'Starting {clr.WHITE}{full_stack_name}{clr.RESET} in region: {clr.LIGHTBLUE}{region}{clr.RESET}', extra={'region': region, 'fields': {'stack': entry_name}})
+    try:
+        if node_checkpoint['state'] == 'in-progress' and node_checkpoint.get('StackId'):
+            response = reattachRegionStack(region, node_checkpoint, journal)
+            if response is True:
+                response = {'StackId': node_checkpoint['StackId']}
+        elif s3_stack_action == 'delete':
+            # a stack that is not there (i.e. never created) has nothing to delete
+            stack_id = findStackId(user_aws_profile, region, full_stack_name)
+            if stack_id is not None:
+                deleteStack(user_aws_profile, region, stack_id, checkpointKey=node)
+            response = {'StackId': stack_id}
+        else:
+            response = upsertStack(s3_stack_action, user_aws_profile, region, full_stack_name, manifest_templates[entry_name], journal,
+                                   stackParameters=manifest_entries[entry_name]['parameters'], checkpointKey=node)
+    except SystemExit:
+        run_checkpoint.record(node, 'failed')
+        log.warning(f'{clr.LIGHTRED}Failed!!{clr.RESET} {s3_stack_action} of {full_stack_name} in region: {clr.LIGHTBLUE}{region}{clr.RESET}\n',
+                    extra={'region': region, 'fields': {'stack': entry_name, 'result': 'failed'}})
+        return False
+    stack_id = response.get('StackId') if isinstance(response, dict) else None
+    run_checkpoint.record(node, 'done', stack_id)
+    if stack_id is None:
+        result = 'no-op'
+        log.info(f'{clr.LIGHTGREEN}Done{clr.RESET} no changes made to {full_stack_name} in region: {clr.LIGHTBLUE}{region}{clr.RESET}\n',
+                 extra={'region': region, 'fields': {'stack': entry_name, 'result': result}})
+    else:
+        result = 'success'
+        log.info(f'{clr.LIGHTGREEN}Success!!{clr.RESET} {s3_stack_action}d {full_stack_name} Stack Id: {clr.LIGHTGREY}{stack_id}{clr.RESET}\n',
+                 extra={'region': region, 'fields': {'stack': entry_name, 'result': result, 'StackId': stack_id}})
+    return True
+
+
+async def upsertStackAsync(stack_action: str, userAwsProfile: str, region: str, fullStackName: str, stackTemplate: dict, stackOutputJournal: StackOutputJournal):
+    '''
+    upsertStackAsync is the --engine async form of upsertStack, the stack is created or updated and waited
+    on from the event loop
+    '''
+    action=f'AWS CLOUDFORMATION - {stack_action}Stack'
+    log.info(f'Attempting to {stack_action} S3 bucket in region: {region} ...', extra={'region': region})
+    try:
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        stack_id = await aws_engine.callWithThrottleRetry(
+            'cloudformation', userAwsProfile, region, f'{stack_action}_stack',
+            StackName=fullStackName,
+            **stackTemplate,
+            Parameters=stack_parameters,
+            DisableRollback=True,
+            TimeoutInMinutes=3,
+            Capabilities=['CAPABILITY_NAMED_IAM']
+        )
+        run_checkpoint.record(region, 'in-progress', stack_id['StackId'], started_at)
+        stack_description = await aws_engine.waitForStack(userAwsProfile, region, stack_id['StackId'], since=started_at, onEvent=printStackEvent,
+                                                          minDelay=args.poll_min_delay, maxDelay=args.poll_max_delay)
+        if stack_description['StackStatus'] != f'{stack_action.upper()}_COMPLETE':
+            stackStatusMessage(stack_description, action)
+        stackOutputJournal.append(region, stack_id['StackId'])
+        return stack_id
+    except botocore.exceptions.ClientError as err:
+        return errMessage(err, action)
+    except TimeoutError as err:
+        stackStatusMessage({'StackStatus': 'WAIT_TIMED_OUT', 'StackStatusReason': f'{err}'}, action)
+
+
+async def deleteStackAsync(userAwsProfile: str, region: str, stackId: str) -> Union[bool,None]:
+    '''
+    deleteStackAsync is the --engine async form of deleteStack. The buckets are emptied on the engine's
+    threads, the stack is deleted and waited on from the event loop
+    '''
+    action='AWS CLOUDFORMATION - DeleteStack'
+    log.info(f'Attempting to delete S3 bucket in region: {clr.LIGHTBLUE}{region}{clr.RESET} ...', extra={'region': region})
+    try:
+        if args.purge_buckets:
+            await aws_engine.runBlocking(lambda: purgeStackBuckets(clientPool.getClient('cloudformation', userAwsProfile, region), userAwsProfile, region, stackId))
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        await aws_engine.callWithThrottleRetry('cloudformation', userAwsProfile, region, 'delete_stack', StackName=stackId)
+        run_checkpoint.record(region, 'in-progress', stackId, started_at)
+        stack_description = await aws_engine.waitForStack(userAwsProfile, region, stackId, since=started_at, onEvent=printStackEvent,
+                                                          minDelay=args.poll_min_delay, maxDelay=args.poll_max_delay)
+        if stack_description['StackStatus'] != 'DELETE_COMPLETE':
+            stackStatusMessage(stack_description, action)
         return True
     except botocore.exceptions.ClientError as err:
         return errMessage(err, action)
+    except RuntimeError as err:
+        sys.exit(f'\n{clr.LIGHTRED}{err}. Exiting script{clr.RESET}\n')
+    except TimeoutError as err:
+        stackStatusMessage({'StackStatus': 'WAIT_TIMED_OUT', 'StackStatusReason': f'{err}'}, action)
+
+
+async def reattachRegionStackAsync(region: str, regionCheckpoint: dict) -> Union[dict,bool]:
+    action=f'AWS CLOUDFORMATION - {s3_stack_action}Stack'
+    stack_id = regionCheckpoint['StackId']
+    log.info(f'Re-attaching to the {s3_stack_action} of S3 bucket in region: {clr.LIGHTBLUE}{region}{clr.RESET} ...')
+    try:
+        stack_description = await aws_engine.waitForStack(user_aws_profile, region, stack_id, since=regionCheckpoint.get('started'), onEvent=printStackEvent,
+                                                          minDelay=args.poll_min_delay, maxDelay=args.poll_max_delay)
+        if stack_description['StackStatus'] != f'{s3_stack_action.upper()}_COMPLETE':
+            stackStatusMessage(stack_description, action)
+        if s3_stack_action == 'delete':
+            return True
+        stack_output_journal.append(region, stack_id)
+        return {'StackId': stack_id}
+    except botocore.exceptions.ClientError as err:
+        return errMessage(err, action)
+    except TimeoutError as err:
+        stackStatusMessage({'StackStatus': 'WAIT_TIMED_OUT', 'StackStatusReason': f'{err}'}, action)
+
+
+async def manageRegionStackAsync(region: str) -> Any:
+    '''
+    manageRegionStackAsync is the --engine async form of manageRegionStack
+    '''
+    region_checkpoint = run_checkpoint.state(region)
+    if region_checkpoint['state'] == 'done':
+        # a region finished by the resumed run makes no api calls
+        return manageRegionStack(region)
+    try:
+        if region_checkpoint['state'] == 'in-progress' and region_checkpoint.get('StackId'):
+            response = await reattachRegionStackAsync(region, region_checkpoint)
+        elif s3_stack_action == 'delete':
+            response = await deleteStackAsync(user_aws_profile, region, stack_ids[(region)])
+        else:
+            response = await upsertStackAsync(s3_stack_action, user_aws_profile, region, f'{stack_name}-{region}', stack_template, stack_output_journal)
+    except SystemExit:
+        run_checkpoint.record(region, 'failed')
+        raise
+    run_checkpoint.record(region, 'done', response.get('StackId') if isinstance(response, dict) else None)
+    return response
+
+
+async def manageRegionStacksAsync(regions: list, maxParallel: int) -> dict:
+    '''
+    manageRegionStacksAsync runs the stack action of up to maxParallel regions at the same time as
+    coroutines on one event loop, sharing one AsyncAwsEngine, and reports each region as it finishes
+
+    Args:
+        regions (list): AWS regions to run the stack action in
+        maxParallel (int): The maximum number of regions being worked on at the same time
+
+    Returns:
+        dict: The outcome for each region, True if the stack action succeeded and False otherwise
+    '''
+    global aws_engine
+    results = {}
+    region_slots = asyncio.Semaphore(maxParallel)
+
+    async def runRegion(region: str) -> None:
+        async with region_slots:
+            try:
+                response = await manageRegionStackAsync(region)
+            except SystemExit:
+                # a SystemExit leaving a task would stop the event loop, so it ends here with the region
+                results[region] = False
+                reportRegionResult(region, None, failed=True)
+                return
+            results[region] = True
+            reportRegionResult(region, response)
+
+    async with AsyncAwsEngine(clientPool, rate_limiter, maxThreads=args.max_pool_connections) as aws_engine:
+        await asyncio.gather(*(runRegion(region) for region in regions))
+    return results
 
 
 # execute the parse_args() method
 args = my_parser.parse_args()
 
+# the aws sdk and yaml modules are slow to import, they are only imported once the arguments are valid
+# so --help and argument errors return straight away
+import botocore.exceptions
+import concurrent.futures
+import cfnyaml
+from utils.awsClientPool import clientPool
+from utils.rateLimiter import RegionRateLimiter, callWithThrottleRetry
+from utils.bucketPurge import purgeBucket
+from utils.runCheckpoint import RunCheckpoint
+from utils.runLogger import startRunLogging, stopRunLogging
+from utils.statusCache import deleteStatusCache, readStatusCache, writeStatusCache
+from utils.stackWatcher import StackWatcher
+from utils.stackOutputJournal import StackOutputJournal, loadStackIds
+from utils.templateCache import getTemplateArgs, getTemplateBody
+from utils.templatePreflight import loadTemplate, preflightTemplate
+if args.manifest is not None:
+    from utils.deploymentGraph import (buildDeploymentGraph, deploymentWaves, loadDeploymentManifest, reverseGraph, runDeploymentGraph,
+                                       splitGraphNode)
+if args.engine == 'async':
+    import asyncio
+    from utils.asyncAws import AsyncAwsEngine
+if args.metrics or args.metrics_file:
+    from utils.awsMetrics import enableCallMetrics
+    enableCallMetrics(clientPool, printSummary=args.metrics, metricsFile=args.metrics_file)
+
+if args.manifest is not None and (args.stack_action == 'status' or args.stack_template is not None):
+    my_parser.error('--manifest is used in place of the stack_template argument, and not by status')
+if args.manifest is None and args.stack_action != 'status' and args.stack_template is None:
+    my_parser.error(f'the stack_template argument is required for {args.stack_action}')
+
+# the regions config is compiled and validated once, then read from its cached index until it changes
+try:
+    args.regions_file.close()
+    country, country_regions = countryRegions(loadRegionsIndex(args.regions_file.name, validate=not args.skip_region_validation), args.country)
+except (OSError, ValueError) as err:
+    my_parser.error(f'{err}')
+
+# each stack of a deployment manifest has its own template and parameters, read here so a bad manifest fails straight away
+manifest_entries = {}
+if args.manifest is not None:
+    try:
+        args.manifest.close()
+        manifest_entries = {entry['name']: entry for entry in loadDeploymentManifest(args.manifest.name)}
+    except (OSError, ValueError) as err:
+        my_parser.error(f'{err}')
+
 # assigning the input args
 s3_stack_action = args.stack_action
-country = args.country
 stack_name = args.stack_name
 raw_regions_file = args.regions_file
 raw_stack_template = args.stack_template
 user_aws_profile = args.user_aws_profile
+max_parallel = max(args.max_parallel, 1)
+async_engine = args.engine == 'async'
+manifest_mode = args.manifest is not None
+serial_run = max_parallel == 1 and not async_engine and not manifest_mode
+stackset_mode = args.mode == 'stackset'
+diff_mode = (args.diff or args.plan_only) and s3_stack_action == 'update'
+if manifest_mode and (stackset_mode or diff_mode or async_engine or args.parameters_file):
+    my_parser.error('--manifest is only supported with --mode stacks and --engine threads, without --diff, --plan_only and --parameters_file (each manifest stack has its own parameters)')
+if async_engine and (stackset_mode or diff_mode):
+    my_parser.error('--engine async is only supported with --mode stacks, without --diff and --plan_only')
+if stackset_mode and diff_mode:
+    my_parser.error('--diff and --plan_only are not supported with --mode stackset')
+if stackset_mode and args.purge_buckets:
+    my_parser.error('--purge_buckets is not supported with --mode stackset')
+stack_parameters = json.load(args.parameters_file) if args.parameters_file else []
+clientPool.setMaxPoolConnections(args.max_pool_connections or max(10, max_parallel))
+clientPool.setRetryConfig(args.max_attempts)
+rate_limiter = RegionRateLimiter(args.api_rate) if args.api_rate > 0 else None
+# the async engine takes the tokens itself, so waiting for one does not block its event loop
+if rate_limiter is not None and not async_engine:
+    clientPool.addClientHook(rate_limiter.instrument)
+stack_watcher = StackWatcher(onEvent=printStackEvent, minDelay=args.poll_min_delay, maxDelay=args.poll_max_delay)
 
 # creating logfile and s3_stack_output (if create or update) files
 rawDT = datetime.datetime.now()
 fmtDateTime = rawDT.strftime("%Y")+"-"+rawDT.strftime("%m")+"-"+rawDT.strftime("%d")+"_"+rawDT.strftime("%H")+"_"+rawDT.strftime("%M")+"_"+rawDT.strftime("%S")
-log_file=f'{pathlib.PurePath(os.path.basename(__file__)).stem}-{fmtDateTime}.txt'
+log_file=f'{pathlib.PurePath(os.path.basename(__file__)).stem}-{fmtDateTime}.jsonl'
 stack_output_file=f's3-buckets-{fmtDateTime}.json'
+stack_output_journal=StackOutputJournal(f's3-buckets-{fmtDateTime}.jsonl')
+# a --manifest run writes an output file per manifest stack, s3-buckets-<date>-<manifest stack>.json
+manifest_journals={entry_name: StackOutputJournal(f's3-buckets-{fmtDateTime}-{entry_name}.jsonl') for entry_name in manifest_entries}
+checkpoint_file=args.checkpoint_file or f's3-buckets-{stack_name}-{country}-{s3_stack_action}.checkpoint.jsonl'
+
+# progress goes to the terminal and, as json lines, to the log file, both written from a background thread
+log = startRunLogging('manageS3Buckets', log_file, args.verbose)
 
 # for debugging, verbose output of cli arguments and initial variables
 if args.verbose:
-    print(f'\n{clr.WHITE}Passed in arguments{clr.RESET}\n{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
-    print(f'{clr.PINK}s3_stack_action : {clr.LIGHTCYAN}{s3_stack_action}{clr.RESET}')
-    print(f'{clr.PINK}country ....... : {clr.LIGHTCYAN}{country}{clr.RESET}')
-    print(f'{clr.PINK}stack_name .... : {clr.LIGHTCYAN}{stack_name}{clr.RESET}')
-    print(f'{clr.PINK}raw_regions_file .. : {clr.LIGHTCYAN}{raw_regions_file}{clr.RESET}')
-    print(f'{clr.PINK}raw_stack_template. : {clr.LIGHTCYAN}{raw_stack_template}{clr.RESET}')
-    print(f'{clr.PINK}user_aws_profile: {clr.LIGHTCYAN}{user_aws_profile}{clr.RESET}')
-    print(f'\n{clr.WHITE}Output files and variables{clr.RESET}\n{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
-    print(f'{clr.PINK}fmtDateTime: {clr.LIGHTCYAN}{fmtDateTime}{clr.RESET}')
-    print(f'{clr.PINK}log_file: {clr.LIGHTCYAN}{log_file}{clr.RESET}')
-    print(f'{clr.PINK}stack_output_file: {clr.LIGHTCYAN}{stack_output_file}{clr.RESET}')
-
-all_regions = yaml.safe_load(raw_regions_file)
-country_regions = all_regions[(country)]
+    log.debug(f'\n{clr.WHITE}Passed in arguments{clr.RESET}\n{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    log.debug(f'{clr.PINK}s3_stack_action : {clr.LIGHTCYAN}{s3_stack_action}{clr.RESET}')
+    log.debug(f'{clr.PINK}country ....... : {clr.LIGHTCYAN}{country}{clr.RESET}')
+    log.debug(f'{clr.PINK}stack_name .... : {clr.LIGHTCYAN}{stack_name}{clr.RESET}')
+    log.debug(f'{clr.PINK}raw_regions_file .. : {clr.LIGHTCYAN}{raw_regions_file}{clr.RESET}')
+    log.debug(f'{clr.PINK}raw_stack_template. : {clr.LIGHTCYAN}{raw_stack_template}{clr.RESET}')
+    log.debug(f'{clr.PINK}user_aws_profile: {clr.LIGHTCYAN}{user_aws_profile}{clr.RESET}')
+    log.debug(f'{clr.PINK}max_parallel .. : {clr.LIGHTCYAN}{max_parallel}{clr.RESET}')
+    log.debug(f'{clr.PINK}mode .......... : {clr.LIGHTCYAN}{args.mode}{clr.RESET}')
+    log.debug(f'{clr.PINK}engine ........ : {clr.LIGHTCYAN}{args.engine}{clr.RESET}')
+    log.debug(f'{clr.PINK}manifest ...... : {clr.LIGHTCYAN}{args.manifest.name if manifest_mode else None}{clr.RESET}')
+    log.debug(f'\n{clr.WHITE}Output files and variables{clr.RESET}\n{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    log.debug(f'{clr.PINK}fmtDateTime: {clr.LIGHTCYAN}{fmtDateTime}{clr.RESET}')
+    log.debug(f'{clr.PINK}log_file: {clr.LIGHTCYAN}{log_file}{clr.RESET}')
+    log.debug(f'{clr.PINK}stack_output_file: {clr.LIGHTCYAN}{stack_output_file}{clr.RESET}')
+    log.debug(f'{clr.PINK}checkpoint_file: {clr.LIGHTCYAN}{checkpoint_file}{clr.RESET}')
+
+# status only reads what is deployed, it does not need a template, output file or checkpoint
+if s3_stack_action == 'status':
+    region_statuses = stackStatuses(user_aws_profile, country_regions)
+    printStackStatuses(region_statuses)
+    failed_regions = [region_status['region'] for region_status in region_statuses if 'error' in region_status]
+    if failed_regions:
+        sys.exit(f'\n{clr.LIGHTRED}Could not get the stack status of regions: {", ".join(failed_regions)}{clr.RESET}\n')
+    sys.exit(0)
+
 stack_ids = []
-stack_template = ''
-if s3_stack_action == 'delete':
-    stack_ids = json.load(raw_stack_template)
+stack_template = {}
+stack_template_body = ''
+manifest_templates = {}
+deployment_graph = {}
+if manifest_mode:
+    manifest_bodies = {entry_name: getTemplateBody(entry['templateText'], renderTemplate) for entry_name, entry in manifest_entries.items()}
+    if s3_stack_action != 'delete' and not args.skip_preflight:
+        preflight_problems = [f'{entry_name}: {problem}' for entry_name, entry in manifest_entries.items()
+                              for problem in preflightTemplate(manifest_bodies[entry_name], entry['parameters'], country_regions)]
+        if preflight_problems:
+            preflightFailed(preflight_problems)
+        log.debug(f'{clr.PINK}preflight ..... : {clr.LIGHTCYAN}{len(manifest_entries)} stacks in {len(country_regions)} regions ok{clr.RESET}')
+    # the order of the stacks is worked out from their templates for delete too, it is run in reverse
+    try:
+        deployment_graph = buildDeploymentGraph(list(manifest_entries.values()), {entry_name: loadTemplate(body) for entry_name, body in manifest_bodies.items()},
+                                                country_regions, manifestStackName)
+    except ValueError as err:
+        sys.exit(f'\n{clr.LIGHTRED}{err}. Exiting script{clr.RESET}\n')
+    if s3_stack_action != 'delete':
+        try:
+            manifest_templates = {entry_name: getTemplateArgs(body, clientPool.getClient('s3', user_aws_profile) if args.template_bucket else None, args.template_bucket)
+                                  for entry_name, body in manifest_bodies.items()}
+        except ValueError as err:
+            sys.exit(f'\n{clr.LIGHTRED}{err}. Use --template_bucket. Exiting script{clr.RESET}\n')
+        except botocore.exceptions.ClientError as err:
+            errMessage(err, 'AWS S3 - PutObject')
+elif s3_stack_action == 'delete':
+    stack_ids = loadStackIds(raw_stack_template)
 else:
-    stack_temp = cfnyaml.load(raw_stack_template)
-    stack_template = cfnyaml.dump(stack_temp)
+    # the parsed and re-serialized template is cached by content hash, unchanged templates skip the yaml round-trip
+    stack_template_body = getTemplateBody(raw_stack_template.read(), renderTemplate)
+    # a bad template or parameters file fails here, before a stack is started in any region
+    if not args.skip_preflight:
+        preflight_problems = preflightTemplate(stack_template_body, stack_parameters, country_regions)
+        if preflight_problems:
+            preflightFailed(preflight_problems)
+        log.debug(f'{clr.PINK}preflight ..... : {clr.LIGHTCYAN}{len(country_regions)} regions ok{clr.RESET}')
+    try:
+        stack_template = getTemplateArgs(stack_template_body, clientPool.getClient('s3', user_aws_profile) if args.template_bucket else None, args.template_bucket)
+    except ValueError as err:
+        sys.exit(f'\n{clr.LIGHTRED}{err}. Use --template_bucket. Exiting script{clr.RESET}\n')
+    except botocore.exceptions.ClientError as err:
+        errMessage(err, 'AWS S3 - PutObject')
+
+# the state of each region is checkpointed so a failed or interrupted run can be resumed. A stack set is
+# rolled out by cloudformation itself, so there is nothing to checkpoint
+run_checkpoint = None
+if not stackset_mode:
+    try:
+        # a --manifest run checkpoints each stack of each region, as <manifest stack>/<region>
+        checkpoint_run = {'action': s3_stack_action, 'stack_name': stack_name, 'country': country}
+        if manifest_mode:
+            checkpoint_run['manifest'] = os.path.abspath(args.manifest.name)
+        run_checkpoint = RunCheckpoint(checkpoint_file, checkpoint_run, list(deployment_graph) if manifest_mode else country_regions, args.resume)
+    except ValueError as err:
+        sys.exit(f'\n{clr.LIGHTRED}{err}. Exiting script{clr.RESET}\n')
+    if args.resume:
+        log.info(f'Resuming from {checkpoint_file}: {", ".join(f"{count} {state}" for state, count in run_checkpoint.counts().items())}')
 
 
 # for debugging, verbose output of transformed data values
 if args.verbose:
-    print(f'\n{clr.WHITE}Regions in Country{clr.RESET}')
-    print(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
-    print(f'{clr.PINK}country_regions= {clr.LIGHTCYAN}{country_regions}{clr.RESET}\n')
+    log.debug(f'\n{clr.WHITE}Regions in Country{clr.RESET}')
+    log.debug(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    log.debug(f'{clr.PINK}country_regions= {clr.LIGHTCYAN}{country_regions}{clr.RESET}\n')
 
 if (args.verbose and s3_stack_action == 'create'):
-    print(f'\n{clr.WHITE}Stack Template{clr.RESET}')
-    print(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
-    print(f'{clr.PINK}stack_template= {clr.LIGHTCYAN}{stack_template}{clr.RESET}\n')
+    log.debug(f'\n{clr.WHITE}Stack Template{clr.RESET}')
+    log.debug(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    log.debug(f'{clr.PINK}stack_template= {clr.LIGHTCYAN}{stack_template}{clr.RESET}\n')
 
 if (args.verbose and s3_stack_action == 'delete'):
-    print(f'\n{clr.WHITE}Stack Ids{clr.RESET}')
-    print(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
-    print(f'{clr.PINK}stack_ids= {clr.LIGHTCYAN}{stack_ids}{clr.RESET}\n')
+    log.debug(f'\n{clr.WHITE}Stack Ids{clr.RESET}')
+    log.debug(f'{clr.DIV_SINGLE_MEDIUM}{clr.RESET}')
+    log.debug(f'{clr.PINK}stack_ids= {clr.LIGHTCYAN}{stack_ids}{clr.RESET}\n')
 
-print()
-for region in country_regions:
-    full_stack_name=f'{stack_name}-{region}'
-    if s3_stack_action == 'delete':
-        region_stack_id = stack_ids[(region)]
-        response = deleteStack(user_aws_profile, region, region_stack_id)
+log.info('')
+run_completed = False
+try:
+    run_regions = country_regions
+    failed_regions = []
+    if stackset_mode:
+        # the regions are rolled out by cloudformation, as the instances of a single stack set
+        run_regions = []
+        if s3_stack_action == 'delete':
+            failed_regions = deleteStackSet(user_aws_profile, [region for region in country_regions if region in stack_ids])
+        else:
+            failed_regions = upsertStackSet(s3_stack_action, user_aws_profile, country_regions, stack_template, stack_output_journal)
+    elif diff_mode:
+        # only the regions whose deployed stack differs from the local template and parameters are updated
+        # regions a resumed run already got to are finished from the checkpoint rather than planned again
+        resumed_regions = [region for region in country_regions if run_checkpoint.state(region)['state'] in ('in-progress', 'done')]
+        planned_regions = [region for region in country_regions if region not in resumed_regions]
+        region_plans = planRegionStacks(planned_regions)
+        failed_regions = [region for region in planned_regions if region_plans[region]['action'] in ('missing', 'failed')]
+        run_regions = [] if args.plan_only else resumed_regions + [region for region in planned_regions if region_plans[region]['action'] == 'update']
+        if args.plan_only:
+            deletePlannedChangeSets(user_aws_profile, region_plans)
+    if manifest_mode:
+        # each stack starts as soon as the stacks it needs are done in its region, not when a whole wave is
+        printDeploymentPlan(deployment_graph)
+        graph_results = runDeploymentGraph(deployment_graph, manageGraphStack, max_parallel, reverse=s3_stack_action == 'delete')
+        for node in deployment_graph:
+            if graph_results.get(node) == 'skipped':
+                entry_name, region = splitGraphNode(node)
+                log.warning(f'{clr.YELLOW}Skipped{clr.RESET} {manifestStackName(entry_name, region)} in region: {clr.LIGHTBLUE}{region}{clr.RESET}, a stack it needs did not {s3_stack_action}',
+                            extra={'region': region, 'fields': {'stack': entry_name, 'result': 'skipped'}})
+        failed_regions = [node for node in deployment_graph if graph_results.get(node) != 'done']
+    elif async_engine:
+        region_results = asyncio.run(manageRegionStacksAsync(run_regions, max_parallel))
+        failed_regions += [region for region in run_regions if not region_results.get(region)]
+    elif serial_run:
+        for region in run_regions:
+            response = manageRegionStack(region)
+            # print(f'{full_stack_name}\'s StackId= {response["StackId"]}\n')
     else:
-        response = upsertStack(s3_stack_action, user_aws_profile, region, full_stack_name, stack_template, stack_output_file)
-        # print(f'{full_stack_name}\'s StackId= {response["StackId"]}\n')
+        region_results = manageRegionStacksInParallel(run_regions, max_parallel)
+        failed_regions += [region for region in run_regions if not region_results.get(region)]
+    run_completed = True
+finally:
+    stack_watcher.stop()
+    # the journal is compacted into the {region: StackId} file that the delete action reads
+    if stack_output_journal.entries:
+        stack_output_journal.compact(stack_output_file)
+        os.remove(stack_output_journal.journalFile)
+    for entry_name, journal in manifest_journals.items():
+        if journal.entries:
+            journal.compact(f's3-buckets-{fmtDateTime}-{entry_name}.json')
+            os.remove(journal.journalFile)
+    if run_checkpoint is not None:
+        if run_completed and not failed_regions and not args.plan_only:
+            run_checkpoint.remove()
+        else:
+            run_checkpoint.close()
+            log.info(f'\nThe state of each region is saved in {clr.LIGHTGREY}{checkpoint_file}{clr.RESET}, rerun with --resume to continue from where this run stopped')
+    # the stacks of the run's regions were changed (even by a run that failed part way), so a status
+    # cached before the run no longer describes them
+    if not args.plan_only:
+        for region in country_regions:
+            deleteStatusCache(user_aws_profile, region, stack_name)
+    # the queued log lines are written out before the exit message
+    stopRunLogging()
+if failed_regions:
+    sys.exit(f'\n{clr.LIGHTRED}Stack {s3_stack_action} failed in {"stacks" if manifest_mode else "regions"}: {", ".join(failed_regions)}. Exiting script{clr.RESET}\n')
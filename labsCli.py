@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# ===========================================================================================================
+# Description:
+#     A single entry point for the lab scripts. Each subcommand runs its script with the remaining
+#     arguments, and nothing heavier than argparse is imported until a subcommand has been chosen
+#
+# Usage and Arguments:
+#  - labsCli.py stacks <manageS3Buckets arguments>     create, update or delete the regional s3 stacks
+#  - labsCli.py creds <setTempSessionCreds arguments>  refresh the temporary mfa session credentials
+#  - labsCli.py importtime [--max_ms N]                report the startup import time of the subcommands
+#
+# ===========================================================================================================
+
+import argparse, os, runpy, sys
+
+REPO_DIR = os.path.dirname(os.path.realpath(__file__))
+
+SUBCOMMAND_SCRIPTS = {
+    'stacks': os.path.join(REPO_DIR, '01-cloudformation', 'manageS3Buckets.py'),
+    'creds': os.path.join(REPO_DIR, '00-dev-environment', 'setTempSessionCreds.py'),
+    'importtime': os.path.join(REPO_DIR, 'utils', 'importTimeBench.py'),
+}
+
+# create the commandline parser
+my_parser = argparse.ArgumentParser(prog='labsCli',
+                                    usage='%(prog)s [-h] {stacks,creds,importtime} ...',
+                                    description='Run the stelligent-u lab scripts from one command')
+
+# adding cli arguments
+my_parser.add_argument('subcommand',
+                       metavar='subcommand',
+                       type=str,
+                       choices=list(SUBCOMMAND_SCRIPTS),
+                       help='The lab script to run. Options are one of [ stacks, creds, importtime ]')
+
+my_parser.add_argument('script_args',
+                       metavar='...',
+                       nargs=argparse.REMAINDER,
+                       help='The arguments passed to the subcommand, use "<subcommand> -h" for its help')
+
+
+def main(argv: list = None) -> None:
+    args = my_parser.parse_args(argv)
+    script = SUBCOMMAND_SCRIPTS[args.subcommand]
+    # the script runs as if it was called directly, so its own argument parsing and --help apply
+    sys.argv = [script] + args.script_args
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
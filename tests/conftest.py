@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# appending the path so that packages can be imported from a parent level
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def cacheHome(tmp_path, monkeypatch):
+    # the preflight and status caches are written under XDG_CACHE_HOME, never the user's own cache
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
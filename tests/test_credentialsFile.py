@@ -0,0 +1,56 @@
+import os
+import threading
+
+from utils.credentialsFile import updateProfile, updateProfileLines, updateProfiles
+
+
+def test_updateProfileLines_only_changes_the_target_section():
+    lines = ['[default]\n', 'aws_access_key_id = AKIADEFAULT\n', '\n',
+             '[mfa]\n', '# a comment\n', 'aws_access_key_id = OLD\n', 'region = us-east-1\n', '\n',
+             '[other]\n', 'aws_access_key_id = AKIAOTHER\n']
+    updated = updateProfileLines(lines, 'mfa', {'aws_access_key_id': 'NEW', 'aws_session_token': 'TOKEN'})
+    assert updated == ['[default]\n', 'aws_access_key_id = AKIADEFAULT\n', '\n',
+                       '[mfa]\n', '# a comment\n', 'aws_access_key_id = NEW\n', 'region = us-east-1\n', 'aws_session_token = TOKEN\n', '\n',
+                       '[other]\n', 'aws_access_key_id = AKIAOTHER\n']
+
+
+def test_updateProfileLines_drops_the_continuation_lines_of_a_replaced_value():
+    lines = ['[mfa]\n', 'aws_session_token = FIRST\n', '    CONTINUED\n', 'region = us-east-1\n']
+    assert updateProfileLines(lines, 'mfa', {'aws_session_token': 'TOKEN'}) == ['[mfa]\n', 'aws_session_token = TOKEN\n', 'region = us-east-1\n']
+
+
+def test_updateProfileLines_adds_a_missing_section_at_the_end():
+    lines = ['[default]\n', 'region = us-east-1']
+    assert updateProfileLines(lines, 'mfa', {'region': 'eu-west-1'}) == ['[default]\n', 'region = us-east-1\n', '\n', '[mfa]\n', 'region = eu-west-1\n']
+
+
+def test_updateProfiles_writes_only_when_something_changed(tmp_path):
+    credentials_file = tmp_path / 'credentials'
+    credentials_file.write_text('[default]\nregion = us-east-1\n')
+    os.chmod(credentials_file, 0o640)
+    assert updateProfiles(str(credentials_file), {'mfa': {'aws_session_token': 'TOKEN'}, 'default': {'region': 'us-east-1'}})
+    assert credentials_file.read_text() == '[default]\nregion = us-east-1\n\n[mfa]\naws_session_token = TOKEN\n'
+    assert os.stat(credentials_file).st_mode & 0o777 == 0o640
+    modified = os.stat(credentials_file).st_mtime_ns
+    assert not updateProfile(str(credentials_file), 'mfa', {'aws_session_token': 'TOKEN'})
+    assert os.stat(credentials_file).st_mtime_ns == modified
+    assert sorted(os.listdir(tmp_path)) == ['credentials', 'credentials.lock']
+
+
+def test_updateProfiles_creates_a_private_file(tmp_path):
+    credentials_file = tmp_path / 'credentials'
+    assert updateProfile(str(credentials_file), 'mfa', {'region': 'us-east-1'})
+    assert os.stat(credentials_file).st_mode & 0o777 == 0o600
+
+
+def test_concurrent_updates_of_different_profiles_are_all_kept(tmp_path):
+    credentials_file = str(tmp_path / 'credentials')
+    threads = [threading.Thread(target=updateProfile, args=(credentials_file, f'profile-{index}', {'aws_session_token': f'TOKEN{index}'}))
+               for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(credentials_file, 'r') as credsFile:
+        text = credsFile.read()
+    assert all(f'[profile-{index}]\naws_session_token = TOKEN{index}\n' in text for index in range(20))
@@ -0,0 +1,160 @@
+import threading
+
+import pytest
+
+from utils.deploymentGraph import (buildDeploymentGraph, deploymentWaves, loadDeploymentManifest, reverseGraph, runDeploymentGraph,
+                                   stackInterface)
+from utils.templatePreflight import loadTemplate
+
+EXPORTER = '''
+Resources:
+  policy:
+    Type: AWS::IAM::ManagedPolicy
+    Properties:
+      PolicyDocument: {}
+Outputs:
+  policyArn:
+    Value: !Ref policy
+    Export:
+      Name: !Sub ${AWS::StackName}-arn
+'''
+
+IMPORTER = '''
+Parameters:
+  exportName:
+    Type: String
+Resources:
+  role:
+    Type: AWS::IAM::Role
+    Properties:
+      ManagedPolicyArns:
+        - !ImportValue
+          Ref: exportName
+  ssmParam:
+    Type: AWS::SSM::Parameter
+    Properties:
+      Name: /labs/role
+      Type: String
+      Value: !Ref role
+'''
+
+SSM_READER = '''
+Parameters:
+  roleName:
+    Type: AWS::SSM::Parameter::Value<String>
+    Default: /labs/role
+Resources:
+  bucket:
+    Type: AWS::S3::Bucket
+    Properties:
+      Tags:
+        - Key: owner
+          Value: '{{resolve:ssm:/labs/owner}}'
+'''
+
+
+def stackNameFor(name: str, region: str) -> str:
+    return f'labs-{name}-{region}'
+
+
+def manifestEntries() -> tuple:
+    entries = [
+        {'name': 'reader', 'depends_on': [], 'parameters': []},
+        {'name': 'importer', 'depends_on': [], 'parameters': [{'ParameterKey': 'exportName', 'ParameterValue': 'labs-exporter-us-east-1-arn'}]},
+        {'name': 'exporter', 'depends_on': [], 'parameters': []},
+    ]
+    templates = {'exporter': loadTemplate(EXPORTER), 'importer': loadTemplate(IMPORTER), 'reader': loadTemplate(SSM_READER)}
+    return entries, templates
+
+
+def test_stackInterface_finds_what_a_stack_shares():
+    entries, templates = manifestEntries()
+    assert stackInterface(templates['exporter'], [], 'us-east-1', 'labs-exporter-us-east-1')['exports'] == ['labs-exporter-us-east-1-arn']
+    importer = stackInterface(templates['importer'], entries[1]['parameters'], 'us-east-1', 'labs-importer-us-east-1')
+    assert importer == {'exports': [], 'imports': ['labs-exporter-us-east-1-arn'], 'ssmWrites': ['/labs/role'], 'ssmReads': []}
+    assert stackInterface(templates['reader'], [], 'us-east-1', 'labs-reader-us-east-1')['ssmReads'] == ['/labs/owner', '/labs/role']
+
+
+def test_the_waves_follow_the_exports_and_ssm_parameters():
+    entries, templates = manifestEntries()
+    graph = buildDeploymentGraph(entries, templates, ['us-east-1'], stackNameFor)
+    assert graph == {'exporter/us-east-1': set(), 'importer/us-east-1': {'exporter/us-east-1'}, 'reader/us-east-1': {'importer/us-east-1'}}
+    assert deploymentWaves(graph) == [['exporter/us-east-1'], ['importer/us-east-1'], ['reader/us-east-1']]
+    assert deploymentWaves(reverseGraph(graph)) == [['reader/us-east-1'], ['importer/us-east-1'], ['exporter/us-east-1']]
+
+
+def test_regions_do_not_depend_on_each_other():
+    entries, templates = manifestEntries()
+    entries[1]['parameters'] = []
+    entries[0]['depends_on'] = ['exporter']
+    graph = buildDeploymentGraph(entries, templates, ['us-east-1', 'eu-west-1'], stackNameFor)
+    assert deploymentWaves(graph) == [['exporter/eu-west-1', 'exporter/us-east-1', 'importer/eu-west-1', 'importer/us-east-1'],
+                                      ['reader/eu-west-1', 'reader/us-east-1']]
+
+
+def test_a_cycle_is_rejected():
+    entries, templates = manifestEntries()
+    entries[2]['depends_on'] = ['reader']
+    with pytest.raises(ValueError, match='cycle'):
+        buildDeploymentGraph(entries, templates, ['us-east-1'], stackNameFor)
+
+
+def test_two_stacks_creating_the_same_export_are_rejected():
+    entries, templates = manifestEntries()
+    templates['reader'] = templates['exporter']
+    stack_name_for = lambda name, region: 'labs-exporter-us-east-1' if name in ('exporter', 'reader') else stackNameFor(name, region)
+    with pytest.raises(ValueError, match='created by both'):
+        buildDeploymentGraph(entries, templates, ['us-east-1'], stack_name_for)
+
+
+def test_runDeploymentGraph_skips_the_dependents_of_a_failed_stack():
+    graph = {'a/r1': set(), 'b/r1': {'a/r1'}, 'c/r1': {'b/r1'}, 'a/r2': set(), 'b/r2': {'a/r2'}, 'c/r2': {'b/r2'}}
+    started = []
+    lock = threading.Lock()
+
+    def runNode(node: str) -> bool:
+        with lock:
+            started.append(node)
+        return node != 'b/r1'
+
+    results = runDeploymentGraph(graph, runNode, maxParallel=4)
+    assert results == {'a/r1': 'done', 'b/r1': 'failed', 'c/r1': 'skipped', 'a/r2': 'done', 'b/r2': 'done', 'c/r2': 'done'}
+    assert 'c/r1' not in started
+    assert started.index('b/r2') > started.index('a/r2') and started.index('c/r2') > started.index('b/r2')
+
+
+def test_runDeploymentGraph_deletes_in_reverse():
+    graph = {'a/r1': set(), 'b/r1': {'a/r1'}}
+    order = []
+    runDeploymentGraph(graph, lambda node: order.append(node) or True, maxParallel=1, reverse=True)
+    assert order == ['b/r1', 'a/r1']
+
+
+def test_loadDeploymentManifest_lists_every_problem(tmp_path):
+    (tmp_path / 'exporter.yaml').write_text(EXPORTER)
+    manifest_file = tmp_path / 'manifest.yaml'
+    manifest_file.write_text('stacks:\n'
+                             '  - name: exporter\n    template: exporter.yaml\n'
+                             '  - name: exporter\n    template: exporter.yaml\n'
+                             '  - name: 1bad\n    template: exporter.yaml\n'
+                             '  - name: missing\n    template: missing.yaml\n'
+                             '  - name: needy\n    template: exporter.yaml\n    depends_on: nowhere\n')
+    with pytest.raises(ValueError) as err:
+        loadDeploymentManifest(str(manifest_file))
+    message = f'{err.value}'
+    assert 'stack exporter is listed more than once' in message
+    assert 'stack name 1bad must start with a letter' in message
+    assert 'stack missing:' in message
+    assert 'stack needy depends on nowhere, which is not in the manifest' in message
+
+
+def test_loadDeploymentManifest_reads_templates_relative_to_the_manifest(tmp_path):
+    (tmp_path / 'templates').mkdir()
+    (tmp_path / 'templates' / 'exporter.yaml').write_text(EXPORTER)
+    (tmp_path / 'params.json').write_text('[{"ParameterKey": "key", "ParameterValue": "value"}]')
+    manifest_file = tmp_path / 'manifest.yaml'
+    manifest_file.write_text('stacks:\n  - name: exporter\n    template: templates/exporter.yaml\n    parameters: params.json\n')
+    entry, = loadDeploymentManifest(str(manifest_file))
+    assert entry['templateText'] == EXPORTER
+    assert entry['parameters'] == [{'ParameterKey': 'key', 'ParameterValue': 'value'}]
+    assert entry['depends_on'] == []
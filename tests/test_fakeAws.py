@@ -0,0 +1,175 @@
+import contextlib
+import glob
+import io
+import json
+import os
+import runpy
+import sys
+
+import botocore.exceptions
+import pytest
+
+from utils.fakeAws import FakeAwsAccount
+from utils.awsClientPool import AwsClientPool, clientPool
+from utils.awsMetrics import AwsCallMetrics
+from utils.rateLimiter import RegionRateLimiter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+EXPORTER = '''
+Resources:
+  bucket:
+    Type: AWS::S3::Bucket
+Outputs:
+  bucketName:
+    Value: !Ref bucket
+    Export:
+      Name: labs-bucket-name
+'''
+
+IMPORTER = '''
+Resources:
+  bucket:
+    Type: AWS::S3::Bucket
+    Properties:
+      Tags:
+        - Key: source
+          Value: !ImportValue labs-bucket-name
+'''
+
+
+@pytest.fixture
+def account():
+    return FakeAwsAccount(stackLatency=0.0)
+
+
+@pytest.fixture
+def pool(account):
+    pool = AwsClientPool()
+    pool.setClientFactory(account.client)
+    return pool
+
+
+def test_the_metrics_and_rate_limiter_hooks_see_every_call(account, pool):
+    call_metrics = AwsCallMetrics()
+    rate_limiter = RegionRateLimiter(rate=5.0, burst=10.0)
+    pool.addClientHook(call_metrics.instrument)
+    pool.addClientHook(rate_limiter.instrument)
+    cf_client = pool.getClient('cloudformation', regionName='us-east-1')
+    cf_client.create_stack(StackName='labs', TemplateBody=EXPORTER)
+    with pytest.raises(botocore.exceptions.ClientError):
+        cf_client.describe_stacks(StackName='missing')
+    pool.getClient('sts', regionName='us-east-1').get_caller_identity()
+
+    rows = {(row['service'], row['operation']): row for row in call_metrics.summaryRows()}
+    assert rows[('cloudformation', 'CreateStack')]['calls'] == 1
+    assert rows[('cloudformation', 'DescribeStacks')]['errors'] == 1
+    assert rows[('cloudformation', 'DescribeStacks')]['http_statuses'] == {'400': 1}
+    assert rows[('sts', 'GetCallerIdentity')]['calls'] == 1
+    assert account.totalApiCalls() == 3
+    # only the cloudformation calls take a token
+    assert rate_limiter.bucketFor('us-east-1').tokens == pytest.approx(8.0, abs=0.1)
+
+
+def test_clearClientHooks_stops_hooks_piling_up(pool):
+    first_metrics, second_metrics = AwsCallMetrics(), AwsCallMetrics()
+    pool.addClientHook(first_metrics.instrument)
+    pool.getClient('sts').get_caller_identity()
+    pool.clearClientHooks()
+    pool.addClientHook(second_metrics.instrument)
+    pool.getClient('sts').get_caller_identity()
+    assert [row['calls'] for row in first_metrics.summaryRows()] == [1]
+    assert [row['calls'] for row in second_metrics.summaryRows()] == [1]
+
+
+def test_a_stack_fails_to_create_until_its_import_exists(account, pool):
+    cf_client = pool.getClient('cloudformation', regionName='us-east-1')
+    cf_client.create_stack(StackName='importer', TemplateBody=IMPORTER)
+    importer = cf_client.describe_stacks(StackName='importer')['Stacks'][0]
+    assert importer['StackStatus'] == 'CREATE_FAILED'
+    assert importer['StackStatusReason'] == 'No export named labs-bucket-name found'
+
+    cf_client.create_stack(StackName='exporter', TemplateBody=EXPORTER)
+    assert [export['Name'] for export in cf_client.list_exports()['Exports']] == ['labs-bucket-name']
+    # an export only exists in its own region
+    assert pool.getClient('cloudformation', regionName='eu-west-1').list_exports()['Exports'] == []
+    cf_client.delete_stack(StackName='importer')
+    cf_client.create_stack(StackName='importer', TemplateBody=IMPORTER)
+    assert cf_client.describe_stacks(StackName='importer')['Stacks'][0]['StackStatus'] == 'CREATE_COMPLETE'
+
+    cf_client.delete_stack(StackName='exporter')
+    exporter = cf_client.describe_stacks(StackName='exporter')['Stacks'][0]
+    assert exporter['StackStatus'] == 'DELETE_FAILED'
+    assert exporter['StackStatusReason'] == 'Export labs-bucket-name cannot be deleted as it is in use by importer'
+
+
+def runManageS3Buckets(scriptArgs: list) -> str:
+    script = os.path.join(REPO_DIR, '01-cloudformation', 'manageS3Buckets.py')
+    sys.argv = [script] + scriptArgs
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            runpy.run_path(script, run_name='__main__')
+        except SystemExit as err:
+            assert err.code in (None, 0), output.getvalue()
+        finally:
+            clientPool.clearClientHooks()
+    return output.getvalue()
+
+
+@pytest.fixture
+def scriptRun(account, tmp_path, monkeypatch):
+    # manageS3Buckets.py runs in tmp_path, against the stand-in, for the two regions of usa
+    pytest.importorskip('cfnyaml')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', list(sys.argv))
+    (tmp_path / 'regions-config.yaml').write_text('usa:\n  - us-east-1\n  - us-west-2\n')
+    clientPool.setClientFactory(account.client)
+    yield
+    clientPool.setClientFactory(None)
+
+
+COMMON_ARGS = ['usa', 'labs', 'regions-config.yaml']
+FAST_POLLS = ['--skip_region_validation', '--poll_min_delay', '0.01', '--poll_max_delay', '0.01']
+MINIMAL_TEMPLATE = os.path.join(REPO_DIR, '01-cloudformation', 'lab111-s3-minimal.yaml')
+
+
+def test_manageS3Buckets_creates_and_deletes_a_stack_in_every_region(account, scriptRun):
+    status_args = ['--skip_region_validation', '--output', 'json', '--status_cache_ttl', '60']
+    stack_count = lambda: sum(len(region_status['stacks']) for region_status in json.loads(runManageS3Buckets(['status'] + COMMON_ARGS + status_args)))
+    assert stack_count() == 0
+    runManageS3Buckets(['create'] + COMMON_ARGS + [MINIMAL_TEMPLATE] + FAST_POLLS)
+    assert sorted(stack.stackId.split(':')[3] for stack in account.stacks.values() if stack.status() == 'CREATE_COMPLETE') == ['us-east-1', 'us-west-2']
+    # the status cached before the create is dropped by it
+    assert stack_count() == 2
+
+    runManageS3Buckets(['delete'] + COMMON_ARGS + [glob.glob('s3-buckets-*.json')[0]] + FAST_POLLS)
+    assert {stack.status() for stack in account.stacks.values()} == {'DELETE_COMPLETE'}
+    assert stack_count() == 0
+
+
+def test_manageS3Buckets_diff_only_updates_the_stacks_that_changed(account, scriptRun, tmp_path):
+    runManageS3Buckets(['create'] + COMMON_ARGS + [MINIMAL_TEMPLATE] + FAST_POLLS)
+    changed_template = tmp_path / 'lab111-versioned.yaml'
+    with open(MINIMAL_TEMPLATE, 'r') as template:
+        changed_template.write_text(template.read() + '    Properties:\n      VersioningConfiguration:\n        Status: Enabled\n')
+    stacks = list(account.stacks.values())
+
+    # --plan_only plans the update without making it, and leaves no change set behind
+    output = runManageS3Buckets(['update'] + COMMON_ARGS + [str(changed_template), '--plan_only'] + FAST_POLLS)
+    assert output.count('update') >= 2 and 'Modify s3Bucket' in output
+    assert [stack.operation for stack in stacks] == ['CREATE', 'CREATE']
+    assert [stack.changeSets for stack in stacks] == [{}, {}]
+
+    output = runManageS3Buckets(['update'] + COMMON_ARGS + [str(changed_template), '--diff'] + FAST_POLLS)
+    # one region at a time, each result is printed on its "Attempting to ..." line
+    assert 'Attempting to update S3 bucket in region: us-east-1 ...  Success!!' in output
+    assert [(stack.operation, stack.status()) for stack in stacks] == [('UPDATE', 'UPDATE_COMPLETE'), ('UPDATE', 'UPDATE_COMPLETE')]
+    assert all('VersioningConfiguration' in stack.templateBody for stack in stacks)
+
+    # nothing differs any more, so no region is updated again
+    for stack in stacks:
+        stack.operation = 'CREATE'
+    output = runManageS3Buckets(['update'] + COMMON_ARGS + [str(changed_template), '--diff'] + FAST_POLLS)
+    assert output.count('no-op') == 2
+    assert [stack.operation for stack in stacks] == ['CREATE', 'CREATE']
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from utils.regionsConfig import cachedRegionsIndex, compileRegionsConfig, countryRegions, indexFile, loadRegionsIndex
+
+CONFIG = {
+    'usa': ['us-east-1', 'us-east-2', 'us-west-2'],
+    'canada': ['ca-central-1'],
+    'groups': {
+        'north-america': ['usa', 'canada', 'us-east-1'],
+        'east': {'include': ['north-america'], 'exclude': ['us-west-2']},
+    },
+    'aliases': {'us': 'usa'},
+    'exclude': ['us-east-2'],
+}
+
+
+def test_groups_are_expanded_without_duplicates_or_excluded_regions():
+    index = compileRegionsConfig(CONFIG)
+    assert index['countries']['usa'] == ['us-east-1', 'us-west-2']
+    assert index['countries']['north-america'] == ['us-east-1', 'us-west-2', 'ca-central-1']
+    assert index['countries']['east'] == ['us-east-1', 'ca-central-1']
+    assert index['choices'] == ['canada', 'east', 'north-america', 'usa', 'us']
+
+
+def test_every_problem_is_reported():
+    config = {'usa': ['us-east-1', 'us-fake-1'], 'groups': {'loop': ['loop'], 'usa': ['usa']}, 'aliases': {'x': 'nowhere'}}
+    with pytest.raises(ValueError) as err:
+        compileRegionsConfig(config, validRegions={'us-east-1'})
+    message = f'{err.value}'
+    assert 'group loop includes itself' in message
+    assert 'group usa has the same name as a country' in message
+    assert 'alias x is for nowhere' in message
+    assert 'usa lists regions that do not exist: us-fake-1' in message
+
+
+def test_countryRegions_resolves_aliases():
+    index = compileRegionsConfig(CONFIG)
+    assert countryRegions(index, 'us') == ('usa', ['us-east-1', 'us-west-2'])
+    with pytest.raises(ValueError, match='invalid choice'):
+        countryRegions(index, 'mexico')
+
+
+def test_the_index_is_cached_until_the_config_changes(tmp_path):
+    config_file = tmp_path / 'regions-config.yaml'
+    config_file.write_text('usa:\n  - us-east-1\n')
+    assert cachedRegionsIndex(str(config_file)) is None
+    assert loadRegionsIndex(str(config_file), validate=False)['countries'] == {'usa': ['us-east-1']}
+    assert cachedRegionsIndex(str(config_file)) == cachedRegionsIndex(str(config_file), validate=False)
+    assert cachedRegionsIndex(str(config_file), validate=True) is None
+
+    config_file.write_text('usa:\n  - us-east-1\n  - us-west-2\n')
+    os.utime(config_file, ns=(0, 0))
+    assert cachedRegionsIndex(str(config_file)) is None
+    assert loadRegionsIndex(str(config_file), validate=False)['countries'] == {'usa': ['us-east-1', 'us-west-2']}
+    with open(indexFile(str(config_file)), 'r') as cached:
+        assert json.load(cached)['key']['validated'] is False
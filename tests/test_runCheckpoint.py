@@ -0,0 +1,49 @@
+import datetime
+import json
+
+import pytest
+
+from utils.runCheckpoint import RunCheckpoint
+
+RUN = {'action': 'create', 'stack_name': 'labs'}
+
+
+def test_resume_keeps_the_last_state_of_each_region(tmp_path):
+    checkpoint_file = str(tmp_path / 'checkpoint.jsonl')
+    started = datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    checkpoint = RunCheckpoint(checkpoint_file, RUN, ['us-east-1', 'us-west-2', 'eu-west-1'])
+    checkpoint.record('us-east-1', 'in-progress', stackId='arn:stack/1', started=started)
+    checkpoint.record('us-east-1', 'done')
+    checkpoint.record('us-west-2', 'failed', stackId='arn:stack/2')
+    checkpoint.close()
+
+    resumed = RunCheckpoint(checkpoint_file, RUN, ['us-east-1', 'us-west-2', 'eu-west-1'], resume=True)
+    assert resumed.state('us-east-1') == {'state': 'done', 'StackId': 'arn:stack/1', 'started': started}
+    assert resumed.state('us-west-2') == {'state': 'failed', 'StackId': 'arn:stack/2'}
+    assert resumed.state('eu-west-1') == {'state': 'pending'}
+    assert resumed.counts() == {'pending': 1, 'in-progress': 0, 'done': 1, 'failed': 1}
+    resumed.close()
+
+
+def test_every_line_is_flushed_as_it_is_written(tmp_path):
+    checkpoint_file = tmp_path / 'checkpoint.jsonl'
+    checkpoint = RunCheckpoint(str(checkpoint_file), RUN, ['us-east-1'])
+    checkpoint.record('us-east-1', 'in-progress')
+    lines = [json.loads(line) for line in checkpoint_file.read_text().splitlines()]
+    assert lines == [{'run': RUN, 'regions': ['us-east-1']}, {'state': 'in-progress', 'region': 'us-east-1'}]
+    checkpoint.remove()
+    assert not checkpoint_file.exists()
+
+
+def test_a_checkpoint_of_another_run_is_not_resumed(tmp_path):
+    checkpoint_file = str(tmp_path / 'checkpoint.jsonl')
+    RunCheckpoint(checkpoint_file, RUN, ['us-east-1']).close()
+    with pytest.raises(ValueError, match='different run'):
+        RunCheckpoint(checkpoint_file, dict(RUN, action='delete'), ['us-east-1'], resume=True)
+
+
+def test_unknown_states_are_rejected(tmp_path):
+    checkpoint = RunCheckpoint(str(tmp_path / 'checkpoint.jsonl'), RUN, ['us-east-1'])
+    with pytest.raises(ValueError, match='Unknown region state'):
+        checkpoint.record('us-east-1', 'finished')
+    checkpoint.close()
@@ -0,0 +1,24 @@
+import io
+import json
+
+from utils.runLogger import startRunLogging, stopRunLogging
+
+
+def test_a_line_left_open_is_finished_by_the_next_record(tmp_path):
+    stream = io.StringIO()
+    log_file = tmp_path / 'run.jsonl'
+    log = startRunLogging('test_runLogger', str(log_file), stream=stream)
+    log.info('Attempting to create ...', extra={'end': ''})
+    log.info('  Success!!', extra={'continuesLine': True})
+    log.info('Attempting to delete ...', extra={'end': ''})
+    log.info('  event', extra={'console': False})
+    log.info('  other region')
+    log.info('Attempting to update ...', extra={'end': ''})
+    stopRunLogging()
+    assert stream.getvalue() == ('Attempting to create ...  Success!!\n'
+                                 'Attempting to delete ...\n'
+                                 '  other region\n'
+                                 'Attempting to update ...\n')
+    # the log file has every record, one per line
+    assert [json.loads(line)['message'] for line in log_file.read_text().splitlines()] == [
+        'Attempting to create ...', 'Success!!', 'Attempting to delete ...', 'event', 'other region', 'Attempting to update ...']
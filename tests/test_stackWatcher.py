@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from utils.fakeAws import FakeAwsAccount, clientError
+from utils.asyncAws import AsyncAwsEngine
+from utils.awsClientPool import AwsClientPool
+from utils.stackWatcher import StackPollState, StackWatcher, pollStackStep, runPollStep
+
+TEMPLATE = '''
+Resources:
+  bucket:
+    Type: AWS::S3::Bucket
+'''
+
+
+class ThrottledClient():
+    """
+    Summary: Wraps a fake client so its first calls fail with a throttling error
+    """
+    def __init__(self, client, errorCode: str, failures: int):
+        self.client = client
+        self.errorCode = errorCode
+        self.failures = failures
+
+    def __getattr__(self, name):
+        operation = getattr(self.client, name)
+
+        def call(**kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise clientError(self.errorCode, 'Rate exceeded', name)
+            return operation(**kwargs)
+        return call
+
+
+@pytest.fixture
+def account():
+    return FakeAwsAccount(stackLatency=0.0)
+
+
+def test_both_drivers_report_the_same_events_and_description(account):
+    cf_client = account.client('cloudformation', regionName='us-east-1')
+    stack_id = cf_client.create_stack(StackName='labs', TemplateBody=TEMPLATE)['StackId']
+
+    watcher_events = []
+    watcher = StackWatcher(onEvent=lambda region, event: watcher_events.append((region, event['EventId'])), minDelay=0.01)
+    try:
+        watcher_description = watcher.waitForStack(cf_client, stack_id, 'us-east-1', timeout=5)
+    finally:
+        watcher.stop()
+
+    pool = AwsClientPool()
+    pool.setClientFactory(account.client)
+    engine_events = []
+
+    async def waitOnEngine():
+        async with AsyncAwsEngine(pool) as aws_engine:
+            return await aws_engine.waitForStack(None, 'us-east-1', stack_id, timeout=5, minDelay=0.01,
+                                                 onEvent=lambda region, event: engine_events.append((region, event['EventId'])))
+    engine_description = asyncio.run(waitOnEngine())
+
+    assert watcher_description['StackStatus'] == engine_description['StackStatus'] == 'CREATE_COMPLETE'
+    assert watcher_events == engine_events
+    assert len(watcher_events) == 4
+
+
+@pytest.mark.parametrize('errorCode', ['Throttling', 'SlowDown', 'ProvisionedThroughputExceededException'])
+def test_a_throttled_poll_backs_off_instead_of_failing(account, errorCode):
+    cf_client = account.client('cloudformation', regionName='us-east-1')
+    stack_id = cf_client.create_stack(StackName='labs', TemplateBody=TEMPLATE)['StackId']
+    throttled_client = ThrottledClient(cf_client, errorCode, failures=1)
+    stack = StackPollState(stack_id, 'us-east-1', None, timeout=5, minDelay=1.0)
+
+    call = lambda operationName, **kwargs: getattr(throttled_client, operationName)(**kwargs)
+    assert runPollStep(pollStackStep(stack, minDelay=1.0, maxDelay=8.0), call) is None
+    assert 1.0 <= stack.delay <= 2.0
+    assert runPollStep(pollStackStep(stack, minDelay=1.0, maxDelay=8.0), call)['StackStatus'] == 'CREATE_COMPLETE'
+
+
+def test_other_errors_end_the_watch(account):
+    cf_client = account.client('cloudformation', regionName='us-east-1')
+    stack_id = cf_client.create_stack(StackName='labs', TemplateBody=TEMPLATE)['StackId']
+    throttled_client = ThrottledClient(cf_client, 'AccessDenied', failures=1)
+    watcher = StackWatcher(minDelay=0.01)
+    try:
+        with pytest.raises(Exception, match='Rate exceeded'):
+            watcher.waitForStack(throttled_client, stack_id, 'us-east-1', timeout=5)
+    finally:
+        watcher.stop()
+
@@ -0,0 +1,20 @@
+import os
+
+from utils.statusCache import deleteStatusCache, readStatusCache, statusCacheFile, writeStatusCache
+
+
+def test_a_status_is_read_until_it_expires_or_is_deleted():
+    status = {'region': 'us-east-1', 'stacks': []}
+    writeStatusCache(status, 'profile', 'us-east-1', 'labs')
+    assert readStatusCache(60, 'profile', 'us-east-1', 'labs') == status
+    assert readStatusCache(0, 'profile', 'us-east-1', 'labs') is None
+    assert readStatusCache(60, 'profile', 'us-west-2', 'labs') is None
+
+    cache_file = statusCacheFile('profile', 'us-east-1', 'labs')
+    os.utime(cache_file, (0, 0))
+    assert readStatusCache(60, 'profile', 'us-east-1', 'labs') is None
+
+    deleteStatusCache('profile', 'us-east-1', 'labs')
+    assert not os.path.exists(cache_file)
+    # deleting a status that is not cached is not an error
+    deleteStatusCache('profile', 'us-east-1', 'labs')
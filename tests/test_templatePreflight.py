@@ -0,0 +1,66 @@
+import os
+
+from utils.templatePreflight import checkParameters, checkRegion, loadTemplate, preflightCacheFile, preflightTemplate
+
+TEMPLATE = '''
+Parameters:
+  env:
+    Type: String
+    AllowedValues: [dev, prod]
+  prefix:
+    Type: String
+    Default: labs
+Conditions:
+  isProd: !Equals [!Ref env, prod]
+Resources:
+  bucket:
+    Type: AWS::S3::Bucket
+    Properties:
+      BucketName: !Sub ${prefix}-${AWS::Region}-${AWS::AccountId}
+  prodBucket:
+    Type: AWS::S3::Bucket
+    Condition: isProd
+    DependsOn: bucket
+Outputs:
+  bucketArn:
+    Value: !GetAtt bucket.Arn
+'''
+
+
+def test_a_valid_template_has_no_problems():
+    assert preflightTemplate(TEMPLATE, [{'ParameterKey': 'env', 'ParameterValue': 'dev'}], ['us-east-1', 'eu-west-1']) == []
+
+
+def test_parameters_are_checked_against_the_template():
+    template = loadTemplate(TEMPLATE)
+    assert checkParameters(template, [{'ParameterKey': 'env', 'ParameterValue': 'test'}, {'ParameterKey': 'extra', 'ParameterValue': 'x'}]) == [
+        'parameter extra is not declared in the template',
+        'parameter env is test, which is not one of dev, prod',
+    ]
+    assert checkParameters(template, []) == ['parameter env has no default and is not in the parameters file']
+
+
+def test_bucket_names_are_checked_in_every_region():
+    long_prefix = [{'ParameterKey': 'env', 'ParameterValue': 'dev'}, {'ParameterKey': 'prefix', 'ParameterValue': 'a' * 36}]
+    # the bucket name is only too long in the regions with the longest names
+    problems = preflightTemplate(TEMPLATE, long_prefix, ['us-east-1', 'ap-southeast-2'])
+    assert len(problems) == 1
+    assert problems[0].startswith('ap-southeast-2: resource bucket: bucket name')
+
+
+def test_missing_references_are_found():
+    template = loadTemplate(TEMPLATE.replace('!GetAtt bucket.Arn', '!GetAtt missing.Arn').replace('DependsOn: bucket', 'DependsOn: other'))
+    problems = checkRegion(template, {'env': 'prod', 'prefix': 'labs'}, 'us-east-1')
+    assert 'resource prodBucket: DependsOn other is not a resource' in problems
+    assert any(problem.startswith('output bucketArn:') for problem in problems)
+
+
+def test_verdicts_are_cached(cacheHome):
+    parameters = [{'ParameterKey': 'env', 'ParameterValue': 'test'}]
+    problems = preflightTemplate(TEMPLATE, parameters, ['us-east-1'])
+    cache_file = preflightCacheFile(TEMPLATE, parameters, ['us-east-1'], '123456789012')
+    assert cache_file.startswith(str(cacheHome)) and os.path.exists(cache_file)
+    with open(cache_file, 'w') as cached:
+        cached.write('{"problems": ["from the cache"]}')
+    assert problems != ['from the cache']
+    assert preflightTemplate(TEMPLATE, parameters, ['us-east-1']) == ['from the cache']
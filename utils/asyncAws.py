@@ -0,0 +1,198 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import random
+import threading
+from typing import Callable, Generator, Optional
+
+import botocore.exceptions
+
+from utils.awsErrors import isThrottlingError
+from utils.rateLimiter import RegionRateLimiter, TokenBucket
+from utils.stackWatcher import StackPollState, pollStackStep
+
+try:
+    import aiobotocore.config
+    import aiobotocore.session
+except ImportError:  # the boto3 clients of the pool are called on threads instead
+    aiobotocore = None
+
+
+async def acquireToken(bucket: TokenBucket) -> None:
+    # waits for a token without blocking the event loop
+    wait = bucket.reserve()
+    while wait > 0:
+        await asyncio.sleep(wait)
+        wait = bucket.reserve()
+
+
+class AsyncAwsEngine():
+    """
+    Summary: Makes aws api calls from asyncio coroutines, so hundreds of stack operations and polls can be
+    in flight on one event loop. With aiobotocore installed every call is a coroutine and each client
+    keeps one connection pool shared by all of them. Without it the cached boto3 clients of the client
+    pool are called on a small thread pool, a thread is only held for the length of a call and never
+    while a stack is being waited on
+    """
+    def __init__(self, clientPool, rateLimiter: Optional[RegionRateLimiter] = None, maxThreads: Optional[int] = None):
+        self.clientPool = clientPool
+        self.rateLimiter = rateLimiter
+        # a local stand-in set on the pool (i.e. for benchmarks) is only reachable through the pool
+        self.usesAiobotocore = aiobotocore is not None and not clientPool.hasClientFactory()
+        self.maxThreads = maxThreads or clientPool.maxPoolConnections
+        self._executor = None
+        self._sessions = {}
+        self._clients = {}
+        # created on first use, inside the running loop: before python 3.10 a lock binds to the loop that is
+        # current when it is created, which is not the one asyncio.run or a new event loop later runs
+        self._clientLock = None
+        self._exitStack = contextlib.AsyncExitStack()
+        self._instrumented = set()
+        self._instrumentLock = threading.Lock()
+
+    async def __aenter__(self) -> 'AsyncAwsEngine':
+        return self
+
+    async def __aexit__(self, *excInfo) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        '''
+        close closes the aiobotocore clients and their connections, and stops the fallback threads
+        '''
+        await self._exitStack.aclose()
+        self._clients.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _threads(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.maxThreads, thread_name_prefix='AsyncAwsEngine')
+        return self._executor
+
+    async def _aioClient(self, serviceName: str, profileName: Optional[str], regionName: Optional[str]):
+        key = (serviceName, profileName, regionName)
+        if self._clientLock is None:
+            self._clientLock = asyncio.Lock()
+        async with self._clientLock:
+            client = self._clients.get(key)
+            if client is None:
+                session = self._sessions.get(profileName)
+                if session is None:
+                    session = self._sessions[profileName] = aiobotocore.session.AioSession(profile=profileName)
+                config = aiobotocore.config.AioConfig(
+                    max_pool_connections=self.clientPool.maxPoolConnections,
+                    retries={'mode': self.clientPool.retryMode, 'max_attempts': self.clientPool.maxAttempts}
+                )
+                client = await self._exitStack.enter_async_context(session.create_client(serviceName, region_name=regionName, config=config))
+                self._instrumentAioClient(client)
+                self._clients[key] = client
+            return client
+
+    def _instrument(self, client) -> None:
+        # the engine takes the rate limiter's tokens itself, the clients only report when they are throttled
+        if self.rateLimiter is None:
+            return
+        with self._instrumentLock:
+            if id(client) in self._instrumented:
+                return
+            self._instrumented.add(id(client))
+        self.rateLimiter.instrument(client, acquire=False)
+
+    def _instrumentAioClient(self, client) -> None:
+        # the pool's hooks (i.e. the --metrics handlers) are registered on the aiobotocore client's events
+        # too, aiobotocore calls plain handlers as well as coroutines
+        self.clientPool.applyClientHooks(client)
+        self._instrument(client)
+
+    def _callOnThread(self, serviceName: str, profileName: Optional[str], regionName: Optional[str], operationName: str, kwargs: dict):
+        client = self.clientPool.getClient(serviceName, profileName, regionName)
+        self._instrument(client)
+        return getattr(client, operationName)(**kwargs)
+
+    async def call(self, serviceName: str, profileName: Optional[str], regionName: Optional[str], operationName: str, **kwargs):
+        '''
+        call makes an aws api call without blocking the event loop
+
+        Args:
+            serviceName (str): The aws service, i.e. cloudformation, sts, iam
+            profileName (str): The aws credentials profile, or None for the default credential chain
+            regionName (str): The aws region, or None for the region configured in the profile
+            operationName (str): The client method, i.e. create_stack
+            kwargs: The arguments of the api call
+
+        Returns:
+            dict: The response of the api call
+        '''
+        if self.rateLimiter is not None and serviceName in self.rateLimiter.serviceNames:
+            await acquireToken(self.rateLimiter.bucketFor(regionName or 'global'))
+        if self.usesAiobotocore:
+            client = await self._aioClient(serviceName, profileName, regionName)
+            return await getattr(client, operationName)(**kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._threads(), self._callOnThread, serviceName, profileName, regionName, operationName, kwargs)
+
+    async def callWithThrottleRetry(self, serviceName: str, profileName: Optional[str], regionName: Optional[str], operationName: str,
+                                    maxAttempts: int = 5, baseDelay: float = 1.0, maxDelay: float = 20.0, **kwargs):
+        '''
+        callWithThrottleRetry is the coroutine form of rateLimiter.callWithThrottleRetry, see call for the arguments
+        '''
+        for attempt in range(1, maxAttempts + 1):
+            try:
+                return await self.call(serviceName, profileName, regionName, operationName, **kwargs)
+            except botocore.exceptions.ClientError as err:
+                if not isThrottlingError(err) or attempt == maxAttempts:
+                    raise
+            await asyncio.sleep(random.uniform(0, min(maxDelay, baseDelay * 2 ** (attempt - 1))))
+
+    async def runBlocking(self, function: Callable, *args):
+        '''
+        runBlocking runs blocking work (i.e. emptying a bucket with the boto3 clients) on the engine's threads
+        '''
+        return await asyncio.get_running_loop().run_in_executor(self._threads(), functools.partial(function, *args))
+
+    async def waitForStack(self, profileName: Optional[str], region: str, stackId: str, since=None, timeout: float = 3600,
+                           onEvent: Optional[Callable[[str, dict], None]] = None, minDelay: float = 2.0, maxDelay: float = 30.0,
+                           backoff: float = 1.5, confirmEvery: int = 4) -> dict:
+        '''
+        waitForStack polls a stack until it reaches a terminal status, with the same poll step as StackWatcher
+        (stackWatcher.pollStackStep) driven by coroutines. Waiting is an asyncio sleep, so any number of stacks can be waited on at once
+
+        Args:
+            profileName (str): The aws credentials profile
+            region (str): AWS region that the stack is in
+            stackId (str): The AWS unique stack ID (the arn id)
+            since (datetime): Events older than this are from previous stack operations and are not reported
+            timeout (float): The number of seconds to wait before giving up on the stack
+            onEvent (Callable): Called as onEvent(region, event) for each new stack event, oldest first
+
+        Raises:
+            TimeoutError: When the stack is still in progress after timeout seconds
+
+        Returns:
+            dict: The final stack description (as returned by DescribeStacks)
+        '''
+        stack = StackPollState(stackId, region, since, timeout, minDelay)
+        while True:
+            step = pollStackStep(stack, onEvent, minDelay=minDelay, maxDelay=maxDelay, backoff=backoff, confirmEvery=confirmEvery)
+            description = await self._runPollStep(profileName, region, step)
+            if description is not None:
+                return description
+            await asyncio.sleep(stack.delay)
+
+    async def _runPollStep(self, profileName: Optional[str], region: str, step: Generator):
+        # the coroutine form of stackWatcher.runPollStep
+        try:
+            request = next(step)
+            while True:
+                operation_name, kwargs = request
+                try:
+                    response = await self.call('cloudformation', profileName, region, operation_name, **kwargs)
+                except Exception as err:
+                    request = step.throw(err)
+                else:
+                    request = step.send(response)
+        except StopIteration as stop:
+            return stop.value
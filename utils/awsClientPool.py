@@ -0,0 +1,195 @@
+import threading
+from typing import Callable, Optional
+
+import boto3
+import botocore.config
+
+
+class AwsClientPool():
+    """
+    Summary: Lazily creates and caches boto3 sessions (keyed by profile) and clients (keyed by
+    service, profile and region) so repeated and multi-region calls reuse the already loaded
+    credentials, service models and HTTPS connection pools
+    """
+    def __init__(self, maxPoolConnections: int = 10, maxAttempts: int = 10, retryMode: str = 'adaptive'):
+        self.maxPoolConnections = maxPoolConnections
+        self.maxAttempts = maxAttempts
+        self.retryMode = retryMode
+        self._sessions = {}
+        self._clients = {}
+        self._clientFactory = None
+        self._clientHooks = []
+        # boto3 sessions are not thread safe when creating clients, so creation is serialised.
+        # The clients themselves are thread safe once created
+        self._lock = threading.RLock()
+
+    def setMaxPoolConnections(self, maxPoolConnections: int) -> None:
+        '''
+        setMaxPoolConnections sets the size of the connection pool used by clients created from now on
+
+        Args:
+            maxPoolConnections (int): The maximum number of connections each client keeps open
+        '''
+        with self._lock:
+            self.maxPoolConnections = max(maxPoolConnections, 1)
+
+    def setRetryConfig(self, maxAttempts: int, retryMode: str = 'adaptive') -> None:
+        '''
+        setRetryConfig sets how clients created from now on retry failed and throttled calls. The adaptive
+        mode also rate limits each client on the client side once it starts being throttled
+
+        Args:
+            maxAttempts (int): The maximum number of attempts of each call, including the first one
+            retryMode (str): The botocore retry mode [ legacy, standard, adaptive ]
+        '''
+        with self._lock:
+            self.maxAttempts = max(maxAttempts, 1)
+            self.retryMode = retryMode
+
+    def _clientConfig(self) -> botocore.config.Config:
+        return botocore.config.Config(
+            max_pool_connections=self.maxPoolConnections,
+            retries={'mode': self.retryMode, 'max_attempts': self.maxAttempts}
+        )
+
+    def setClientFactory(self, clientFactory: Optional[Callable]) -> None:
+        '''
+        setClientFactory replaces how clients are created, i.e. with a local stand-in for benchmarks. The
+        factory is called as clientFactory(serviceName, profileName, regionName). None restores boto3
+
+        Args:
+            clientFactory (Callable): The function that creates clients, or None
+        '''
+        with self._lock:
+            self._clientFactory = clientFactory
+            self._clients.clear()
+
+    def hasClientFactory(self) -> bool:
+        return self._clientFactory is not None
+
+    def addClientHook(self, clientHook: Callable) -> None:
+        '''
+        addClientHook adds a function that is called with every client created from now on, i.e. to
+        register botocore event handlers on it
+
+        Args:
+            clientHook (Callable): Called as clientHook(client)
+        '''
+        with self._lock:
+            self._clientHooks.append(clientHook)
+
+    def clearClientHooks(self) -> None:
+        '''
+        clearClientHooks removes every client hook and drops the cached clients they were called with, i.e.
+        between runs of a script in the same process, which would otherwise add its hooks again
+        '''
+        with self._lock:
+            self._clientHooks.clear()
+            self._clients.clear()
+
+    def getSession(self, profileName: Optional[str] = None) -> boto3.Session:
+        '''
+        getSession returns the cached session for a profile, creating it on first use
+
+        Args:
+            profileName (str): The aws credentials profile, or None for the default credential chain
+
+        Returns:
+            boto3.Session: The session for the profile
+        '''
+        with self._lock:
+            session = self._sessions.get(profileName)
+            if session is None:
+                session = boto3.Session(profile_name=profileName)
+                self._sessions[profileName] = session
+            return session
+
+    def getClient(self, serviceName: str, profileName: Optional[str] = None, regionName: Optional[str] = None):
+        '''
+        getClient returns the cached client for a service, profile and region, creating it on first use
+
+        Args:
+            serviceName (str): The aws service, i.e. cloudformation, sts, iam
+            profileName (str): The aws credentials profile, or None for the default credential chain
+            regionName (str): The aws region, or None for the region configured in the profile
+
+        Returns:
+            botocore.client.BaseClient: The client for the service in the region
+        '''
+        key = (serviceName, profileName, regionName)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self._clientFactory is not None:
+                    client = self._clientFactory(serviceName, profileName, regionName)
+                else:
+                    client = self.getSession(profileName).client(
+                        serviceName,
+                        region_name=regionName,
+                        config=self._clientConfig()
+                    )
+                self.applyClientHooks(client)
+                self._clients[key] = client
+            return client
+
+    def getClientWithCredentials(self, serviceName: str, credentials: dict, profileName: Optional[str] = None, regionName: Optional[str] = None):
+        '''
+        getClientWithCredentials creates a client that signs with the given temporary credentials instead of
+        the profile's own. These clients are not cached since the credentials are short lived
+
+        Args:
+            serviceName (str): The aws service, i.e. sts
+            credentials (dict): AccessKeyId, SecretAccessKey and SessionToken, as returned by sts
+            profileName (str): The aws profile whose configuration (i.e. region) is used
+            regionName (str): The aws region, or None for the region configured in the profile
+
+        Returns:
+            botocore.client.BaseClient: The client for the service
+        '''
+        with self._lock:
+            client = self.getSession(profileName).client(
+                serviceName,
+                region_name=regionName,
+                aws_access_key_id=credentials['AccessKeyId'],
+                aws_secret_access_key=credentials['SecretAccessKey'],
+                aws_session_token=credentials['SessionToken'],
+                config=self._clientConfig()
+            )
+            self.applyClientHooks(client)
+            return client
+
+    def applyClientHooks(self, client) -> None:
+        '''
+        applyClientHooks calls the client hooks with a client the pool did not create itself, i.e. an
+        aiobotocore client, so it is instrumented the same way as the pool's own clients
+
+        Args:
+            client (botocore.client.BaseClient): The client to call the hooks with
+        '''
+        with self._lock:
+            client_hooks = list(self._clientHooks)
+        for client_hook in client_hooks:
+            client_hook(client)
+
+    def clear(self) -> None:
+        '''
+        clear drops all cached sessions and clients, i.e. after the credentials of a profile were changed
+        '''
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+
+
+# module level pool shared by all the lab scripts
+clientPool = AwsClientPool()
+
+
+def getSession(profileName: Optional[str] = None) -> boto3.Session:
+    return clientPool.getSession(profileName)
+
+
+def getClient(serviceName: str, profileName: Optional[str] = None, regionName: Optional[str] = None):
+    return clientPool.getClient(serviceName, profileName, regionName)
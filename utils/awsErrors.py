@@ -0,0 +1,19 @@
+import botocore.exceptions
+
+
+# the error codes aws services answer with when a caller is being rate limited
+THROTTLING_ERROR_CODES = ('Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException',
+                          'SlowDown', 'RequestThrottled', 'RequestThrottledException', 'ProvisionedThroughputExceededException')
+
+
+def isThrottlingError(err: Exception) -> bool:
+    '''
+    isThrottlingError checks if an exception is an aws api call that was rejected for being rate limited
+
+    Args:
+        err (Exception): The exception raised by a client call
+
+    Returns:
+        bool: True if the call was throttled and can be retried after a backoff
+    '''
+    return isinstance(err, botocore.exceptions.ClientError) and err.response['Error']['Code'] in THROTTLING_ERROR_CODES
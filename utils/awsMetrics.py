@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+from typing import Optional
+
+from utils.awsErrors import THROTTLING_ERROR_CODES
+from utils.pyColors import MinStyle
+
+
+class OperationMetrics():
+    """
+    Summary: The recorded calls of one api operation in one region
+    """
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.latencies = []
+        self.httpStatuses = {}
+
+    def percentile(self, fraction: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class AwsCallMetrics():
+    """
+    Summary: Records the latency, retries, throttles and http status of every aws api call, by region
+    and operation, using botocore's before-call/after-call events. Clients are added with instrument()
+    """
+    def __init__(self):
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, client) -> None:
+        '''
+        instrument registers the metric handlers on a client's events. Clients without botocore events
+        are left as they are
+
+        Args:
+            client (botocore.client.BaseClient): The client to record the calls of
+        '''
+        events = getattr(getattr(client, 'meta', None), 'events', None)
+        if events is None:
+            return
+        region = client.meta.region_name or 'global'
+        service = client.meta.service_model.service_id.hyphenize()
+        events.register(f'before-call.{service}', self._beforeCall)
+        events.register(f'after-call.{service}', lambda **kwargs: self._afterCall(region, service, **kwargs))
+        events.register(f'after-call-error.{service}', lambda **kwargs: self._afterCallError(region, service, **kwargs))
+        events.register(f'needs-retry.{service}', lambda **kwargs: self._needsRetry(region, service, **kwargs))
+
+    def _metricsFor(self, region: str, service: str, operation: str) -> OperationMetrics:
+        key = (region, service, operation)
+        metrics = self.operations.get(key)
+        if metrics is None:
+            metrics = self.operations.setdefault(key, OperationMetrics())
+        return metrics
+
+    def _beforeCall(self, context: dict, **kwargs) -> None:
+        context['metrics_started'] = time.perf_counter()
+
+    def _latency(self, context: dict) -> float:
+        started = context.get('metrics_started')
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def _afterCall(self, region: str, service: str, http_response, parsed: dict, model, context: dict, **kwargs) -> None:
+        latency = self._latency(context)
+        error_code = parsed.get('Error', {}).get('Code')
+        status = getattr(http_response, 'status_code', None) or parsed.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        with self._lock:
+            metrics = self._metricsFor(region, service, model.name)
+            metrics.calls += 1
+            metrics.latencies.append(latency)
+            metrics.retries += parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            metrics.httpStatuses[status] = metrics.httpStatuses.get(status, 0) + 1
+            if error_code:
+                metrics.errors += 1
+
+    def _afterCallError(self, region: str, service: str, exception: Exception, context: dict, event_name: str, **kwargs) -> None:
+        # raised before a response was parsed, i.e. a connection error once the retries ran out
+        latency = self._latency(context)
+        with self._lock:
+            metrics = self._metricsFor(region, service, event_name.rsplit('.', 1)[-1])
+            metrics.calls += 1
+            metrics.errors += 1
+            metrics.latencies.append(latency)
+            metrics.httpStatuses[type(exception).__name__] = metrics.httpStatuses.get(type(exception).__name__, 0) + 1
+
+    def _needsRetry(self, region: str, service: str, response, operation, **kwargs) -> None:
+        # every throttled attempt is counted, including ones that later succeed on a retry. Returning
+        # None leaves the retry decision to botocore
+        if response is None:
+            return None
+        error_code = response[1].get('Error', {}).get('Code')
+        if error_code in THROTTLING_ERROR_CODES:
+            with self._lock:
+                self._metricsFor(region, service, operation.name).throttles += 1
+        return None
+
+    def summaryRows(self) -> list:
+        rows = []
+        with self._lock:
+            for (region, service, operation), metrics in self.operations.items():
+                rows.append({
+                    'region': region,
+                    'service': service,
+                    'operation': operation,
+                    'calls': metrics.calls,
+                    'errors': metrics.errors,
+                    'retries': metrics.retries,
+                    'throttles': metrics.throttles,
+                    'total_ms': round(sum(metrics.latencies) * 1000, 1),
+                    'avg_ms': round(sum(metrics.latencies) / len(metrics.latencies) * 1000, 1) if metrics.latencies else 0.0,
+                    'p95_ms': round(metrics.percentile(0.95) * 1000, 1),
+                    'max_ms': round(max(metrics.latencies, default=0) * 1000, 1),
+                    'http_statuses': {f'{status}': count for status, count in metrics.httpStatuses.items()},
+                })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def printSummary(self) -> None:
+        rows = self.summaryRows()
+        if not rows:
+            return
+        print(f'\n{MinStyle.WHITE}AWS api calls{MinStyle.RESET}')
+        print(f'{MinStyle.DIV_SINGLE_LONG}{MinStyle.RESET}')
+        print(f'{MinStyle.PINK}{"region":<16}{"operation":<28}{"calls":>6}{"errors":>7}{"retries":>8}{"throttles":>10}{"avg ms":>9}{"p95 ms":>9}{"max ms":>9}{"total ms":>10}{MinStyle.RESET}')
+        for row in rows:
+            row_clr = MinStyle.LIGHTRED if row['errors'] or row['throttles'] else MinStyle.LIGHTCYAN
+            print(f'{row["region"]:<16}{row_clr}{row["operation"]:<28}{MinStyle.RESET}{row["calls"]:>6}{row["errors"]:>7}{row["retries"]:>8}'
+                  f'{row["throttles"]:>10}{row["avg_ms"]:>9}{row["p95_ms"]:>9}{row["max_ms"]:>9}{row["total_ms"]:>10}')
+        print()
+
+    def writeFile(self, metricsFile: str) -> None:
+        '''
+        writeFile writes the metrics as json, or in the OpenMetrics text format for any other extension
+
+        Args:
+            metricsFile (str): The path of the file to write
+        '''
+        rows = self.summaryRows()
+        with open(metricsFile, 'w') as opFile:
+            if metricsFile.endswith('.json'):
+                json.dump(rows, opFile, indent=4)
+                return
+            opFile.write(openMetricsText(rows))
+
+
+def openMetricsText(rows: list) -> str:
+    labels = lambda row: f'region="{row["region"]}",service="{row["service"]}",operation="{row["operation"]}"'
+    lines = ['# TYPE aws_api_calls counter', '# HELP aws_api_calls Number of aws api calls']
+    lines += [f'aws_api_calls_total{{{labels(row)}}} {row["calls"]}' for row in rows]
+    for name, key, description in (('aws_api_errors', 'errors', 'Number of aws api calls that returned an error'),
+                                   ('aws_api_retries', 'retries', 'Number of retries made by botocore'),
+                                   ('aws_api_throttles', 'throttles', 'Number of throttled aws api attempts')):
+        lines += [f'# TYPE {name} counter', f'# HELP {name} {description}']
+        lines += [f'{name}_total{{{labels(row)}}} {row[key]}' for row in rows]
+    lines += ['# TYPE aws_api_call_latency_seconds summary', '# HELP aws_api_call_latency_seconds Latency of aws api calls']
+    for row in rows:
+        lines.append(f'aws_api_call_latency_seconds{{{labels(row)},quantile="0.95"}} {row["p95_ms"] / 1000}')
+        lines.append(f'aws_api_call_latency_seconds_sum{{{labels(row)}}} {row["total_ms"] / 1000}')
+        lines.append(f'aws_api_call_latency_seconds_count{{{labels(row)}}} {row["calls"]}')
+    lines += ['# TYPE aws_api_responses counter', '# HELP aws_api_responses Number of aws api responses by http status']
+    for row in rows:
+        lines += [f'aws_api_responses_total{{{labels(row)},status="{status}"}} {count}' for status, count in row['http_statuses'].items()]
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+# module level metrics shared by all the lab scripts
+callMetrics = AwsCallMetrics()
+
+
+def enableCallMetrics(clientPool, printSummary: bool = True, metricsFile: Optional[str] = None) -> AwsCallMetrics:
+    '''
+    enableCallMetrics instruments every client of a client pool and reports the metrics when the script exits
+
+    Args:
+        clientPool (AwsClientPool): The pool whose clients are instrumented
+        printSummary (bool): Print the summary table at exit
+        metricsFile (str): Also write the metrics to this file at exit, see AwsCallMetrics.writeFile
+
+    Returns:
+        AwsCallMetrics: The shared metrics
+    '''
+    import atexit
+    clientPool.addClientHook(callMetrics.instrument)
+    if printSummary:
+        atexit.register(callMetrics.printSummary)
+    if metricsFile:
+        atexit.register(callMetrics.writeFile, metricsFile)
+    return callMetrics
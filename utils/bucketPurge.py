@@ -0,0 +1,90 @@
+import concurrent.futures
+import threading
+from typing import Callable, Iterator, Optional
+
+import botocore.exceptions
+
+
+# the most keys a single DeleteObjects call accepts
+DELETE_OBJECTS_MAX_KEYS = 1000
+
+
+def iterObjectVersionBatches(s3Client, bucketName: str, batchSize: int = DELETE_OBJECTS_MAX_KEYS) -> Iterator[list]:
+    '''
+    iterObjectVersionBatches lists every object version and delete marker of a bucket, a page at a time,
+    and yields them in batches ready for DeleteObjects. Only one page is held in memory at a time
+
+    Args:
+        s3Client (botocore.client.BaseClient): The s3 client of the bucket's region
+        bucketName (str): The bucket to list
+        batchSize (int): The number of keys in each batch
+
+    Returns:
+        Iterator[list]: Batches of {Key, VersionId}
+    '''
+    request = {'Bucket': bucketName, 'MaxKeys': batchSize}
+    batch = []
+    while True:
+        response = s3Client.list_object_versions(**request)
+        for version in response.get('Versions', []) + response.get('DeleteMarkers', []):
+            batch.append({'Key': version['Key'], 'VersionId': version['VersionId']})
+            if len(batch) == batchSize:
+                yield batch
+                batch = []
+        if not response.get('IsTruncated'):
+            break
+        request['KeyMarker'] = response['NextKeyMarker']
+        request['VersionIdMarker'] = response['NextVersionIdMarker']
+    if batch:
+        yield batch
+
+
+def deleteObjectBatch(s3Client, bucketName: str, batch: list) -> int:
+    response = s3Client.delete_objects(Bucket=bucketName, Delete={'Objects': batch, 'Quiet': True})
+    errors = response.get('Errors', [])
+    if errors:
+        raise RuntimeError(f'Could not delete {len(errors)} objects from bucket {bucketName}, i.e. {errors[0]["Key"]}: {errors[0].get("Code")} {errors[0].get("Message", "")}')
+    return len(batch)
+
+
+def purgeBucket(s3Client, bucketName: str, maxWorkers: int = 8, onProgress: Optional[Callable[[str, int], None]] = None) -> int:
+    '''
+    purgeBucket deletes every object version and delete marker in a bucket, so the bucket itself can be
+    deleted. Batches of up to 1000 keys are deleted by a pool of maxWorkers threads while the bucket is
+    still being listed, with at most two batches per worker waiting, so memory use does not grow with
+    the number of objects
+
+    Args:
+        s3Client (botocore.client.BaseClient): The s3 client of the bucket's region
+        bucketName (str): The bucket to empty
+        maxWorkers (int): The number of DeleteObjects calls made at the same time
+        onProgress (Callable): Called as onProgress(bucketName, deletedSoFar) after each batch
+
+    Returns:
+        int: The number of object versions and delete markers deleted. 0 if the bucket does not exist
+    '''
+    deleted = 0
+    in_flight = threading.BoundedSemaphore(max(maxWorkers, 1) * 2)
+    futures = set()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(maxWorkers, 1)) as executor:
+            for batch in iterObjectVersionBatches(s3Client, bucketName):
+                in_flight.acquire()
+                future = executor.submit(deleteObjectBatch, s3Client, bucketName, batch)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.add(future)
+                # collect the finished batches as we go, so a failed batch stops the listing early
+                for done in [future for future in futures if future.done()]:
+                    futures.remove(done)
+                    deleted += done.result()
+                    if onProgress is not None:
+                        onProgress(bucketName, deleted)
+            for done in concurrent.futures.as_completed(futures):
+                deleted += done.result()
+                if onProgress is not None:
+                    onProgress(bucketName, deleted)
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] in ('NoSuchBucket', '404'):
+            return deleted
+        raise
+    return deleted
@@ -0,0 +1,71 @@
+import configparser
+import datetime
+from typing import Optional
+
+
+# stored next to the keys in the credentials profile, botocore ignores keys it does not know
+EXPIRATION_KEY = 'aws_session_expiration'
+
+
+def getCachedCredentials(credentialsFile: str, profile: str) -> Optional[dict]:
+    '''
+    getCachedCredentials reads the temporary credentials, and when they expire, from a credentials profile
+
+    Args:
+        credentialsFile (str): The aws credentials file, i.e. ~/.aws/credentials
+        profile (str): The profile holding the temporary credentials
+
+    Returns:
+        Optional[dict]: AccessKeyId, SecretAccessKey, SessionToken and Expiration (a datetime), or None
+        if the profile is missing or was not written with an expiration
+    '''
+    config = configparser.ConfigParser()
+    config.read(credentialsFile)
+    if not config.has_section(profile):
+        return None
+    section = config[profile]
+    try:
+        expiration = datetime.datetime.fromisoformat(section[EXPIRATION_KEY])
+        return {
+            'AccessKeyId': section['aws_access_key_id'],
+            'SecretAccessKey': section['aws_secret_access_key'],
+            'SessionToken': section['aws_session_token'],
+            'Expiration': expiration if expiration.tzinfo else expiration.replace(tzinfo=datetime.timezone.utc)
+        }
+    except (KeyError, ValueError):
+        return None
+
+
+def remainingSeconds(credentials: Optional[dict]) -> float:
+    '''
+    remainingSeconds returns how long cached credentials stay valid, 0 when there are none
+    '''
+    if not credentials:
+        return 0
+    return max((credentials['Expiration'] - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+
+
+def areFresh(credentials: Optional[dict], thresholdSeconds: float) -> bool:
+    '''
+    areFresh checks if cached credentials are valid for at least thresholdSeconds more
+    '''
+    return remainingSeconds(credentials) > thresholdSeconds
+
+
+def credentialProcessOutput(credentials: dict) -> dict:
+    '''
+    credentialProcessOutput formats credentials the way an aws config credential_process must print them
+
+    Args:
+        credentials (dict): AccessKeyId, SecretAccessKey, SessionToken and Expiration
+
+    Returns:
+        dict: The credential_process json document
+    '''
+    return {
+        'Version': 1,
+        'AccessKeyId': credentials['AccessKeyId'],
+        'SecretAccessKey': credentials['SecretAccessKey'],
+        'SessionToken': credentials['SessionToken'],
+        'Expiration': credentials['Expiration'].astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    }
@@ -0,0 +1,138 @@
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, writes are still atomic but not serialised
+    fcntl = None
+
+
+SECTION_PATTERN = re.compile(r'^\s*\[([^\]]+)\]\s*$')
+KEY_PATTERN = re.compile(r'^([^=:\s#;][^=:]*?)\s*[=:]')
+
+
+@contextmanager
+def credentialsFileLock(credentialsFile: str):
+    '''
+    credentialsFileLock holds an advisory lock on a credentials file, using a separate .lock file so
+    the lock survives the credentials file being replaced
+    '''
+    lock_file = open(f'{credentialsFile}.lock', 'a')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def updateProfileLines(lines: list, profile: str, values: dict) -> list:
+    '''
+    updateProfileLines sets keys in one section of a credentials file, leaving every other line as it was
+
+    Args:
+        lines (list): The lines of the credentials file, with their line endings
+        profile (str): The section to update, it is added at the end when missing
+        values (dict): The keys and values to set in the section
+
+    Returns:
+        list: The updated lines
+    '''
+    section_start = None
+    section_end = len(lines)
+    for index, line in enumerate(lines):
+        match = SECTION_PATTERN.match(line)
+        if not match:
+            continue
+        if section_start is not None:
+            section_end = index
+            break
+        if match.group(1).strip() == profile:
+            section_start = index
+
+    if section_start is None:
+        new_lines = list(lines)
+        if new_lines and not new_lines[-1].endswith('\n'):
+            new_lines[-1] += '\n'
+        if new_lines and new_lines[-1].strip():
+            new_lines.append('\n')
+        new_lines.append(f'[{profile}]\n')
+        new_lines.extend(f'{key} = {value}\n' for key, value in values.items())
+        return new_lines
+
+    section = []
+    remaining = dict(values)
+    skipping_continuation = False
+    for line in lines[section_start + 1:section_end]:
+        # continuation lines of a replaced value are dropped along with it
+        if skipping_continuation and line.strip() and line[0] in ' \t':
+            continue
+        skipping_continuation = False
+        match = KEY_PATTERN.match(line)
+        if match and match.group(1).strip() in remaining:
+            key = match.group(1).strip()
+            section.append(f'{key} = {remaining.pop(key)}\n')
+            skipping_continuation = True
+        else:
+            section.append(line)
+    # new keys go after the last non-blank line of the section
+    insert_at = len(section)
+    while insert_at and not section[insert_at - 1].strip():
+        insert_at -= 1
+    if insert_at and not section[insert_at - 1].endswith('\n'):
+        section[insert_at - 1] += '\n'
+    section[insert_at:insert_at] = [f'{key} = {value}\n' for key, value in remaining.items()]
+    return lines[:section_start + 1] + section + lines[section_end:]
+
+
+def updateProfiles(credentialsFile: str, profiles: dict) -> bool:
+    '''
+    updateProfiles sets the values of one or more profiles in a credentials file. Only the target
+    sections are touched, the file is replaced atomically while holding an advisory lock and it is not
+    written at all when nothing changed
+
+    Args:
+        credentialsFile (str): The aws credentials file, i.e. ~/.aws/credentials
+        profiles (dict): The values to set for each profile, as {profile: {key: value}}
+
+    Returns:
+        bool: True if the file was written, False if it already held the values
+    '''
+    credentialsFile = os.path.expanduser(credentialsFile)
+    with credentialsFileLock(credentialsFile):
+        try:
+            with open(credentialsFile, 'r') as credsFile:
+                lines = credsFile.readlines()
+            file_mode = os.stat(credentialsFile).st_mode & 0o777
+        except FileNotFoundError:
+            lines = []
+            file_mode = 0o600
+        new_lines = lines
+        for profile, values in profiles.items():
+            new_lines = updateProfileLines(new_lines, profile, {key: f'{value}' for key, value in values.items()})
+        if new_lines == lines:
+            return False
+        fd, tmp_file = tempfile.mkstemp(prefix='.credentials.', dir=os.path.dirname(os.path.abspath(credentialsFile)))
+        try:
+            with os.fdopen(fd, 'w') as tmpCreds:
+                tmpCreds.writelines(new_lines)
+                tmpCreds.flush()
+                os.fsync(tmpCreds.fileno())
+            os.chmod(tmp_file, file_mode)
+            os.replace(tmp_file, credentialsFile)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        return True
+
+
+def updateProfile(credentialsFile: str, profile: str, values: dict) -> bool:
+    '''
+    updateProfile sets the values of a single profile in a credentials file, see updateProfiles
+    '''
+    return updateProfiles(credentialsFile, {profile: values})
@@ -0,0 +1,261 @@
+import concurrent.futures
+import graphlib
+import json
+import os
+import re
+from typing import Any, Callable
+
+from utils.templatePreflight import (ConditionValues, TemplateError, isSsmParameter, resolveValue, templateNames,
+                                     templateParameterValues)
+
+
+# a manifest stack's name becomes part of its stack names, so it is limited to what stack names allow
+MANIFEST_NAME_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9-]*$')
+# {{resolve:ssm:name}} and {{resolve:ssm:name:version}} dynamic references read parameter store too
+SSM_DYNAMIC_REFERENCE = re.compile(r'\{\{resolve:ssm(?:-secure)?:([^:}]+)')
+
+
+def graphNode(entryName: str, region: str) -> str:
+    return f'{entryName}/{region}'
+
+
+def splitGraphNode(node: str) -> tuple:
+    entry_name, region = node.split('/', 1)
+    return entry_name, region
+
+
+def loadDeploymentManifest(manifestFile: str) -> list:
+    '''
+    loadDeploymentManifest reads and validates a deployment manifest, a yaml list of the stacks of an
+    environment. Each stack has a name, a template and optionally a parameters file (both relative to
+    the manifest) and a depends_on list of the stacks it needs that cannot be inferred from its template
+
+    Args:
+        manifestFile (str): The path of the manifest yaml
+
+    Raises:
+        ValueError: Lists every problem found in the manifest
+
+    Returns:
+        list: The stacks, in manifest order, as {name, template, templateText, parameters, depends_on}
+    '''
+    import yaml
+    try:
+        with open(manifestFile, 'r') as manifest:
+            stacks = yaml.safe_load(manifest)
+    except yaml.YAMLError as err:
+        raise ValueError(f'the deployment manifest {manifestFile} is not valid yaml: {err}')
+    stacks = stacks.get('stacks') if isinstance(stacks, dict) else None
+    if not isinstance(stacks, list) or not all(isinstance(stack, dict) for stack in stacks):
+        raise ValueError(f'the deployment manifest {manifestFile} must have a stacks list, with a name and template for each stack')
+    manifest_dir = os.path.dirname(os.path.abspath(manifestFile))
+    problems = []
+    entries = []
+    for stack in stacks:
+        name = f'{stack.get("name", "")}'
+        if not MANIFEST_NAME_PATTERN.match(name):
+            problems.append(f'stack name {name or "(missing)"} must start with a letter and only have letters, numbers and hyphens')
+            continue
+        if name in [entry['name'] for entry in entries]:
+            problems.append(f'stack {name} is listed more than once')
+            continue
+        depends_on = stack.get('depends_on') or []
+        entry = {'name': name, 'depends_on': [depends_on] if isinstance(depends_on, str) else list(depends_on), 'parameters': []}
+        try:
+            entry['template'] = os.path.join(manifest_dir, stack['template'])
+            with open(entry['template'], 'r') as template:
+                entry['templateText'] = template.read()
+            if stack.get('parameters'):
+                with open(os.path.join(manifest_dir, stack['parameters']), 'r') as parameters:
+                    entry['parameters'] = json.load(parameters)
+        except KeyError:
+            problems.append(f'stack {name} has no template')
+            continue
+        except (OSError, ValueError) as err:
+            problems.append(f'stack {name}: {err}')
+            continue
+        entries.append(entry)
+    names = [entry['name'] for entry in entries]
+    for entry in entries:
+        problems += [f'stack {entry["name"]} depends on {dependency}, which is not in the manifest' for dependency in entry['depends_on'] if dependency not in names]
+    if not stacks:
+        problems.append('the manifest does not list any stacks')
+    if problems:
+        raise ValueError('invalid deployment manifest: ' + '; '.join(problems))
+    return entries
+
+
+def findFunctionArguments(value: Any, function: str) -> list:
+    # every argument of an intrinsic function, wherever it is used in a template value
+    if isinstance(value, list):
+        return [argument for item in value for argument in findFunctionArguments(item, function)]
+    if not isinstance(value, dict):
+        return []
+    if len(value) == 1 and function in value:
+        return [value[function]] + findFunctionArguments(value[function], function)
+    return [argument for item in value.values() for argument in findFunctionArguments(item, function)]
+
+
+def findStrings(value: Any) -> list:
+    if isinstance(value, list):
+        return [text for item in value for text in findStrings(item)]
+    if isinstance(value, dict):
+        return [text for item in value.values() for text in findStrings(item)]
+    return [value] if isinstance(value, str) else []
+
+
+def stackInterface(template: dict, stackParameters: list, region: str, stackName: str) -> dict:
+    '''
+    stackInterface works out what a stack shares with other stacks of the same region: the exports and
+    ssm parameters it creates, and the exports and ssm parameters it reads. Names that can only be
+    known once the stack is deployed are left out
+
+    Args:
+        template (dict): The parsed template
+        stackParameters (list): The stack parameters, as ParameterKey/ParameterValue pairs
+        region (str): AWS region the stack is deployed to
+        stackName (str): The full name of the stack in the region
+
+    Returns:
+        dict: {exports, imports, ssmWrites, ssmReads}, each a sorted list of names
+    '''
+    parameter_values = templateParameterValues(template, stackParameters)
+    names = templateNames(template, parameter_values, region, stackName=stackName)
+    resources = template.get('Resources') or {}
+    conditions = ConditionValues(template.get('Conditions') or {}, names, resources)
+
+    def resolvedNames(values: list) -> set:
+        resolved = set()
+        for value in values:
+            try:
+                value = resolveValue(value, names, conditions, resources)
+            except TemplateError:
+                continue
+            if isinstance(value, str):
+                resolved.add(value)
+        return resolved
+
+    outputs = template.get('Outputs') or {}
+    exports = resolvedNames([output['Export'].get('Name') for output in outputs.values() if isinstance(output, dict) and isinstance(output.get('Export'), dict)])
+    imports = resolvedNames(findFunctionArguments([resources, outputs, template.get('Conditions') or {}], 'Fn::ImportValue'))
+    ssm_writes = resolvedNames([(resource.get('Properties') or {}).get('Name') for resource in resources.values()
+                                if isinstance(resource, dict) and resource.get('Type') == 'AWS::SSM::Parameter'])
+    # an ssm typed parameter is given the name of the ssm parameter, its value is read when the stack is deployed
+    ssm_reads = {f'{parameter_values[key]}' for key, declaration in (template.get('Parameters') or {}).items()
+                 if isSsmParameter(declaration) and parameter_values.get(key) is not None}
+    ssm_reads.update(match for text in findStrings(resources) for match in SSM_DYNAMIC_REFERENCE.findall(text))
+    return {'exports': sorted(exports), 'imports': sorted(imports), 'ssmWrites': sorted(ssm_writes), 'ssmReads': sorted(ssm_reads)}
+
+
+def buildDeploymentGraph(entries: list, templates: dict, regions: list, stackNameFor: Callable[[str, str], str]) -> dict:
+    '''
+    buildDeploymentGraph works out which stacks of a manifest each stack needs, in each region. A stack
+    that imports an export, or reads an ssm parameter, created by another stack of the manifest in the
+    same region depends on it, as does every stack listed in its depends_on. Exports and ssm parameters
+    the manifest does not create are expected to exist already
+
+    Args:
+        entries (list): The stacks, from loadDeploymentManifest
+        templates (dict): The parsed template of each stack, by stack name
+        regions (list): The AWS regions the stacks are deployed to
+        stackNameFor (Callable): Called as stackNameFor(name, region), returns the full stack name
+
+    Raises:
+        ValueError: When two stacks create the same export or ssm parameter, or the stacks depend on each other in a cycle
+
+    Returns:
+        dict: {node: set of the nodes it depends on}, a node being '<stack name>/<region>'
+    '''
+    graph = {}
+    problems = []
+    for region in regions:
+        interfaces = {entry['name']: stackInterface(templates[entry['name']], entry['parameters'], region, stackNameFor(entry['name'], region)) for entry in entries}
+        producers = {}
+        for name, interface in interfaces.items():
+            for kind, created in (('export', interface['exports']), ('ssm parameter', interface['ssmWrites'])):
+                for created_name in created:
+                    if (kind, created_name) in producers:
+                        problems.append(f'{region}: {kind} {created_name} is created by both {producers[(kind, created_name)]} and {name}')
+                    producers[(kind, created_name)] = name
+        for entry in entries:
+            interface = interfaces[entry['name']]
+            inputs = [('export', name) for name in interface['imports']] + [('ssm parameter', name) for name in interface['ssmReads']]
+            dependencies = {producers[created] for created in inputs if created in producers} | set(entry['depends_on'])
+            dependencies.discard(entry['name'])
+            graph[graphNode(entry['name'], region)] = {graphNode(dependency, region) for dependency in dependencies}
+    if problems:
+        raise ValueError('invalid deployment manifest: ' + '; '.join(sorted(set(problems))))
+    try:
+        graphlib.TopologicalSorter(graph).prepare()
+    except graphlib.CycleError as err:
+        raise ValueError(f'the manifest stacks depend on each other in a cycle: {" -> ".join(err.args[1])}')
+    return graph
+
+
+def reverseGraph(graph: dict) -> dict:
+    # for deletes, a stack waits for the stacks that depend on it instead
+    reversed_graph = {node: set() for node in graph}
+    for node, dependencies in graph.items():
+        for dependency in dependencies:
+            reversed_graph[dependency].add(node)
+    return reversed_graph
+
+
+def deploymentWaves(graph: dict) -> list:
+    '''
+    deploymentWaves groups the nodes of a graph into waves, every node of a wave only depends on nodes of
+    earlier waves. The number of waves is the length of the critical path
+
+    Args:
+        graph (dict): {node: set of the nodes it depends on}
+
+    Returns:
+        list: The waves, each a sorted list of nodes
+    '''
+    sorter = graphlib.TopologicalSorter(graph)
+    sorter.prepare()
+    waves = []
+    while sorter.is_active():
+        wave = sorted(sorter.get_ready())
+        sorter.done(*wave)
+        waves.append(wave)
+    return waves
+
+
+def runDeploymentGraph(graph: dict, runNode: Callable[[str], bool], maxParallel: int, reverse: bool = False) -> dict:
+    '''
+    runDeploymentGraph runs every node of a graph on up to maxParallel threads. Each node starts as soon as
+    the nodes it depends on are done, rather than waiting for the rest of its wave. The nodes that depend
+    on a failed node are skipped
+
+    Args:
+        graph (dict): {node: set of the nodes it depends on}
+        runNode (Callable): Called as runNode(node), returns True when the node succeeded
+        maxParallel (int): The maximum number of nodes being run at the same time
+        reverse (bool): Run the graph backwards, i.e. to delete the stacks
+
+    Returns:
+        dict: {node: done, failed or skipped}
+    '''
+    dependencies = reverseGraph(graph) if reverse else graph
+    sorter = graphlib.TopologicalSorter(dependencies)
+    sorter.prepare()
+    results = {}
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(maxParallel, 1)) as executor:
+        while sorter.is_active():
+            for node in sorted(sorter.get_ready()):
+                if any(results.get(dependency) != 'done' for dependency in dependencies[node]):
+                    results[node] = 'skipped'
+                    sorter.done(node)
+                else:
+                    running[executor.submit(runNode, node)] = node
+            if not running:
+                # only skipped nodes were ready, the nodes that depend on them are ready now
+                continue
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                results[node] = 'done' if future.result() else 'failed'
+                sorter.done(node)
+    return results
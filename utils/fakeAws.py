@@ -0,0 +1,538 @@
+import collections
+import datetime
+import functools
+import math
+import re
+import threading
+import time
+import types
+import uuid
+from typing import Callable, Optional
+
+import botocore.exceptions
+import botocore.hooks
+import botocore.model
+
+
+# the names botocore's cloudformation model allows for a change set
+CHANGE_SET_NAME_PATTERN = re.compile(r'^[a-zA-Z][-a-zA-Z0-9]{0,127}$')
+
+
+class FakeAwsAccount():
+    """
+    Summary: An in-memory stand-in for the parts of aws the lab scripts call, used to test, benchmark and
+    try out the scripts offline. Stacks finish stackLatency seconds after an operation starts and
+    every api call takes apiLatency seconds. Every call is counted by region and operation
+    """
+    def __init__(self, stackLatency: float = 0.05, apiLatency: float = 0.0, accountId: str = '123456789012'):
+        self.stackLatency = stackLatency
+        self.apiLatency = apiLatency
+        self.accountId = accountId
+        self.stacks = {}
+        self.stackSets = {}
+        self.bucketObjects = collections.defaultdict(dict)
+        self.apiCalls = collections.Counter()
+        self.lock = threading.Lock()
+
+    def client(self, serviceName: str, profileName: Optional[str] = None, regionName: Optional[str] = None):
+        '''
+        client returns a fake client for a service, it has the same signature as AwsClientPool.getClient
+        so it can be used as the pool's client factory
+        '''
+        if serviceName == 'cloudformation':
+            return FakeCloudFormationClient(self, regionName or 'us-east-1')
+        if serviceName == 'sts':
+            return FakeStsClient(self, regionName or 'us-east-1')
+        if serviceName == 's3':
+            return FakeS3Client(self, regionName or 'us-east-1')
+        raise NotImplementedError(f'FakeAwsAccount has no {serviceName} client')
+
+    def totalApiCalls(self) -> int:
+        return sum(self.apiCalls.values())
+
+    def recordCall(self, region: str, operation: str) -> None:
+        with self.lock:
+            self.apiCalls[(region, operation)] += 1
+        if self.apiLatency:
+            time.sleep(self.apiLatency)
+
+
+def templateExportsAndImports(templateBody: str, parameters: list, region: str, stackName: str) -> tuple:
+    # the export names a template creates and imports, a body that is not a template has neither
+    from utils.deploymentGraph import stackInterface
+    from utils.templatePreflight import loadTemplate
+    try:
+        interface = stackInterface(loadTemplate(templateBody), parameters, region, stackName)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return [], []
+    return interface['exports'], interface['imports']
+
+
+def clientError(code: str, message: str, operation: str, httpStatus: int = 400) -> botocore.exceptions.ClientError:
+    return botocore.exceptions.ClientError({
+        'Error': {'Code': code, 'Message': message},
+        'ResponseMetadata': {'HTTPStatusCode': httpStatus}
+    }, operation)
+
+
+class FakeClientMeta():
+    """
+    Summary: The parts of a botocore client's meta the lab scripts use. Its events are a real botocore
+    emitter, so handlers registered on a fake client (i.e. the rate limiter and the call metrics) run
+    """
+    def __init__(self, serviceId: str, region: str):
+        self.events = botocore.hooks.HierarchicalEmitter()
+        self.region_name = region
+        self.service_model = types.SimpleNamespace(service_id=botocore.model.ServiceId(serviceId))
+
+
+class FakeClient():
+    """
+    Summary: The base of the fake clients, the calls are made through the same botocore events, in the
+    same order, as a real client's: before-call, before-send, needs-retry and after-call. Errors are
+    raised once after-call has seen the error response
+    """
+    serviceId = ''
+
+    def __init__(self, account: FakeAwsAccount, region: str):
+        self.account = account
+        self.region = region
+        self.meta = FakeClientMeta(self.serviceId, region)
+
+    def _makeCall(self, operationName: str, operation: Callable, *args, **kwargs) -> dict:
+        events = self.meta.events
+        event_suffix = f'{self.meta.service_model.service_id.hyphenize()}.{operationName}'
+        model = types.SimpleNamespace(name=operationName)
+        context = {}
+        events.emit(f'before-call.{event_suffix}', model=model, params=kwargs, request_signer=None, context=context)
+        events.emit(f'before-send.{event_suffix}', request=None)
+        self.account.recordCall(self.region, operationName)
+        error = None
+        try:
+            parsed = operation(self, *args, **kwargs)
+        except botocore.exceptions.ClientError as err:
+            parsed, error = err.response, err
+        http_response = types.SimpleNamespace(status_code=parsed.get('ResponseMetadata', {}).get('HTTPStatusCode', 200))
+        events.emit(f'needs-retry.{event_suffix}', response=(http_response, parsed), endpoint=None, operation=model,
+                    attempts=1, caught_exception=None, request_dict={})
+        events.emit(f'after-call.{event_suffix}', http_response=http_response, parsed=parsed, model=model, context=context)
+        if error is not None:
+            raise error
+        return parsed
+
+
+def fakeOperation(operationName: str) -> Callable:
+    # marks a fake client method as the api operation operationName, its calls go through the client's events
+    def decorator(operation: Callable) -> Callable:
+        @functools.wraps(operation)
+        def call(self, *args, **kwargs) -> dict:
+            return self._makeCall(operationName, operation, *args, **kwargs)
+        return call
+    return decorator
+
+
+class FakeStack():
+    """
+    Summary: The state of one fake stack, its status is worked out from when the last operation started
+    """
+    def __init__(self, stackId: str, stackName: str, templateBody: str, parameters: list, latency: float):
+        self.stackId = stackId
+        self.stackName = stackName
+        self.templateBody = templateBody
+        self.parameters = parameters
+        self.latency = latency
+        self.operation = 'CREATE'
+        self.startedAt = time.time()
+        self.changeSets = {}
+        self.bucketName = f'{stackName.lower()}-s3bucket-{uuid.uuid4().hex[:12]}'
+        self.failed = False
+        self.statusReason = None
+        self.exports, self.imports = templateExportsAndImports(templateBody, parameters, stackId.split(':')[3], stackName)
+
+    def startOperation(self, operation: str, failed: bool = False, statusReason: Optional[str] = None) -> None:
+        self.operation = operation
+        self.startedAt = time.time()
+        self.failed = failed
+        self.statusReason = statusReason
+
+    def status(self) -> str:
+        if time.time() - self.startedAt < self.latency:
+            return f'{self.operation}_IN_PROGRESS'
+        return f'{self.operation}_FAILED' if self.failed else f'{self.operation}_COMPLETE'
+
+    def describe(self) -> dict:
+        description = {
+            'StackId': self.stackId,
+            'StackName': self.stackName,
+            'StackStatus': self.status(),
+            'Parameters': self.parameters,
+            'CreationTime': datetime.datetime.fromtimestamp(self.startedAt, datetime.timezone.utc),
+        }
+        if self.failed and self.statusReason and self.status().endswith('_FAILED'):
+            description['StackStatusReason'] = self.statusReason
+        return description
+
+    def stackEvents(self) -> list:
+        # the events of the current operation, as cloudformation would have reported them so far
+        elapsed = time.time() - self.startedAt
+        timestamp = lambda offset: datetime.datetime.fromtimestamp(self.startedAt + offset, datetime.timezone.utc)
+        event = lambda number, logicalId, resourceType, status, offset: {
+            'EventId': f'{self.stackId}-{self.operation}-{self.startedAt}-{number}',
+            'StackId': self.stackId,
+            'StackName': self.stackName,
+            'LogicalResourceId': logicalId,
+            'ResourceType': resourceType,
+            'ResourceStatus': status,
+            'Timestamp': timestamp(offset),
+        }
+        events = [event(1, self.stackName, 'AWS::CloudFormation::Stack', f'{self.operation}_IN_PROGRESS', 0)]
+        if elapsed >= self.latency / 2:
+            events.append(event(2, 's3Bucket', 'AWS::S3::Bucket', f'{self.operation}_IN_PROGRESS', self.latency / 2))
+        if elapsed >= self.latency:
+            events.append(event(3, 's3Bucket', 'AWS::S3::Bucket', f'{self.operation}_FAILED' if self.failed else f'{self.operation}_COMPLETE', self.latency))
+            events.append(event(4, self.stackName, 'AWS::CloudFormation::Stack', self.status(), self.latency))
+        return events[::-1]
+
+
+class FakeStackSet():
+    """
+    Summary: The state of one fake stack set. Each operation finishes latency seconds per batch of
+    MaxConcurrentCount regions after it starts, the instances are only changed once it has finished
+    """
+    def __init__(self, stackSetId: str, stackSetName: str, templateBody: str, parameters: list, latency: float, accountId: str):
+        self.stackSetId = stackSetId
+        self.accountId = accountId
+        self.stackSetName = stackSetName
+        self.templateBody = templateBody
+        self.parameters = parameters
+        self.latency = latency
+        self.instances = {}
+        self.operations = {}
+
+    def startOperation(self, action: str, regions: list, preferences: Optional[dict]) -> str:
+        self.settle()
+        if any(operation['Status'] == 'RUNNING' for operation in self.operations.values()):
+            raise clientError('OperationInProgressException', f'Another Operation on StackSet {self.stackSetId} is in progress', f'{action.title()}StackInstances', 409)
+        max_concurrent = (preferences or {}).get('MaxConcurrentCount', 1)
+        operation_id = f'{uuid.uuid4()}'
+        self.operations[operation_id] = {
+            'OperationId': operation_id,
+            'StackSetId': self.stackSetId,
+            'Action': action,
+            'Status': 'RUNNING',
+            'CreationTimestamp': datetime.datetime.now(datetime.timezone.utc),
+            'regions': list(regions),
+            'finishesAt': time.time() + self.latency * math.ceil(max(len(regions), 1) / max(max_concurrent, 1)),
+        }
+        for region in regions:
+            instance = self.instances.setdefault(region, {'Region': region, 'StackId': None})
+            instance['DetailedStatus'] = 'RUNNING'
+        return operation_id
+
+    def settle(self) -> None:
+        # applies the operations that have finished by now
+        for operation in self.operations.values():
+            if operation['Status'] != 'RUNNING' or time.time() < operation['finishesAt']:
+                continue
+            operation['Status'] = 'SUCCEEDED'
+            operation['EndTimestamp'] = datetime.datetime.now(datetime.timezone.utc)
+            for region in operation['regions']:
+                if operation['Action'] == 'DELETE':
+                    self.instances.pop(region, None)
+                    continue
+                instance = self.instances[region]
+                instance['StackId'] = instance['StackId'] or f'arn:aws:cloudformation:{region}:{self.accountId}:stack/StackSet-{self.stackSetName}-{uuid.uuid4()}'
+                instance['DetailedStatus'] = 'SUCCEEDED'
+
+    def describeOperation(self, operationId: str) -> dict:
+        self.settle()
+        return {key: value for key, value in self.operations[operationId].items() if key not in ('regions', 'finishesAt')}
+
+
+class FakeCloudFormationClient(FakeClient):
+    """
+    Summary: A fake cloudformation client for one region of a FakeAwsAccount
+    """
+    serviceId = 'CloudFormation'
+
+    def _findStack(self, stackName: str, operation: str) -> FakeStack:
+        with self.account.lock:
+            stack = self.account.stacks.get(stackName)
+            if stack is None:
+                for candidate in self.account.stacks.values():
+                    if candidate.stackName == stackName and f':{self.region}:' in candidate.stackId and candidate.status() != 'DELETE_COMPLETE':
+                        stack = candidate
+        if stack is None:
+            raise clientError('ValidationError', f'Stack with id {stackName} does not exist', operation)
+        return stack
+
+    @fakeOperation('CreateStack')
+    def create_stack(self, StackName: str, TemplateBody: str = '', Parameters: list = None, **kwargs) -> dict:
+        try:
+            self._findStack(StackName, 'CreateStack')
+            raise clientError('AlreadyExistsException', f'Stack [{StackName}] already exists', 'CreateStack')
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] != 'ValidationError':
+                raise
+        stack_id = f'arn:aws:cloudformation:{self.region}:{self.account.accountId}:stack/{StackName}/{uuid.uuid4()}'
+        stack = FakeStack(stack_id, StackName, TemplateBody, Parameters or [], self.account.stackLatency)
+        # like cloudformation, a stack that imports an export no finished stack of the region has fails
+        exports = self._regionExports()
+        missing_imports = [name for name in stack.imports if name not in exports]
+        if missing_imports:
+            stack.startOperation('CREATE', failed=True, statusReason=f'No export named {missing_imports[0]} found')
+        with self.account.lock:
+            self.account.stacks[stack_id] = stack
+        return {'StackId': stack_id}
+
+    @fakeOperation('UpdateStack')
+    def update_stack(self, StackName: str, TemplateBody: str = '', Parameters: list = None, **kwargs) -> dict:
+        stack = self._findStack(StackName, 'UpdateStack')
+        if stack.templateBody == TemplateBody and stack.parameters == (Parameters or []):
+            raise clientError('ValidationError', 'No updates are to be performed.', 'UpdateStack')
+        stack.templateBody = TemplateBody
+        stack.parameters = Parameters or []
+        stack.exports, stack.imports = templateExportsAndImports(TemplateBody, stack.parameters, self.region, stack.stackName)
+        stack.startOperation('UPDATE')
+        return {'StackId': stack.stackId}
+
+    @fakeOperation('DeleteStack')
+    def delete_stack(self, StackName: str) -> dict:
+        try:
+            stack = self._findStack(StackName, 'DeleteStack')
+        except botocore.exceptions.ClientError:
+            return {}
+        # like cloudformation, a bucket that still has objects in it fails the delete, as does an export
+        # another stack of the region still imports
+        with self.account.lock:
+            bucket_not_empty = bool(self.account.bucketObjects.get(stack.bucketName))
+            importers = {name: other.stackName for other in self.account.stacks.values()
+                         if other is not stack and f':{self.region}:' in other.stackId and other.status() != 'DELETE_COMPLETE'
+                         for name in other.imports if name in stack.exports}
+        if importers:
+            name = next(iter(importers))
+            stack.startOperation('DELETE', failed=True, statusReason=f'Export {name} cannot be deleted as it is in use by {importers[name]}')
+        else:
+            stack.startOperation('DELETE', failed=bucket_not_empty)
+        return {}
+
+    def _regionExports(self) -> dict:
+        with self.account.lock:
+            return {name: stack.stackId for stack in self.account.stacks.values()
+                    if f':{self.region}:' in stack.stackId and stack.status() in ('CREATE_COMPLETE', 'UPDATE_COMPLETE') for name in stack.exports}
+
+    @fakeOperation('ListExports')
+    def list_exports(self, NextToken: str = None, **kwargs) -> dict:
+        return {'Exports': [{'ExportingStackId': stack_id, 'Name': name, 'Value': f'{stack_id}/{name}'} for name, stack_id in self._regionExports().items()]}
+
+    @fakeOperation('DescribeStacks')
+    def describe_stacks(self, StackName: str = None, NextToken: str = None, **kwargs) -> dict:
+        if StackName is not None:
+            return {'Stacks': [self._findStack(StackName, 'DescribeStacks').describe()]}
+        # without a stack name every stack of the region that is not deleted is listed, a page at a time
+        with self.account.lock:
+            stacks = [stack for stack in self.account.stacks.values() if f':{self.region}:' in stack.stackId and stack.status() != 'DELETE_COMPLETE']
+        start = int(NextToken or 0)
+        response = {'Stacks': [stack.describe() for stack in stacks[start:start + 100]]}
+        if start + 100 < len(stacks):
+            response['NextToken'] = f'{start + 100}'
+        return response
+
+    @fakeOperation('DescribeStackResources')
+    def describe_stack_resources(self, StackName: str, **kwargs) -> dict:
+        stack = self._findStack(StackName, 'DescribeStackResources')
+        return {'StackResources': [{
+            'StackName': stack.stackName,
+            'StackId': stack.stackId,
+            'LogicalResourceId': 's3Bucket',
+            'PhysicalResourceId': stack.bucketName,
+            'ResourceType': 'AWS::S3::Bucket',
+            'ResourceStatus': stack.status(),
+        }]}
+
+    @fakeOperation('DescribeStackEvents')
+    def describe_stack_events(self, StackName: str, **kwargs) -> dict:
+        return {'StackEvents': self._findStack(StackName, 'DescribeStackEvents').stackEvents()}
+
+    @fakeOperation('GetTemplate')
+    def get_template(self, StackName: str, **kwargs) -> dict:
+        return {'TemplateBody': self._findStack(StackName, 'GetTemplate').templateBody}
+
+    @fakeOperation('CreateChangeSet')
+    def create_change_set(self, StackName: str, ChangeSetName: str, TemplateBody: str = '', Parameters: list = None, **kwargs) -> dict:
+        if not CHANGE_SET_NAME_PATTERN.match(ChangeSetName):
+            raise clientError('ValidationError', f"1 validation error detected: Value '{ChangeSetName}' at 'changeSetName' failed to satisfy constraint: "
+                              'Member must satisfy regular expression pattern: [a-zA-Z][-a-zA-Z0-9]*', 'CreateChangeSet')
+        stack = self._findStack(StackName, 'CreateChangeSet')
+        change_set_id = f'{stack.stackId.replace(":stack/", ":changeSet/")}/{ChangeSetName}'
+        stack.changeSets[change_set_id] = (TemplateBody, Parameters or [])
+        return {'Id': change_set_id, 'StackId': stack.stackId}
+
+    def _findChangeSet(self, changeSetId: str, operation: str):
+        stack = self._findStack(changeSetId.rsplit('/', 1)[0].replace(':changeSet/', ':stack/'), operation)
+        if changeSetId not in stack.changeSets:
+            raise clientError('ChangeSetNotFound', f'ChangeSet [{changeSetId}] does not exist', operation, 404)
+        return stack
+
+    @fakeOperation('DescribeChangeSet')
+    def describe_change_set(self, ChangeSetName: str, **kwargs) -> dict:
+        stack = self._findChangeSet(ChangeSetName, 'DescribeChangeSet')
+        template_body, parameters = stack.changeSets[ChangeSetName]
+        if template_body == stack.templateBody and parameters == stack.parameters:
+            return {'ChangeSetId': ChangeSetName, 'Status': 'FAILED', 'StatusReason': "The submitted information didn't contain changes. Submit different information to create a change set.", 'Changes': []}
+        changes = [{'ResourceChange': {'Action': 'Modify', 'LogicalResourceId': 's3Bucket', 'ResourceType': 'AWS::S3::Bucket', 'Replacement': 'False'}}]
+        return {'ChangeSetId': ChangeSetName, 'Status': 'CREATE_COMPLETE', 'Changes': changes}
+
+    @fakeOperation('ExecuteChangeSet')
+    def execute_change_set(self, ChangeSetName: str, **kwargs) -> dict:
+        stack = self._findChangeSet(ChangeSetName, 'ExecuteChangeSet')
+        stack.templateBody, stack.parameters = stack.changeSets.pop(ChangeSetName)
+        stack.startOperation('UPDATE')
+        return {}
+
+    @fakeOperation('DeleteChangeSet')
+    def delete_change_set(self, ChangeSetName: str, **kwargs) -> dict:
+        self._findChangeSet(ChangeSetName, 'DeleteChangeSet').changeSets.pop(ChangeSetName)
+        return {}
+
+    def _findStackSet(self, stackSetName: str, operation: str) -> FakeStackSet:
+        with self.account.lock:
+            stack_set = self.account.stackSets.get(stackSetName)
+        if stack_set is None:
+            raise clientError('StackSetNotFoundException', f'StackSet {stackSetName} not found', operation, 404)
+        return stack_set
+
+    @fakeOperation('CreateStackSet')
+    def create_stack_set(self, StackSetName: str, TemplateBody: str = '', Parameters: list = None, **kwargs) -> dict:
+        with self.account.lock:
+            if StackSetName in self.account.stackSets:
+                raise clientError('NameAlreadyExistsException', f'StackSet {StackSetName} already exists', 'CreateStackSet', 409)
+            stack_set_id = f'{StackSetName}:{uuid.uuid4()}'
+            self.account.stackSets[StackSetName] = FakeStackSet(stack_set_id, StackSetName, TemplateBody, Parameters or [], self.account.stackLatency, self.account.accountId)
+        return {'StackSetId': stack_set_id}
+
+    @fakeOperation('UpdateStackSet')
+    def update_stack_set(self, StackSetName: str, TemplateBody: str = '', Parameters: list = None, OperationPreferences: dict = None, **kwargs) -> dict:
+        stack_set = self._findStackSet(StackSetName, 'UpdateStackSet')
+        with self.account.lock:
+            stack_set.templateBody = TemplateBody
+            stack_set.parameters = Parameters or []
+            return {'OperationId': stack_set.startOperation('UPDATE', list(stack_set.instances), OperationPreferences)}
+
+    @fakeOperation('DeleteStackSet')
+    def delete_stack_set(self, StackSetName: str, **kwargs) -> dict:
+        stack_set = self._findStackSet(StackSetName, 'DeleteStackSet')
+        with self.account.lock:
+            stack_set.settle()
+            if stack_set.instances:
+                raise clientError('StackSetNotEmptyException', f'StackSet {StackSetName} is not empty', 'DeleteStackSet', 409)
+            del self.account.stackSets[StackSetName]
+        return {}
+
+    @fakeOperation('CreateStackInstances')
+    def create_stack_instances(self, StackSetName: str, Regions: list, OperationPreferences: dict = None, **kwargs) -> dict:
+        stack_set = self._findStackSet(StackSetName, 'CreateStackInstances')
+        with self.account.lock:
+            return {'OperationId': stack_set.startOperation('CREATE', Regions, OperationPreferences)}
+
+    @fakeOperation('DeleteStackInstances')
+    def delete_stack_instances(self, StackSetName: str, Regions: list, OperationPreferences: dict = None, **kwargs) -> dict:
+        stack_set = self._findStackSet(StackSetName, 'DeleteStackInstances')
+        with self.account.lock:
+            return {'OperationId': stack_set.startOperation('DELETE', Regions, OperationPreferences)}
+
+    @fakeOperation('DescribeStackSetOperation')
+    def describe_stack_set_operation(self, StackSetName: str, OperationId: str, **kwargs) -> dict:
+        stack_set = self._findStackSet(StackSetName, 'DescribeStackSetOperation')
+        with self.account.lock:
+            if OperationId not in stack_set.operations:
+                raise clientError('OperationNotFoundException', f'Operation {OperationId} not found', 'DescribeStackSetOperation', 404)
+            return {'StackSetOperation': stack_set.describeOperation(OperationId)}
+
+    @fakeOperation('ListStackInstances')
+    def list_stack_instances(self, StackSetName: str, NextToken: str = None, MaxResults: int = 100, **kwargs) -> dict:
+        stack_set = self._findStackSet(StackSetName, 'ListStackInstances')
+        with self.account.lock:
+            stack_set.settle()
+            summaries = [{
+                'StackSetId': stack_set.stackSetId,
+                'Region': instance['Region'],
+                'Account': self.account.accountId,
+                'StackId': instance['StackId'],
+                'Status': 'CURRENT' if instance['DetailedStatus'] == 'SUCCEEDED' else 'OUTDATED',
+                'StackInstanceStatus': {'DetailedStatus': instance['DetailedStatus']},
+            } for instance in stack_set.instances.values()]
+        start = int(NextToken or 0)
+        response = {'Summaries': summaries[start:start + MaxResults]}
+        if start + MaxResults < len(summaries):
+            response['NextToken'] = f'{start + MaxResults}'
+        return response
+
+
+class FakeS3Client(FakeClient):
+    """
+    Summary: A fake s3 client for one region of a FakeAwsAccount, its buckets are the ones of the fake stacks
+    """
+    serviceId = 'S3'
+
+    def _bucketObjects(self, bucketName: str, operation: str) -> dict:
+        with self.account.lock:
+            exists = any(stack.bucketName == bucketName and stack.status() != 'DELETE_COMPLETE' for stack in self.account.stacks.values())
+        if not exists:
+            raise clientError('NoSuchBucket', 'The specified bucket does not exist', operation, 404)
+        return self.account.bucketObjects[bucketName]
+
+    @fakeOperation('PutObject')
+    def put_object(self, Bucket: str, Key: str, Body: bytes = b'', **kwargs) -> dict:
+        objects = self._bucketObjects(Bucket, 'PutObject')
+        version_id = uuid.uuid4().hex
+        with self.account.lock:
+            objects[(Key, version_id)] = len(Body)
+        return {'VersionId': version_id}
+
+    @fakeOperation('ListObjectVersions')
+    def list_object_versions(self, Bucket: str, MaxKeys: int = 1000, KeyMarker: str = None, VersionIdMarker: str = None, **kwargs) -> dict:
+        objects = self._bucketObjects(Bucket, 'ListObjectVersions')
+        with self.account.lock:
+            versions = sorted(objects)
+        if KeyMarker is not None:
+            versions = [version for version in versions if version > (KeyMarker, VersionIdMarker or '')]
+        page = versions[:MaxKeys]
+        response = {'Versions': [{'Key': key, 'VersionId': version_id, 'Size': objects.get((key, version_id), 0)} for key, version_id in page],
+                    'IsTruncated': len(versions) > MaxKeys}
+        if response['IsTruncated']:
+            response['NextKeyMarker'], response['NextVersionIdMarker'] = page[-1]
+        return response
+
+    @fakeOperation('DeleteObjects')
+    def delete_objects(self, Bucket: str, Delete: dict, **kwargs) -> dict:
+        if len(Delete['Objects']) > 1000:
+            raise clientError('MalformedXML', 'The XML you provided was not well-formed or did not validate against our published schema', 'DeleteObjects')
+        objects = self._bucketObjects(Bucket, 'DeleteObjects')
+        with self.account.lock:
+            for deleted in Delete['Objects']:
+                objects.pop((deleted['Key'], deleted.get('VersionId')), None)
+        return {'Deleted': [] if Delete.get('Quiet') else Delete['Objects']}
+
+    @fakeOperation('HeadBucket')
+    def head_bucket(self, Bucket: str, **kwargs) -> dict:
+        with self.account.lock:
+            exists = any(stack.bucketName == Bucket and stack.status() != 'DELETE_COMPLETE' for stack in self.account.stacks.values())
+        if not exists:
+            raise clientError('404', 'Not Found', 'HeadBucket', 404)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class FakeStsClient(FakeClient):
+    """
+    Summary: A fake sts client for a FakeAwsAccount
+    """
+    serviceId = 'STS'
+
+    @fakeOperation('GetCallerIdentity')
+    def get_caller_identity(self, **kwargs) -> dict:
+        return {
+            'UserId': 'AIDAFAKEUSERID',
+            'Account': self.account.accountId,
+            'Arn': f'arn:aws:iam::{self.account.accountId}:user/fake-user',
+        }
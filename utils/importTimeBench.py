@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# ===========================================================================================================
+# Description:
+#     Measures the startup cost of the labsCli subcommands with "python -X importtime". Each command is
+#     run several times, the median total import time is reported with the slowest top level imports,
+#     and the script exits non-zero when a command fails or goes over --max_ms so CI can track regressions
+#
+# ===========================================================================================================
+
+import argparse, json, os, statistics, subprocess, sys
+
+# appending the path so that packages can be imported from a parent level
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from utils.pyColors import MinStyle  # isort:skip
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+LABS_CLI = os.path.join(REPO_DIR, 'labsCli.py')
+
+BENCH_COMMANDS = {
+    'labsCli --help': ['--help'],
+    'stacks --help': ['stacks', '--help'],
+    'creds --help': ['creds', '--help'],
+}
+
+# create the commandline parser
+my_parser = argparse.ArgumentParser(prog='importTimeBench',
+                                    description='Report the import time of the labsCli subcommands using python -X importtime')
+
+# adding cli arguments
+my_parser.add_argument('--runs',
+                       type=int,
+                       default=5,
+                       help='The number of times each command is run, the median is reported')
+
+my_parser.add_argument('--max_ms',
+                       type=float,
+                       default=None,
+                       help='Exit with an error if the median import time of any command is over this many milliseconds')
+
+my_parser.add_argument('--top',
+                       type=int,
+                       default=5,
+                       help='The number of slowest top level imports to show for each command')
+
+my_parser.add_argument('--json_file',
+                       type=str,
+                       default=None,
+                       help='Also write the results to this json file')
+
+
+def parseImportTime(stderr: str) -> list:
+    '''
+    parseImportTime reads the "import time:" lines written by python -X importtime
+
+    Args:
+        stderr (str): The stderr output of the python process
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) for every import, in the order they finished
+    '''
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        depth = (len(module) - len(module.lstrip())) // 2
+        imports.append((module.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def benchCommand(cliArgs: list, runs: int) -> dict:
+    totals = []
+    imports = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', LABS_CLI] + cliArgs,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            # a command that crashed (i.e. on a missing module) stops early, its import time means nothing
+            error_lines = [line for line in completed.stderr.splitlines() if line.strip() and not line.startswith('import time:')]
+            return {'returncode': completed.returncode, 'error': error_lines[-1] if error_lines else ''}
+        imports = parseImportTime(completed.stderr)
+        totals.append(sum(self_us for _, self_us, _, _ in imports) / 1000)
+    top_level = sorted((imp for imp in imports if imp[3] <= 1), key=lambda imp: imp[2], reverse=True)
+    return {
+        'returncode': 0,
+        'median_ms': round(statistics.median(totals), 2),
+        'modules': len(imports),
+        'slowest': [{'module': module, 'cumulative_ms': round(cumulative_us / 1000, 2)} for module, _, cumulative_us, _ in top_level]
+    }
+
+
+def main(argv: list = None) -> None:
+    args = my_parser.parse_args(argv)
+    results = {name: benchCommand(cli_args, max(args.runs, 1)) for name, cli_args in BENCH_COMMANDS.items()}
+
+    print(f'\n{MinStyle.WHITE}Import time (median of {args.runs} runs){MinStyle.RESET}')
+    print(f'{MinStyle.DIV_SINGLE_MEDIUM}{MinStyle.RESET}')
+    over_budget = []
+    failed = []
+    for name, result in results.items():
+        if result['returncode'] != 0:
+            failed.append(name)
+            print(f'{MinStyle.PINK}{name:<16}{MinStyle.LIGHTRED}failed with exit code {result["returncode"]}{MinStyle.RESET}  {result["error"]}')
+            continue
+        ms_clr = MinStyle.LIGHTGREEN
+        if args.max_ms is not None and result['median_ms'] > args.max_ms:
+            ms_clr = MinStyle.LIGHTRED
+            over_budget.append(name)
+        print(f'{MinStyle.PINK}{name:<16}{ms_clr}{result["median_ms"]:>8.2f} ms{MinStyle.RESET}  {result["modules"]} modules')
+        for slow in result['slowest'][:args.top]:
+            print(f'    {MinStyle.LIGHTCYAN}{slow["module"]:<32}{MinStyle.LIGHTGREY}{slow["cumulative_ms"]:>8.2f} ms{MinStyle.RESET}')
+    print()
+
+    if args.json_file:
+        with open(args.json_file, 'w') as jsonFile:
+            json.dump(results, jsonFile, indent=4)
+    if failed:
+        sys.exit(f'{MinStyle.LIGHTRED}Commands failed: {", ".join(failed)}{MinStyle.RESET}')
+    if over_budget:
+        sys.exit(f'{MinStyle.LIGHTRED}Import time over {args.max_ms} ms for: {", ".join(over_budget)}{MinStyle.RESET}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+from typing import Callable
+
+import botocore.exceptions
+
+from utils.awsErrors import THROTTLING_ERROR_CODES, isThrottlingError
+
+
+class TokenBucket():
+    """
+    Summary: A thread safe token bucket. acquire() blocks until a token is free, tokens refill at rate
+    per second up to burst. The rate is halved every time a call is throttled and grows back by a tenth
+    of the configured rate with every call that is not, so it settles just under the limit aws enforces
+    """
+    def __init__(self, rate: float, burst: float, minRate: float = 0.2):
+        self.maxRate = rate
+        self.minRate = min(minRate, rate)
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updatedAt = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+
+    def reserve(self) -> float:
+        # takes a token if one is free, otherwise returns how long to wait before trying again
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.reserve()
+
+    def throttled(self) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = max(self.rate / 2, self.minRate)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self) -> None:
+        with self._lock:
+            if self.rate < self.maxRate:
+                self._refill()
+                self.rate = min(self.rate + self.maxRate / 10, self.maxRate)
+
+
+class RegionRateLimiter():
+    """
+    Summary: Limits the aws api calls of a set of services to a rate per region, with one token bucket
+    shared by every client of a region. Clients are added with instrument(), every attempt botocore
+    sends (including its retries) takes a token and throttled responses slow the region's bucket down
+    """
+    def __init__(self, rate: float, burst: float = None, serviceNames: tuple = ('cloudformation',)):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate * 2, 1.0)
+        self.serviceNames = serviceNames
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def bucketFor(self, region: str) -> TokenBucket:
+        with self._lock:
+            bucket = self.buckets.get(region)
+            if bucket is None:
+                bucket = self.buckets[region] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def instrument(self, client, acquire: bool = True) -> None:
+        '''
+        instrument registers the limiter on a client's events. Clients of other services and clients
+        without botocore events are left as they are
+
+        Args:
+            client (botocore.client.BaseClient): The client to limit the calls of
+            acquire (bool): Take a token before each attempt. False only slows the region down when
+                it is throttled, for callers that take the tokens themselves (i.e. without blocking)
+        '''
+        events = getattr(getattr(client, 'meta', None), 'events', None)
+        if events is None:
+            return
+        service = client.meta.service_model.service_id.hyphenize()
+        if service not in self.serviceNames:
+            return
+        bucket = self.bucketFor(client.meta.region_name or 'global')
+        if acquire:
+            events.register(f'before-send.{service}', lambda **kwargs: bucket.acquire())
+        events.register(f'needs-retry.{service}', lambda **kwargs: self._needsRetry(bucket, **kwargs))
+
+    def _needsRetry(self, bucket: TokenBucket, response, **kwargs) -> None:
+        # returning None leaves the retry decision (and its backoff) to botocore
+        if response is None:
+            return None
+        if response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            bucket.throttled()
+        else:
+            bucket.succeeded()
+        return None
+
+
+def callWithThrottleRetry(apiCall: Callable, *args, maxAttempts: int = 5, baseDelay: float = 1.0, maxDelay: float = 20.0, **kwargs):
+    '''
+    callWithThrottleRetry calls an aws api and, if it is still throttled once botocore has run out of
+    retries, tries again after a full jitter exponential backoff. Any other error is raised straight away
+
+    Args:
+        apiCall (Callable): The client method, i.e. cf_client.create_stack
+        maxAttempts (int): The number of times the call is made before the throttling error is raised
+        baseDelay (float): The backoff, in seconds, before the second attempt
+        maxDelay (float): The longest backoff, in seconds
+
+    Returns:
+        Any: The response of the api call
+    '''
+    for attempt in range(1, maxAttempts + 1):
+        try:
+            return apiCall(*args, **kwargs)
+        except botocore.exceptions.ClientError as err:
+            if not isThrottlingError(err) or attempt == maxAttempts:
+                raise
+        time.sleep(random.uniform(0, min(maxDelay, baseDelay * 2 ** (attempt - 1))))
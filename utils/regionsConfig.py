@@ -0,0 +1,189 @@
+import json
+import os
+from typing import Optional
+
+
+# bump when the layout of the compiled index changes, so older index files are rebuilt
+INDEX_VERSION = 1
+# top level keys of the regions config that are not countries
+RESERVED_KEYS = ('groups', 'aliases', 'exclude')
+
+
+def knownRegions() -> set:
+    '''
+    knownRegions returns every region in the endpoint data that ships with botocore, no api call is made
+
+    Returns:
+        set: The region names of all partitions, i.e. us-east-1, cn-north-1
+    '''
+    import botocore.loaders
+    endpoints = botocore.loaders.create_loader().load_data('endpoints')
+    return {region for partition in endpoints['partitions'] for region in partition['regions']}
+
+
+def expandMembers(name: str, config: dict, groups: dict, resolving: tuple = ()) -> list:
+    # a group member is a country, another group or a single region
+    if name in resolving:
+        raise ValueError(f'group {resolving[0]} includes itself through {" -> ".join(resolving + (name,))}')
+    if name in groups:
+        group = groups[name]
+        include = group.get('include', []) if isinstance(group, dict) else group
+        exclude = set(group.get('exclude', [])) if isinstance(group, dict) else set()
+        regions = []
+        for member in include:
+            regions += expandMembers(member, config, groups, resolving + (name,))
+        return [region for region in regions if region not in exclude]
+    if name in config and name not in RESERVED_KEYS:
+        return list(config[name] or [])
+    return [name]
+
+
+def compileRegionsConfig(config: dict, validRegions: Optional[set] = None) -> dict:
+    '''
+    compileRegionsConfig turns a parsed regions config into an index of the regions of every country,
+    group and alias. Groups are expanded, duplicates dropped and the excluded regions removed
+
+    Args:
+        config (dict): The parsed regions config
+        validRegions (set): The region names that exist, or None to skip validating the regions
+
+    Raises:
+        ValueError: Lists every problem found in the config, i.e. regions that do not exist
+
+    Returns:
+        dict: {countries: {name: [regions]}, aliases: {alias: name}, choices: [names and aliases]}
+    '''
+    if not isinstance(config, dict):
+        raise ValueError('the regions config must be a mapping of countries to lists of regions')
+    groups = config.get('groups') or {}
+    aliases = config.get('aliases') or {}
+    excluded = set(config.get('exclude') or [])
+    problems = []
+    countries = {}
+    for name, regions in config.items():
+        if name in RESERVED_KEYS:
+            continue
+        if not isinstance(regions, list):
+            problems.append(f'country {name} must be a list of regions')
+            continue
+        countries[name] = regions
+    for name in groups:
+        if name in countries:
+            problems.append(f'group {name} has the same name as a country')
+            continue
+        try:
+            countries[name] = expandMembers(name, config, groups)
+        except ValueError as err:
+            problems.append(f'{err}')
+    for alias, name in aliases.items():
+        if alias in countries:
+            problems.append(f'alias {alias} has the same name as a country or group')
+        elif name not in countries:
+            problems.append(f'alias {alias} is for {name}, which is not a country or group')
+    for name, regions in countries.items():
+        # dict.fromkeys drops duplicate regions and keeps the order they were listed in
+        countries[name] = [region for region in dict.fromkeys(regions) if region not in excluded]
+        if validRegions is not None:
+            unknown = [region for region in countries[name] if region not in validRegions]
+            if unknown:
+                problems.append(f'{name} lists regions that do not exist: {", ".join(unknown)}')
+    if problems:
+        raise ValueError('invalid regions config: ' + '; '.join(problems))
+    return {
+        'countries': countries,
+        'aliases': {alias: name for alias, name in aliases.items()},
+        'choices': sorted(countries) + sorted(aliases),
+    }
+
+
+def indexFile(configFile: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(configFile)), f'.{os.path.basename(configFile)}.index.json')
+
+
+def indexKey(configFile: str, validate: bool) -> dict:
+    config_stat = os.stat(configFile)
+    return {'version': INDEX_VERSION, 'mtime_ns': config_stat.st_mtime_ns, 'size': config_stat.st_size, 'validated': validate}
+
+
+def cachedRegionsIndex(configFile: str, validate: Optional[bool] = None) -> Optional[dict]:
+    '''
+    cachedRegionsIndex returns the compiled index of a regions config only if it is already cached and
+    up to date. Nothing is compiled, so neither yaml nor botocore is imported
+
+    Args:
+        configFile (str): The path of the regions config yaml
+        validate (bool): Only use an index compiled with (True) or without (False) validating the regions,
+                         None for either
+
+    Returns:
+        dict: The index, see compileRegionsConfig, or None when it is not cached
+    '''
+    try:
+        with open(indexFile(configFile), 'r') as cached:
+            cached_index = json.load(cached)
+        cached_key = cached_index.get('key') or {}
+        if validate is None:
+            validate = cached_key.get('validated')
+        if cached_key == indexKey(configFile, validate):
+            return cached_index['index']
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return None
+
+
+def loadRegionsIndex(configFile: str, validate: bool = True) -> dict:
+    '''
+    loadRegionsIndex returns the compiled index of a regions config. The index is kept in a json file
+    next to the config and only rebuilt when the config changes, so the yaml is not parsed and the
+    regions are not validated again on every run
+
+    Args:
+        configFile (str): The path of the regions config yaml
+        validate (bool): Check that every region exists, using botocore's endpoint data
+
+    Raises:
+        ValueError: When the config is not valid
+
+    Returns:
+        dict: The index, see compileRegionsConfig
+    '''
+    index_key = indexKey(configFile, validate)
+    index_file = indexFile(configFile)
+    cached_index = cachedRegionsIndex(configFile, validate)
+    if cached_index is not None:
+        return cached_index
+
+    import yaml
+    with open(configFile, 'r') as config:
+        index = compileRegionsConfig(yaml.safe_load(config), knownRegions() if validate else None)
+    # the index is only a cache, a config in a read only directory is compiled on every run instead
+    tmp_file = f'{index_file}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, 'w') as cached:
+            json.dump({'key': index_key, 'index': index}, cached)
+        os.replace(tmp_file, index_file)
+    except OSError:
+        pass
+    return index
+
+
+def countryRegions(index: dict, country: str) -> tuple:
+    '''
+    countryRegions looks up the regions of a country, group or alias
+
+    Args:
+        index (dict): The compiled regions index
+        country (str): The country, group or alias
+
+    Raises:
+        ValueError: When the country is not in the index, or has no regions
+
+    Returns:
+        tuple: The country's own name (aliases resolved) and its list of regions
+    '''
+    name = index['aliases'].get(country, country)
+    if name not in index['countries']:
+        raise ValueError(f'argument country: invalid choice: \'{country}\' (choose from {", ".join(index["choices"])})')
+    if not index['countries'][name]:
+        raise ValueError(f'{country} has no regions left once the excluded regions are removed')
+    return name, index['countries'][name]
@@ -0,0 +1,96 @@
+import datetime
+import json
+import os
+import threading
+from typing import Optional
+
+
+REGION_STATES = ('pending', 'in-progress', 'done', 'failed')
+
+
+class RunCheckpoint():
+    """
+    Summary: Records the state (pending, in-progress, done or failed) and stack id of every region of a
+    multi-region run as appended JSON lines, so a run that stopped part way can be resumed. The first
+    line identifies the run and lists its regions, after that the last line written for a region is
+    its current state. Every line is flushed as it is written, so it survives the script being killed
+    """
+    def __init__(self, checkpointFile: str, run: dict, regions: list, resume: bool = False):
+        self.checkpointFile = checkpointFile
+        self.run = run
+        self.regions = {region: {'state': 'pending'} for region in regions}
+        self._lock = threading.Lock()
+        resumed = resume and os.path.exists(checkpointFile)
+        if resumed:
+            self._load()
+        self._file = open(checkpointFile, 'a' if resumed else 'w')
+        if not resumed:
+            self._writeLine({'run': run, 'regions': list(regions)})
+
+    def _load(self) -> None:
+        with open(self.checkpointFile, 'r') as checkpoint:
+            lines = [json.loads(line) for line in checkpoint if line.strip()]
+        if not lines or lines[0].get('run') != self.run:
+            raise ValueError(f'Checkpoint {self.checkpointFile} is for a different run: {lines[0].get("run") if lines else "empty file"}')
+        for entry in lines[1:]:
+            if entry['region'] in self.regions:
+                self.regions[entry['region']] = {key: value for key, value in entry.items() if key != 'region'}
+
+    def _writeLine(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def record(self, region: str, state: str, stackId: Optional[str] = None, started: Optional[datetime.datetime] = None) -> None:
+        '''
+        record sets the state of a region, keeping its stack id and start time if they are not given
+
+        Args:
+            region (str): AWS region the state is for
+            state (str): One of [ pending, in-progress, done, failed ]
+            stackId (str): The AWS unique stack ID (the arn id)
+            started (datetime.datetime): When the region's stack operation was started
+        '''
+        if state not in REGION_STATES:
+            raise ValueError(f'Unknown region state {state}')
+        with self._lock:
+            region_state = dict(self.regions.get(region, {}), state=state)
+            if stackId is not None:
+                region_state['StackId'] = stackId
+            if started is not None:
+                region_state['started'] = started.isoformat()
+            self.regions[region] = region_state
+            self._writeLine(dict(region_state, region=region))
+
+    def state(self, region: str) -> dict:
+        '''
+        state returns the checkpointed state of a region
+
+        Args:
+            region (str): AWS region to get the state of
+
+        Returns:
+            dict: The state, with the StackId and started time (a datetime) when they are known
+        '''
+        with self._lock:
+            region_state = dict(self.regions.get(region, {'state': 'pending'}))
+        if 'started' in region_state:
+            region_state['started'] = datetime.datetime.fromisoformat(region_state['started'])
+        return region_state
+
+    def counts(self) -> dict:
+        with self._lock:
+            states = [region_state['state'] for region_state in self.regions.values()]
+        return {state: states.count(state) for state in REGION_STATES}
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def remove(self) -> None:
+        '''
+        remove closes and deletes the checkpoint, once every region of the run is done
+        '''
+        self.close()
+        os.remove(self.checkpointFile)
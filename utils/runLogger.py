@@ -0,0 +1,170 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+from typing import IO, Optional
+
+from utils.pyColors import MinStyle
+
+
+# the escape codes MinStyle (and MoreStyle) put in messages
+ANSI_ESCAPE = re.compile(r'\033\[[0-9;]*m')
+
+_listener = None
+
+
+def stripColors(text: str) -> str:
+    return ANSI_ESCAPE.sub('', text)
+
+
+def streamHasColor(stream: IO) -> bool:
+    # NO_COLOR (https://no-color.org) turns colors off even on a terminal
+    return hasattr(stream, 'isatty') and stream.isatty() and not os.environ.get('NO_COLOR')
+
+
+class ColorFormatter(logging.Formatter):
+    """
+    Summary: Formats records for the terminal. Messages keep the MinStyle colors they were written with,
+    warnings and errors without colors of their own are colored by level, and every color is stripped
+    when the stream is not a terminal, i.e. when the output is piped to a file
+    """
+    LEVEL_COLORS = {logging.WARNING: MinStyle.YELLOW, logging.ERROR: MinStyle.LIGHTRED, logging.CRITICAL: MinStyle.LIGHTRED}
+
+    def __init__(self, useColor: bool):
+        super().__init__('%(message)s')
+        self.useColor = useColor
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        if not self.useColor:
+            return stripColors(message)
+        level_color = self.LEVEL_COLORS.get(record.levelno)
+        if level_color and not ANSI_ESCAPE.search(message):
+            return f'{level_color}{message}{MinStyle.RESET}'
+        return message
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """
+    Summary: Writes records to the terminal. Like print(..., end=''), a record logged with extra={'end': ''}
+    leaves its line open. The next record finishes that line when it is logged with
+    extra={'continuesLine': True}, any other record starts on a new line
+    """
+    def __init__(self, stream: IO):
+        super().__init__(stream)
+        self.lineOpen = False
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = self.format(record)
+            if self.lineOpen and not getattr(record, 'continuesLine', False):
+                message = f'{self.terminator}{message}'
+            end = getattr(record, 'end', self.terminator)
+            self.stream.write(f'{message}{end}')
+            self.flush()
+            self.lineOpen = not end
+        except Exception:
+            self.handleError(record)
+
+    def closeLine(self) -> None:
+        if self.lineOpen:
+            self.stream.write(self.terminator)
+            self.flush()
+            self.lineOpen = False
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Summary: Formats each record as one line of json, without colors, with the region and any other
+    fields passed to the log call in extra={'fields': {...}}
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': stripColors(record.getMessage()).strip(),
+        }
+        if getattr(record, 'region', None):
+            entry['region'] = record.region
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def hasText(record: logging.LogRecord) -> bool:
+    # blank lines only space out the terminal output, they are left out of the log file
+    return bool(stripColors(record.getMessage()).strip())
+
+
+def forConsole(record: logging.LogRecord) -> bool:
+    # records logged with extra={'console': False} only go to the log file
+    return getattr(record, 'console', True)
+
+
+def startRunLogging(loggerName: str, logFile: Optional[str] = None, verbose: bool = False, stream: Optional[IO] = None) -> logging.Logger:
+    '''
+    startRunLogging sets up a logger whose records are put on a queue and written to the terminal (and
+    as json lines to logFile) by a single background thread, so the threads logging never wait on the
+    terminal and their lines never interleave
+
+    Args:
+        loggerName (str): The name of the logger, i.e. the script's name
+        logFile (str): The json lines log file, or None to only log to the terminal
+        verbose (bool): Also log debug records
+        stream (IO): The terminal stream, sys.stdout by default
+
+    Returns:
+        logging.Logger: The logger to log with
+    '''
+    global _listener
+    stopRunLogging()
+    stream = stream or sys.stdout
+    console_handler = ConsoleHandler(stream)
+    console_handler.setFormatter(ColorFormatter(streamHasColor(stream)))
+    console_handler.addFilter(forConsole)
+    handlers = [console_handler]
+    if logFile:
+        file_handler = logging.FileHandler(logFile, encoding='utf-8')
+        file_handler.setFormatter(JsonLinesFormatter())
+        file_handler.addFilter(hasText)
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(loggerName)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # scripts that end with sys.exit still write out what is left on the queue
+    atexit.unregister(stopRunLogging)
+    atexit.register(stopRunLogging)
+    return logger
+
+
+def stopRunLogging() -> None:
+    '''
+    stopRunLogging writes out the records still on the queue and closes the log file, it is safe to call
+    more than once
+    '''
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        if isinstance(handler, ConsoleHandler):
+            # a line left open is finished, so the exit message starts on a line of its own
+            handler.closeLine()
+        handler.flush()
+        if isinstance(handler, logging.FileHandler):
+            handler.close()
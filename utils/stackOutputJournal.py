@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, the in-process lock still applies
+    fcntl = None
+
+
+class StackOutputJournal():
+    """
+    Summary: Records the stack id created or updated in each region as one appended JSON line, so
+    each region costs a single small write no matter how many regions came before it. Lines are
+    flushed straight away and fsync'd in batches. compact() turns the journal into the
+    {region: StackId} map that the delete action reads
+    """
+    def __init__(self, journalFile: str, fsyncEvery: int = 8, fsyncInterval: float = 1.0):
+        self.journalFile = journalFile
+        self.fsyncEvery = fsyncEvery
+        self.fsyncInterval = fsyncInterval
+        self.entries = 0
+        self._file = None
+        self._unsynced = 0
+        self._lastSync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def append(self, region: str, stackId: str) -> None:
+        '''
+        append adds the stack id of a region to the end of the journal
+
+        Args:
+            region (str): AWS region that the stack is in
+            stackId (str): The AWS unique stack ID (the arn id)
+        '''
+        line = json.dumps({'region': region, 'StackId': stackId}) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journalFile, 'a')
+            # the file lock keeps lines whole if another process is appending to the same journal
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._file.write(line)
+                self._file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self.entries += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsyncEvery or time.monotonic() - self._lastSync >= self.fsyncInterval:
+                self._sync()
+
+    def close(self) -> None:
+        '''
+        close syncs any remaining lines to disk and closes the journal
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def compact(self, outputFile: str) -> dict:
+        '''
+        compact closes the journal and writes the latest stack id of every region to outputFile as a
+        single JSON object, replacing the file atomically
+
+        Args:
+            outputFile (str): The path of the {region: StackId} JSON file to write
+
+        Returns:
+            dict: The {region: StackId} map that was written
+        '''
+        self.close()
+        with open(self.journalFile, 'r') as journal:
+            stack_ids = loadStackIds(journal)
+        tmp_file = f'{outputFile}.tmp'
+        with open(tmp_file, 'w') as opFile:
+            json.dump(stack_ids, opFile, indent=4)
+            opFile.flush()
+            os.fsync(opFile.fileno())
+        os.replace(tmp_file, outputFile)
+        return stack_ids
+
+    def _sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._lastSync = time.monotonic()
+
+
+def loadStackIds(stackOutput: IO[str]) -> dict:
+    '''
+    loadStackIds reads the stack ids of each region from either a compacted {region: StackId} JSON file
+    or a stack output journal, where the last line for a region wins
+
+    Args:
+        stackOutput (IO[str]): The open stack output file
+
+    Returns:
+        dict: The {region: StackId} map
+    '''
+    content = stackOutput.read()
+    stripped = content.lstrip()
+    if not stripped:
+        return {}
+    try:
+        stack_ids = json.loads(stripped)
+        if isinstance(stack_ids, dict) and 'StackId' not in stack_ids:
+            return stack_ids
+    except json.JSONDecodeError:
+        pass
+    stack_ids = {}
+    for line in stripped.splitlines():
+        entry: Optional[dict] = json.loads(line) if line.strip() else None
+        if entry:
+            stack_ids[entry['region']] = entry['StackId']
+    return stack_ids
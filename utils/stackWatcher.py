@@ -0,0 +1,297 @@
+import concurrent.futures
+import datetime
+import heapq
+import itertools
+import random
+import threading
+from typing import Callable, Generator, Optional, Tuple
+
+import botocore.exceptions
+
+from utils.awsErrors import isThrottlingError
+
+
+def isTerminalStatus(stackStatus: str) -> bool:
+    '''
+    isTerminalStatus checks if a stack status is one that the stack will not leave on its own
+
+    Args:
+        stackStatus (str): A CloudFormation stack status, i.e. CREATE_COMPLETE
+
+    Returns:
+        bool: True if the stack is no longer being worked on
+    '''
+    return not stackStatus.endswith('_IN_PROGRESS')
+
+
+class StackPollState():
+    """
+    Summary: The polling state of a single stack being watched, kept between polls
+    """
+    def __init__(self, stackId: str, region: str, since: Optional[datetime.datetime], timeout: float, minDelay: float):
+        self.stackId = stackId
+        self.region = region
+        self.since = since
+        self.deadline = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=timeout)
+        self.delay = minDelay
+        self.lastEventId = None
+        self.idlePolls = 0
+        self.apiCalls = 0
+
+
+class WatchedStack(StackPollState):
+    """
+    Summary: A stack watched by StackWatcher, with the client it is polled with and the future its final
+    description is set on
+    """
+    def __init__(self, client, stackId: str, region: str, since: Optional[datetime.datetime], timeout: float, minDelay: float):
+        super().__init__(stackId, region, since, timeout, minDelay)
+        self.client = client
+        self.future = concurrent.futures.Future()
+
+
+def pollStackStep(stack: StackPollState,
+                  onEvent: Optional[Callable[[str, dict], None]] = None,
+                  minDelay: float = 2.0,
+                  maxDelay: float = 30.0,
+                  backoff: float = 1.5,
+                  confirmEvery: int = 4) -> Generator[Tuple[str, dict], dict, Optional[dict]]:
+    '''
+    pollStackStep is one poll of a stack: only the events newer than the last one seen are read, the delay
+    backs off while nothing is happening and DescribeStacks confirms the final status. It makes no api calls
+    itself, it yields each call as (operationName, kwargs) and is sent the response (or thrown the error), so
+    the same step is driven by StackWatcher's threads and by the asyncio engine
+
+    Args:
+        stack (StackPollState): The polling state of the stack, updated in place
+        onEvent (Callable): Called as onEvent(region, event) for each new stack event, oldest first
+
+    Raises:
+        TimeoutError: When the stack is still in progress after its timeout
+
+    Returns:
+        dict: The final stack description once the stack finished, otherwise None. stack.delay is the
+              number of seconds to wait before the next poll
+    '''
+    try:
+        new_events = yield from _readNewEvents(stack)
+        stack_finished = any(
+            event['ResourceType'] == 'AWS::CloudFormation::Stack' and isTerminalStatus(event['ResourceStatus'])
+            for event in new_events
+        )
+        if new_events:
+            stack.delay = minDelay
+            stack.idlePolls = 0
+        else:
+            stack.delay = min(stack.delay * backoff, maxDelay)
+            stack.idlePolls += 1
+        if onEvent is not None:
+            for event in new_events:
+                onEvent(stack.region, event)
+        # the stack's own events tell us when it is finished, describe_stacks confirms the final status.
+        # It is also checked every few idle polls in case the finishing event was missed
+        if stack_finished or (stack.idlePolls and stack.idlePolls % confirmEvery == 0):
+            description = yield from _describeStack(stack)
+            if isTerminalStatus(description['StackStatus']):
+                return description
+    except botocore.exceptions.ClientError as err:
+        if not isThrottlingError(err):
+            raise
+        # jittered so stacks throttled together do not all poll again together
+        stack.delay = min(max(stack.delay, minDelay) * 2, maxDelay) * random.uniform(0.5, 1.0)
+    if datetime.datetime.now(datetime.timezone.utc) > stack.deadline:
+        raise TimeoutError(f'Timed out waiting for stack {stack.stackId} in region {stack.region}')
+    return None
+
+
+def _readNewEvents(stack: StackPollState):
+    new_events = []
+    request = {'StackName': stack.stackId}
+    newest_event_id = None
+    caught_up = False
+    while not caught_up:
+        stack.apiCalls += 1
+        response = yield 'describe_stack_events', dict(request)
+        for event in response.get('StackEvents', []):
+            if newest_event_id is None:
+                newest_event_id = event['EventId']
+            if event['EventId'] == stack.lastEventId:
+                caught_up = True
+                break
+            if stack.lastEventId is None and stack.since is not None and event['Timestamp'] < stack.since:
+                caught_up = True
+                break
+            new_events.append(event)
+        if 'NextToken' not in response:
+            break
+        request['NextToken'] = response['NextToken']
+    if newest_event_id is not None:
+        stack.lastEventId = newest_event_id
+    # events are returned newest first, they are reported oldest first
+    new_events.reverse()
+    return new_events
+
+
+def _describeStack(stack: StackPollState):
+    stack.apiCalls += 1
+    try:
+        return (yield 'describe_stacks', {'StackName': stack.stackId})['Stacks'][0]
+    except botocore.exceptions.ClientError as err:
+        # a stack that was deleted by name can no longer be described
+        if 'does not exist' in err.response['Error']['Message']:
+            return {'StackId': stack.stackId, 'StackStatus': 'DELETE_COMPLETE'}
+        raise
+
+
+def runPollStep(step: Generator, call: Callable):
+    '''
+    runPollStep drives a pollStackStep with blocking api calls
+
+    Args:
+        step (Generator): The pollStackStep to run
+        call (Callable): Makes an api call, called as call(operationName, **kwargs)
+
+    Returns:
+        dict: The value returned by the step
+    '''
+    try:
+        request = next(step)
+        while True:
+            operation_name, kwargs = request
+            try:
+                response = call(operation_name, **kwargs)
+            except Exception as err:
+                request = step.throw(err)
+            else:
+                request = step.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+class StackWatcher():
+    """
+    Summary: Watches many stacks, in any number of regions, from one shared poll loop. Each stack is
+    polled with DescribeStackEvents, only reading the events newer than the last one seen, and the
+    delay between polls starts small and backs off while nothing is happening. DescribeStacks is only
+    called to confirm the final status once the stack reports that it has finished
+    """
+    def __init__(self,
+                 onEvent: Optional[Callable[[str, dict], None]] = None,
+                 minDelay: float = 2.0,
+                 maxDelay: float = 30.0,
+                 backoff: float = 1.5,
+                 confirmEvery: int = 4,
+                 pollWorkers: int = 8):
+        self.onEvent = onEvent
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.backoff = backoff
+        self.confirmEvery = confirmEvery
+        self.pollWorkers = pollWorkers
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        # stacks are polled from several threads, events are reported one stack at a time so output does not interleave
+        self._eventLock = threading.Lock()
+        self._thread = None
+        self._executor = None
+        self._stopped = False
+
+    def watch(self, client, stackId: str, region: str, since: Optional[datetime.datetime] = None, timeout: float = 3600) -> concurrent.futures.Future:
+        '''
+        watch starts tracking a stack until it reaches a terminal status
+
+        Args:
+            client (botocore.client.BaseClient): The cloudformation client for the stack's region
+            stackId (str): The AWS unique stack ID (the arn id)
+            region (str): AWS region that the stack is in
+            since (datetime): Events older than this are from previous stack operations and are not reported
+            timeout (float): The number of seconds to wait before giving up on the stack
+
+        Returns:
+            concurrent.futures.Future: Resolves to the final stack description (as returned by DescribeStacks)
+        '''
+        stack = WatchedStack(client, stackId, region, since, timeout, self.minDelay)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError('StackWatcher has been stopped')
+            if self._thread is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.pollWorkers)
+                self._thread = threading.Thread(target=self._pollLoop, name='StackWatcher', daemon=True)
+                self._thread.start()
+            self._scheduleStack(stack, 0)
+            self._condition.notify()
+        return stack.future
+
+    def waitForStack(self, client, stackId: str, region: str, since: Optional[datetime.datetime] = None, timeout: float = 3600) -> dict:
+        '''
+        waitForStack is the blocking form of watch, returning the final stack description
+        '''
+        return self.watch(client, stackId, region, since, timeout).result()
+
+    def stop(self) -> None:
+        '''
+        stop ends the poll loop. Stacks still being watched have their futures cancelled
+        '''
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown(wait=True)
+        for _, _, stack in self._schedule:
+            stack.future.cancel()
+        self._schedule.clear()
+
+    def _scheduleStack(self, stack: WatchedStack, delay: float) -> None:
+        due = datetime.datetime.now(datetime.timezone.utc).timestamp() + delay
+        heapq.heappush(self._schedule, (due, next(self._sequence), stack))
+
+    def _pollLoop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+                    if self._schedule and self._schedule[0][0] <= now:
+                        break
+                    self._condition.wait(timeout=(self._schedule[0][0] - now) if self._schedule else None)
+                if self._stopped:
+                    return
+                due_stacks = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    due_stacks.append(heapq.heappop(self._schedule)[2])
+            # all the stacks that are due are polled together, then rescheduled with their own delay
+            finished = list(self._executor.map(self._pollStack, due_stacks))
+            with self._condition:
+                for stack, done in zip(due_stacks, finished):
+                    if not done:
+                        self._scheduleStack(stack, stack.delay)
+
+    def _pollStack(self, stack: WatchedStack) -> bool:
+        new_events = []
+        step = pollStackStep(
+            stack,
+            onEvent=lambda region, event: new_events.append(event),
+            minDelay=self.minDelay,
+            maxDelay=self.maxDelay,
+            backoff=self.backoff,
+            confirmEvery=self.confirmEvery
+        )
+        try:
+            description = runPollStep(step, lambda operationName, **kwargs: getattr(stack.client, operationName)(**kwargs))
+        except Exception as err:
+            description, error = None, err
+        else:
+            error = None
+        # reported once the poll is done, so the events of a stack are not interleaved with another's
+        if self.onEvent is not None and new_events:
+            with self._eventLock:
+                for event in new_events:
+                    self.onEvent(stack.region, event)
+        if error is not None:
+            stack.future.set_exception(error)
+            return True
+        if description is None:
+            return False
+        stack.future.set_result(description)
+        return True
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from utils.templateCache import getCacheDir
+
+
+def statusCacheFile(*keyParts: str) -> str:
+    key = hashlib.sha256('\n'.join(f'{part}' for part in keyParts).encode('utf-8')).hexdigest()
+    return os.path.join(getCacheDir('status'), f'{key}.json')
+
+
+def readStatusCache(ttlSeconds: float, *keyParts: str) -> Optional[dict]:
+    '''
+    readStatusCache returns a cached status if it was written less than ttlSeconds ago
+
+    Args:
+        ttlSeconds (float): How long, in seconds, a cached status is used for. 0 never uses the cache
+        keyParts (str): The values that identify the status, i.e. the profile, region and stack name
+
+    Returns:
+        Optional[dict]: The cached status, or None when there is no fresh one
+    '''
+    if ttlSeconds <= 0:
+        return None
+    cache_file = statusCacheFile(*keyParts)
+    try:
+        if time.time() - os.path.getmtime(cache_file) > ttlSeconds:
+            return None
+        with open(cache_file, 'r') as cached:
+            return json.load(cached)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def writeStatusCache(status: dict, *keyParts: str) -> None:
+    '''
+    writeStatusCache caches a status, see readStatusCache
+
+    Args:
+        status (dict): The json serialisable status to cache
+        keyParts (str): The values that identify the status, i.e. the profile, region and stack name
+    '''
+    cache_file = statusCacheFile(*keyParts)
+    # written to a temporary file first so a concurrent run never reads half a status
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as cached:
+        json.dump(status, cached)
+    os.replace(tmp_file, cache_file)
+
+
+def deleteStatusCache(*keyParts: str) -> None:
+    '''
+    deleteStatusCache removes a cached status, i.e. once the stacks it describes have been changed
+
+    Args:
+        keyParts (str): The values that identify the status, i.e. the profile, region and stack name
+    '''
+    try:
+        os.remove(statusCacheFile(*keyParts))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,86 @@
+import hashlib
+import os
+from typing import Callable, Optional
+
+import botocore.exceptions
+
+
+# CloudFormation rejects an inline TemplateBody larger than this, bigger templates must come from S3
+TEMPLATE_BODY_MAX_BYTES = 51200
+# bump when the way templates are rendered changes, so older cache entries are ignored
+CACHE_VERSION = 'v1'
+
+
+def getCacheDir(cacheName: str = 'templates') -> str:
+    '''
+    getCacheDir returns the directory a cache is kept in, creating it if needed
+
+    Args:
+        cacheName (str): The cache's sub directory, i.e. templates
+
+    Returns:
+        str: ~/.cache/stelligent-u/<cacheName>, or the same under $XDG_CACHE_HOME when it is set
+    '''
+    cache_root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    cache_dir = os.path.join(cache_root, 'stelligent-u', cacheName)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def templateHash(templateText: str) -> str:
+    return hashlib.sha256(f'{CACHE_VERSION}\n{templateText}'.encode('utf-8')).hexdigest()
+
+
+def getTemplateBody(templateText: str, render: Callable[[str], str]) -> str:
+    '''
+    getTemplateBody returns the rendered body of a template. Rendered bodies are cached by the hash of
+    the template's content, so an unchanged template is only rendered once
+
+    Args:
+        templateText (str): The raw content of the template file
+        render (Callable[[str], str]): Turns the raw template into the body sent to CloudFormation
+
+    Returns:
+        str: The rendered template body
+    '''
+    cache_file = os.path.join(getCacheDir(), f'{templateHash(templateText)}.yaml')
+    try:
+        with open(cache_file, 'r') as cached:
+            return cached.read()
+    except FileNotFoundError:
+        pass
+    template_body = render(templateText)
+    # written to a temporary file first so a concurrent run never reads half a template
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as cached:
+        cached.write(template_body)
+    os.replace(tmp_file, cache_file)
+    return template_body
+
+
+def getTemplateArgs(templateBody: str, s3Client=None, templateBucket: Optional[str] = None, keyPrefix: str = 'templates') -> dict:
+    '''
+    getTemplateArgs returns the create_stack/update_stack template arguments for a template body. Small
+    templates are sent inline, larger ones are uploaded to S3 once and referenced by URL in every region
+
+    Args:
+        templateBody (str): The rendered template body
+        s3Client (botocore.client.BaseClient): The s3 client used to upload large templates
+        templateBucket (str): The S3 bucket large templates are uploaded to
+        keyPrefix (str): The key prefix large templates are uploaded under
+
+    Returns:
+        dict: Either {'TemplateBody': ...} or {'TemplateURL': ...}
+    '''
+    if len(templateBody.encode('utf-8')) <= TEMPLATE_BODY_MAX_BYTES:
+        return {'TemplateBody': templateBody}
+    if s3Client is None or not templateBucket:
+        raise ValueError(f'The template is larger than {TEMPLATE_BODY_MAX_BYTES} bytes and has to be uploaded to S3, a template bucket is required')
+    template_key = f'{keyPrefix}/{templateHash(templateBody)}.yaml'
+    try:
+        s3Client.head_object(Bucket=templateBucket, Key=template_key)
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        s3Client.put_object(Bucket=templateBucket, Key=template_key, Body=templateBody.encode('utf-8'))
+    return {'TemplateURL': f'https://{templateBucket}.s3.amazonaws.com/{template_key}'}
@@ -0,0 +1,413 @@
+import json
+import os
+import re
+from typing import Any, Optional
+
+from utils.templateCache import getCacheDir, templateHash
+
+
+# bump when the checks change, so verdicts cached by an older version are not used
+PREFLIGHT_VERSION = 2
+# an account id is always 12 digits, so a placeholder gives bucket names their deployed length without
+# an api call to look the real one up
+PLACEHOLDER_ACCOUNT_ID = '123456789012'
+BUCKET_NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$')
+SUB_VARIABLE = re.compile(r'\$\{([^}!]+)\}')
+
+
+class Unresolved():
+    """
+    Summary: A value that is only known once the stack is deployed, i.e. !GetAtt, !ImportValue or an
+    SSM parameter. Checks that need the value skip it
+    """
+    def __init__(self, source: str):
+        self.source = source
+
+    def __repr__(self) -> str:
+        return f'<{self.source}>'
+
+
+class TemplateError(ValueError):
+    """
+    Summary: A mistake in the template, i.e. a !Ref to a parameter or resource that does not exist
+    """
+
+
+def loadTemplate(templateBody: str) -> dict:
+    '''
+    loadTemplate parses a template body, turning the short form intrinsic functions (!Ref, !Join ...)
+    into the long form ({Ref: ...}, {Fn::Join: ...}) used by json templates
+
+    Args:
+        templateBody (str): The rendered template body, yaml or json
+
+    Raises:
+        TemplateError: When the body is not a template
+
+    Returns:
+        dict: The parsed template
+    '''
+    import yaml
+
+    class TemplateLoader(yaml.SafeLoader):
+        pass
+
+    def constructIntrinsic(loader, suffix: str, node) -> dict:
+        if isinstance(node, yaml.ScalarNode):
+            value = loader.construct_scalar(node)
+        elif isinstance(node, yaml.SequenceNode):
+            value = loader.construct_sequence(node, deep=True)
+        else:
+            value = loader.construct_mapping(node, deep=True)
+        if suffix in ('Ref', 'Condition'):
+            return {suffix: value}
+        if suffix == 'GetAtt' and isinstance(value, str):
+            value = value.split('.', 1)
+        return {f'Fn::{suffix}': value}
+
+    TemplateLoader.add_multi_constructor('!', constructIntrinsic)
+    try:
+        template = yaml.load(templateBody, Loader=TemplateLoader)
+    except yaml.YAMLError as err:
+        raise TemplateError(f'the template is not valid yaml or json: {err}')
+    if not isinstance(template, dict):
+        raise TemplateError('the template is not a mapping')
+    return template
+
+
+class ConditionValues(dict):
+    """
+    Summary: The template's conditions, each evaluated the first time it is looked up, so a condition can
+    refer to one declared after it
+    """
+    def __init__(self, declared: dict, names: dict, resources: dict):
+        super().__init__()
+        self.declared = declared
+        self.names = names
+        self.resources = resources
+        self._resolving = []
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.declared
+
+    def __missing__(self, name: str) -> Any:
+        if name in self._resolving:
+            raise TemplateError(f'condition {name} refers to itself through {" -> ".join(self._resolving + [name])}')
+        self._resolving.append(name)
+        try:
+            self[name] = evaluateCondition(self.declared[name], self.names, self, self.resources)
+        finally:
+            self._resolving.pop()
+        return self[name]
+
+
+def pseudoParameters(region: str, accountId: str) -> dict:
+    partition = 'aws-cn' if region.startswith('cn-') else 'aws-us-gov' if region.startswith('us-gov-') else 'aws'
+    return {
+        'AWS::Region': region,
+        'AWS::AccountId': accountId,
+        'AWS::Partition': partition,
+        'AWS::URLSuffix': 'amazonaws.com.cn' if partition == 'aws-cn' else 'amazonaws.com',
+        'AWS::StackName': Unresolved('AWS::StackName'),
+        'AWS::StackId': Unresolved('AWS::StackId'),
+        'AWS::NotificationARNs': Unresolved('AWS::NotificationARNs'),
+        'AWS::NoValue': None,
+    }
+
+
+def isSsmParameter(declaration: dict) -> bool:
+    return f'{declaration.get("Type", "String")}'.startswith('AWS::SSM::Parameter::Value')
+
+
+def templateParameterValues(template: dict, stackParameters: list) -> dict:
+    # the given stack parameters, and the defaults of the parameters that are not given
+    parameter_values = {key: declaration.get('Default') for key, declaration in (template.get('Parameters') or {}).items()}
+    parameter_values.update({param['ParameterKey']: param.get('ParameterValue') for param in stackParameters})
+    return parameter_values
+
+
+def templateNames(template: dict, parameterValues: dict, region: str, accountId: str = PLACEHOLDER_ACCOUNT_ID, stackName: Optional[str] = None) -> dict:
+    '''
+    templateNames returns what each !Ref to a parameter or pseudo parameter resolves to in a region
+
+    Args:
+        template (dict): The parsed template
+        parameterValues (dict): The value of each parameter, defaults included
+        region (str): AWS region to resolve the template for
+        accountId (str): The account id AWS::AccountId resolves to
+        stackName (str): The stack name AWS::StackName resolves to, or None when it is not known yet
+
+    Returns:
+        dict: {name: value}, with Unresolved for the values only known once deployed
+    '''
+    names = pseudoParameters(region, accountId)
+    if stackName is not None:
+        names['AWS::StackName'] = stackName
+    for key, declaration in (template.get('Parameters') or {}).items():
+        # the value of an ssm parameter is read from parameter store when the stack is deployed
+        names[key] = Unresolved(f'SSM {key}') if isSsmParameter(declaration) else parameterValues.get(key)
+    return names
+
+
+def resolveValue(value: Any, names: dict, conditions: dict, resources: dict) -> Any:
+    '''
+    resolveValue evaluates the intrinsic functions in a template value for one region
+
+    Args:
+        value (Any): The template value
+        names (dict): The parameter and pseudo parameter values that !Ref resolves to
+        conditions (dict): The evaluated conditions, {name: bool}
+        resources (dict): The template's resources, a !Ref to one is only known once deployed
+
+    Raises:
+        TemplateError: When a function refers to something that is not in the template
+
+    Returns:
+        Any: The value, with Unresolved for what is only known once the stack is deployed
+    '''
+    if isinstance(value, list):
+        return [resolveValue(item, names, conditions, resources) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) != 1:
+        return {key: resolveValue(item, names, conditions, resources) for key, item in value.items()}
+    function, argument = next(iter(value.items()))
+    if function == 'Ref':
+        if argument in names:
+            return names[argument]
+        if argument in resources:
+            return Unresolved(f'Ref {argument}')
+        raise TemplateError(f'!Ref {argument} is not a parameter, pseudo parameter or resource')
+    if function == 'Fn::GetAtt':
+        # the long form also takes the Resource.Attribute string of the short form
+        resource = argument[0] if isinstance(argument, list) and argument else f'{argument}'.split('.', 1)[0]
+        if resource not in resources:
+            raise TemplateError(f'!GetAtt {resource} is not a resource')
+        return Unresolved(f'GetAtt {".".join(argument) if isinstance(argument, list) else argument}')
+    if function == 'Fn::ImportValue':
+        resolveValue(argument, names, conditions, resources)
+        return Unresolved('ImportValue')
+    if function == 'Fn::Join':
+        if not isinstance(argument, list) or len(argument) != 2:
+            raise TemplateError(f'!Join takes a delimiter and a list of values, not {argument}')
+        delimiter = resolveValue(argument[0], names, conditions, resources)
+        parts = resolveValue(argument[1], names, conditions, resources)
+        if isinstance(parts, Unresolved) or not isinstance(parts, list):
+            return Unresolved('Join')
+        if isinstance(delimiter, Unresolved) or any(isinstance(part, (Unresolved, list, dict)) for part in parts):
+            return Unresolved('Join')
+        return delimiter.join(f'{part}' for part in parts if part is not None)
+    if function == 'Fn::Sub':
+        text, variables = (argument[0], argument[1]) if isinstance(argument, list) else (argument, {})
+        values = dict(names, **{key: resolveValue(item, names, conditions, resources) for key, item in variables.items()})
+        unresolved = False
+        for name in SUB_VARIABLE.findall(text):
+            name = name.split('.', 1)[0] if '.' in name and name.split('.', 1)[0] in resources else name
+            if name in values:
+                unresolved = unresolved or isinstance(values[name], Unresolved)
+            elif name in resources:
+                unresolved = True
+            else:
+                raise TemplateError(f'!Sub variable ${{{name}}} is not a parameter, pseudo parameter or resource')
+        if unresolved:
+            return Unresolved('Sub')
+        return SUB_VARIABLE.sub(lambda match: f'{values[match.group(1)]}', text)
+    if function == 'Fn::If':
+        if not isinstance(argument, list) or len(argument) != 3:
+            raise TemplateError(f'!If takes a condition and two values, not {argument}')
+        if argument[0] not in conditions:
+            raise TemplateError(f'!If condition {argument[0]} is not in Conditions')
+        if isinstance(conditions[argument[0]], Unresolved):
+            # the condition could go either way, so both values are checked
+            values = [resolveValue(item, names, conditions, resources) for item in argument[1:]]
+            return values[0] if f'{values[0]}' == f'{values[1]}' else Unresolved('If')
+        return resolveValue(argument[1] if conditions[argument[0]] else argument[2], names, conditions, resources)
+    if function == 'Fn::Select':
+        index = resolveValue(argument[0], names, conditions, resources)
+        items = resolveValue(argument[1], names, conditions, resources)
+        if isinstance(items, list) and not isinstance(index, Unresolved):
+            if not 0 <= int(index) < len(items):
+                raise TemplateError(f'!Select index {index} is out of range of {len(items)} values')
+            return items[int(index)]
+        return Unresolved('Select')
+    if function in ('Fn::Equals', 'Fn::And', 'Fn::Or', 'Fn::Not', 'Condition'):
+        return evaluateCondition(value, names, conditions, resources)
+    if function.startswith('Fn::'):
+        resolveValue(argument, names, conditions, resources)
+        return Unresolved(function)
+    return {function: resolveValue(argument, names, conditions, resources)}
+
+
+def evaluateCondition(condition: Any, names: dict, conditions: dict, resources: dict) -> Any:
+    function, argument = next(iter(condition.items())) if isinstance(condition, dict) and len(condition) == 1 else (None, None)
+    if function == 'Condition':
+        if argument not in conditions:
+            raise TemplateError(f'condition {argument} is not in Conditions')
+        return conditions[argument]
+    if function == 'Fn::Equals':
+        left, right = (resolveValue(item, names, conditions, resources) for item in argument)
+        if isinstance(left, Unresolved) or isinstance(right, Unresolved):
+            return Unresolved('Equals')
+        return f'{left}' == f'{right}'
+    if function in ('Fn::And', 'Fn::Or', 'Fn::Not'):
+        values = [evaluateCondition(item, names, conditions, resources) for item in argument]
+        if any(isinstance(item, Unresolved) for item in values):
+            return Unresolved(function)
+        return all(values) if function == 'Fn::And' else any(values) if function == 'Fn::Or' else not values[0]
+    raise TemplateError(f'{condition} is not a condition function')
+
+
+def checkParameters(template: dict, stackParameters: list) -> list:
+    '''
+    checkParameters compares the stack parameters (i.e. from params.json) with the template's
+    Parameters section
+
+    Args:
+        template (dict): The parsed template
+        stackParameters (list): The stack parameters, as ParameterKey/ParameterValue pairs
+
+    Returns:
+        list: A description of each problem found, empty when the parameters are valid
+    '''
+    declared = template.get('Parameters') or {}
+    given = {param.get('ParameterKey'): param.get('ParameterValue') for param in stackParameters}
+    problems = [f'parameter {key} is not declared in the template' for key in given if key not in declared]
+    for key, declaration in declared.items():
+        value = given.get(key, declaration.get('Default'))
+        if value is None:
+            problems.append(f'parameter {key} has no default and is not in the parameters file')
+            continue
+        value = f'{value}'
+        if isSsmParameter(declaration):
+            # the value is the name of the ssm parameter, not the value the stack gets
+            continue
+        if 'AllowedValues' in declaration and value not in [f'{allowed}' for allowed in declaration['AllowedValues']]:
+            problems.append(f'parameter {key} is {value}, which is not one of {", ".join(f"{allowed}" for allowed in declaration["AllowedValues"])}')
+        if 'AllowedPattern' in declaration and not re.fullmatch(declaration['AllowedPattern'], value):
+            problems.append(f'parameter {key} is {value}, which does not match {declaration["AllowedPattern"]}')
+        if 'MinLength' in declaration and len(value) < int(declaration['MinLength']):
+            problems.append(f'parameter {key} is shorter than {declaration["MinLength"]} characters')
+        if 'MaxLength' in declaration and len(value) > int(declaration['MaxLength']):
+            problems.append(f'parameter {key} is longer than {declaration["MaxLength"]} characters')
+        if declaration.get('Type') == 'Number':
+            try:
+                number = float(value)
+            except ValueError:
+                problems.append(f'parameter {key} is {value}, which is not a number')
+                continue
+            if 'MinValue' in declaration and number < float(declaration['MinValue']):
+                problems.append(f'parameter {key} is less than {declaration["MinValue"]}')
+            if 'MaxValue' in declaration and number > float(declaration['MaxValue']):
+                problems.append(f'parameter {key} is more than {declaration["MaxValue"]}')
+    return problems
+
+
+def bucketNameProblem(bucketName: str) -> Optional[str]:
+    if not 3 <= len(bucketName) <= 63:
+        return f'bucket name {bucketName} is {len(bucketName)} characters, it must be 3 to 63'
+    if not BUCKET_NAME_PATTERN.match(bucketName) or '..' in bucketName:
+        return f'bucket name {bucketName} must be lowercase letters, numbers, dots and hyphens, starting and ending with a letter or number'
+    return None
+
+
+def checkRegion(template: dict, parameterValues: dict, region: str, accountId: str = PLACEHOLDER_ACCOUNT_ID) -> list:
+    '''
+    checkRegion resolves the template for one region and checks what can be known before it is
+    deployed, i.e. that every !Ref, !GetAtt and condition exists and that bucket names are valid
+
+    Args:
+        template (dict): The parsed template
+        parameterValues (dict): The value of each parameter, defaults included
+        region (str): AWS region to resolve the template for
+        accountId (str): The account id AWS::AccountId resolves to
+
+    Returns:
+        list: A description of each problem found, empty when the template is valid in the region
+    '''
+    resources = template.get('Resources') or {}
+    names = templateNames(template, parameterValues, region, accountId)
+    problems = []
+    conditions = ConditionValues(template.get('Conditions') or {}, names, resources)
+    for name in conditions.declared:
+        try:
+            conditions[name]
+        except TemplateError as err:
+            problems.append(f'condition {name}: {err}')
+            return problems
+
+    for name, resource in resources.items():
+        if not isinstance(resource, dict) or 'Type' not in resource:
+            problems.append(f'resource {name} has no Type')
+            continue
+        if resource.get('Condition') is not None and resource['Condition'] not in conditions:
+            problems.append(f'resource {name}: condition {resource["Condition"]} is not in Conditions')
+        depends_on = resource.get('DependsOn', [])
+        for dependency in [depends_on] if isinstance(depends_on, str) else depends_on:
+            if dependency not in resources:
+                problems.append(f'resource {name}: DependsOn {dependency} is not a resource')
+        try:
+            properties = resolveValue(resource.get('Properties') or {}, names, conditions, resources)
+        except TemplateError as err:
+            problems.append(f'resource {name}: {err}')
+            continue
+        if resource['Type'] == 'AWS::S3::Bucket' and isinstance(properties.get('BucketName'), str):
+            problem = bucketNameProblem(properties['BucketName'])
+            if problem:
+                problems.append(f'resource {name}: {problem}')
+    for name, output in (template.get('Outputs') or {}).items():
+        try:
+            resolveValue(output, names, conditions, resources)
+        except TemplateError as err:
+            problems.append(f'output {name}: {err}')
+    return problems
+
+
+def preflightCacheFile(templateBody: str, stackParameters: list, regions: list, accountId: str) -> str:
+    key = templateHash(json.dumps([PREFLIGHT_VERSION, templateBody, stackParameters, sorted(regions), accountId], sort_keys=True))
+    return os.path.join(getCacheDir('preflight'), f'{key}.json')
+
+
+def preflightTemplate(templateBody: str, stackParameters: list, regions: list, accountId: str = PLACEHOLDER_ACCOUNT_ID) -> list:
+    '''
+    preflightTemplate validates a template and its parameters locally, without calling aws, so a bad
+    template fails before any stack is created. The template is resolved for every region in turn,
+    which takes milliseconds. Verdicts are cached by the hash of the template, parameters and regions,
+    so an unchanged template is only checked once
+
+    Args:
+        templateBody (str): The rendered template body
+        stackParameters (list): The stack parameters, as ParameterKey/ParameterValue pairs
+        regions (list): The AWS regions the template will be deployed to
+        accountId (str): The account id AWS::AccountId resolves to
+
+    Returns:
+        list: A description of each problem found, prefixed with the region when it is region specific.
+        Empty when the template can be deployed
+    '''
+    cache_file = preflightCacheFile(templateBody, stackParameters, regions, accountId)
+    try:
+        with open(cache_file, 'r') as cached:
+            return json.load(cached)['problems']
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    try:
+        template = loadTemplate(templateBody)
+    except TemplateError as err:
+        return [f'{err}']
+    problems = checkParameters(template, stackParameters)
+    if not template.get('Resources'):
+        problems.append('the template has no Resources')
+    if not problems:
+        parameter_values = templateParameterValues(template, stackParameters)
+        # the checks are pure python and take well under a millisecond a region, so they are run in
+        # this process: a process pool would re-run the calling script in each worker under spawn
+        for region in regions:
+            problems += [f'{region}: {problem}' for problem in checkRegion(template, parameter_values, region, accountId)]
+
+    # written to a temporary file first so a concurrent run never reads half a verdict
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as cached:
+        json.dump({'problems': problems}, cached)
+    os.replace(tmp_file, cache_file)
+    return problems